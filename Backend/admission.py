@@ -0,0 +1,43 @@
+import threading
+
+
+class AdmissionControl:
+    """
+    Sheds load: at most `max_in_flight` requests are admitted at once (running
+    or waiting for a worker thread). Requests beyond that are rejected at once,
+    so the client or load balancer can retry elsewhere instead of queueing
+    behind slow queries.
+
+    Args:
+        max_in_flight (int): Queue depth above which requests are rejected, 0 for no limit.
+    """
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def try_acquire(self):
+        """ Admits a request, False if the queue is full. Call release() when it is done. """
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self.in_flight,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+            }
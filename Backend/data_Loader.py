@@ -1,24 +1,56 @@
 import pickle
-import pandas as pd
 import os
-from inverted_index_gcp import InvertedIndex
+from inverted_index_gcp import InvertedIndex, TermDictionary
+from Backend.doc_store import DocAttributeStore, PAGERANK, PAGEVIEW, TEXT_LEN, TITLE_LEN, TEXT_NORM
+from Backend.ranking import doc_tfidf_norms
+
+# Local data layout (see SEARCH_ENGINE_PLAN.md, step 1)
+DATA_DIR = "data"
+POSTINGS_DIR = "data/postings_gcp"
+INDEX_NAME = "index"
+DOC_STORE_DIR = "data/doc_store"
+BODY_INDEX_DIR = "data/og_text_idx"  # unstemmed body index used by /search_body
+
+# Field indexes of the search engine: field name -> local directory
+FIELD_INDEX_DIRS = {
+    'text': "data/text_stemmed",
+    'title': "data/title_stemmed",
+    'anchor': "data/anchor_stemmed",
+    'og_text': BODY_INDEX_DIR,
+    'og_title': "data/og_title_idx",
+    'og_anchor': "data/og_anchor_idx",
+}
+
+N_DOCS = 6348910  # Wikipedia size (from hw3)
+
+# Per-document pickles produced on GCP, used to build the doc-attribute store
+PAGEVIEW_PATH = "data/pv/pageview.pkl"
+TEXT_DOC_LEN_PATH = "data/text_stemmed/text_doc_lengths.pickle"
+TITLE_DOC_LEN_PATH = "data/title_stemmed/title_doc_lengths.pickle"
+DOC_LENGTH_PATHS = {'text': TEXT_DOC_LEN_PATH, 'title': TITLE_DOC_LEN_PATH}
+TITLE_EVEN_PATH = "data/id_title/even_id_title_dict.pkl"
+TITLE_ODD_PATH = "data/id_title/uneven_id_title_dict.pkl"
 
 def load_index():
-    """Load the inverted index from local disk."""
+    """Load the inverted index from local disk (compact term dictionary if available)."""
     print("Loading inverted index...")
-    index = InvertedIndex.read_index("data/postings_gcp", "index")
+    if TermDictionary.exists(POSTINGS_DIR, INDEX_NAME):
+        index = InvertedIndex.read_compact(POSTINGS_DIR, INDEX_NAME)
+    else:
+        index = InvertedIndex.read_index(POSTINGS_DIR, INDEX_NAME)
     print(f"✓ Index loaded: {len(index.df)} terms")
     return index
 
 def load_pagerank():
     """Load PageRank scores from CSV files."""
     print("Loading PageRank...")
-    pr_files = [f"data/{f}" for f in os.listdir("data") if f.endswith('.csv.gz')]
+    pr_files = [f"{DATA_DIR}/{f}" for f in os.listdir(DATA_DIR) if f.endswith('.csv.gz')]
     
     if not pr_files:
         print("⚠ No PageRank files found")
         return {}
     
+    import pandas as pd  # only needed without the doc-attribute store
     dfs = []
     for file in pr_files:
         df = pd.read_csv(file, header=None, names=['doc_id', 'pagerank'])
@@ -28,6 +60,52 @@ def load_pagerank():
     pr_dict = dict(zip(pr_df['doc_id'].astype(int), pr_df['pagerank']))
     print(f"✓ PageRank loaded: {len(pr_dict)} documents")
     return pr_dict
+
+def load_doc_store():
+    """Open the memory-mapped doc-attribute store (None if it was not built)."""
+    if not DocAttributeStore.exists(DOC_STORE_DIR):
+        print("⚠ No doc-attribute store found")
+        return None
+    store = DocAttributeStore(DOC_STORE_DIR)
+    print(f"✓ Doc-attribute store opened: {len(store)} documents")
+    return store
+
+def _load_pickle(path):
+    if not os.path.exists(path):
+        print(f"⚠ {path} not found, skipping")
+        return {}
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+def load_doc_lengths(field):
+    """Load the doc_id -> length pickle of the 'text' or 'title' field (empty if not found)."""
+    return _load_pickle(DOC_LENGTH_PATHS[field])
+
+def build_doc_store():
+    """Build the doc-attribute store from the PageRank CSVs and the GCP pickles."""
+    print("Building doc-attribute store...")
+    titles = _load_pickle(TITLE_EVEN_PATH)
+    titles.update(_load_pickle(TITLE_ODD_PATH))
+    columns = {
+        PAGERANK: load_pagerank(),
+        PAGEVIEW: _load_pickle(PAGEVIEW_PATH),
+        TEXT_LEN: load_doc_lengths('text'),
+        TITLE_LEN: load_doc_lengths('title'),
+    }
+    store = DocAttributeStore.build(DOC_STORE_DIR, columns, titles)
+    print(f"✓ Doc-attribute store built: {len(store)} documents")
+    return store
+
+def build_doc_norms(index_dir=BODY_INDEX_DIR, name=INDEX_NAME):
+    """Add the body tf-idf norms used by /search_body to the doc-attribute store."""
+    print("Computing document tf-idf norms...")
+    index = InvertedIndex.read_index(index_dir, name)
+    doc_ids, norms = doc_tfidf_norms(index, N_DOCS, base_dir=index_dir)
+    index.close()
+    store = DocAttributeStore(DOC_STORE_DIR)
+    store.add_column(TEXT_NORM, doc_ids, norms)
+    print(f"✓ Norms stored: {store.stats[TEXT_NORM]['count']} documents")
+    return store
     
     # index = InvertedIndex.read_index("postings_gcp", "index", bucket_name=BUCKET_NAME)
     # print(f"✓ Index loaded: {len(index.df)} terms")
@@ -37,4 +115,4 @@ def load_pagerank():
 # def load_pagerank():
 #     """Load PageRank scores from CSV."""
 #     print("Loading PageRank...")
-    
\ No newline at end of file
+    
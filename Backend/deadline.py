@@ -0,0 +1,63 @@
+import time
+
+
+class Deadline:
+    """
+    Time budget of one request.
+
+    Scorers work term at a time and ask `stop()` before each term after the
+    first. Once the budget is spent they skip the remaining terms and return
+    the best results of the terms scored so far, and `partial` tells the caller
+    that the result is incomplete.
+
+    Args:
+        seconds (float, optional): The budget, None for no limit.
+        clock (callable): Monotonic time source.
+
+    Attributes:
+        partial (bool): True once a scorer stopped early because of this deadline.
+    """
+
+    def __init__(self, seconds=None, clock=time.monotonic):
+        self._clock = clock
+        self.expires_at = None if seconds is None else clock() + seconds
+        self.partial = False
+
+    def remaining(self):
+        """ Seconds left, None without a limit. """
+        return None if self.expires_at is None else max(0.0, self.expires_at - self._clock())
+
+    def expired(self):
+        return self.expires_at is not None and self._clock() >= self.expires_at
+
+    def stop(self):
+        """ True when the budget is spent; the result is then marked partial. """
+        if self.expired():
+            self.partial = True
+            return True
+        return False
+
+
+def rarest_first(tokens, df, deadline=None):
+    """
+    Yields the query tokens to score under a deadline.
+
+    Without a deadline every token is yielded in query order. With one, tokens
+    come from the rarest (lowest df, highest idf, shortest posting list) to the
+    most common, tokens not in `df` last, until the deadline runs out. The rarest
+    token is always scored.
+
+    Args:
+        tokens (list): Query tokens.
+        df (Mapping): Document frequency of every indexed token.
+        deadline (Deadline, optional): The request's deadline.
+    """
+    if deadline is None:
+        yield from tokens
+        return
+    # membership first: the compact term dictionary reads missing tokens as a df of 0
+    order = sorted(tokens, key=lambda token: (0, df[token]) if token in df else (1, 0))
+    for i, token in enumerate(order):
+        if i > 0 and deadline.stop():
+            return
+        yield token
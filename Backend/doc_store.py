@@ -0,0 +1,166 @@
+import os
+import pickle
+from pathlib import Path
+import numpy as np
+
+# Columns the search engine reads, all stored as float64 so NaN can mark a
+# document without a value (e.g. no PageRank, no body text).
+PAGERANK = 'pagerank'
+PAGEVIEW = 'pageview'
+TEXT_LEN = 'text_len'
+TITLE_LEN = 'title_len'
+TEXT_NORM = 'text_norm'  # L2 norm of the body tf-idf vector (see ranking.doc_tfidf_norms)
+
+
+def _load(path):
+    # empty arrays cannot be memory-mapped
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        return np.load(path)
+
+
+class DocAttributeStore:
+    """
+    Columnar, memory-mapped store of per-document attributes for ~6.3M docs.
+
+    Documents are kept in doc_id order; a doc_id is mapped to its row by binary
+    search over the sorted doc_ids array. Each attribute is a NumPy column with
+    one value per row, titles are an offsets array over a UTF-8 blob. All files
+    are opened with mmap_mode='r', so workers on the same host share the pages
+    instead of each holding its own dictionaries.
+
+    Files in the store directory:
+        doc_ids.npy                sorted int64 doc_ids
+        <column>.npy               float64 value per row, NaN when missing
+        title_offsets.npy          start of each title in the blob (+ a final end)
+        titles.npy                 UTF-8 bytes of all titles
+        meta.pkl                   column names and per-column max / sum / count
+    """
+
+    def __init__(self, path):
+        path = Path(path)
+        self.path = path
+        self.doc_ids = _load(path / 'doc_ids.npy')
+        with open(path / 'meta.pkl', 'rb') as f:
+            meta = pickle.load(f)
+        self.stats = meta['stats']
+        self.columns = {name: _load(path / f'{name}.npy') for name in meta['columns']}
+        self._title_offsets = _load(path / 'title_offsets.npy')
+        self._titles = _load(path / 'titles.npy')
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def rows(self, doc_ids):
+        """
+        Maps doc_ids to rows.
+
+        Args:
+            doc_ids (iterable): Document IDs.
+
+        Returns:
+            np.ndarray: Row of each doc_id, -1 for unknown documents.
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64).reshape(-1)
+        if len(self.doc_ids) == 0:
+            return np.full(len(doc_ids), -1)
+        rows = np.searchsorted(self.doc_ids, doc_ids)
+        rows = np.minimum(rows, len(self.doc_ids) - 1)
+        return np.where(self.doc_ids[rows] == doc_ids, rows, -1)
+
+    def values(self, column, doc_ids, default=np.nan):
+        """
+        Returns the `column` values of doc_ids as an array, `default` for missing values.
+        """
+        rows = self.rows(doc_ids)
+        values = np.full(len(rows), default, dtype=np.float64)
+        known = rows >= 0
+        values[known] = self.columns[column][rows[known]]
+        if not np.isnan(default):
+            values[np.isnan(values)] = default
+        return values
+
+    def get(self, column, doc_ids, default=0.0):
+        """ Returns the `column` values of doc_ids as a list of floats. """
+        return self.values(column, doc_ids, default).tolist()
+
+    def lookup(self, column):
+        """ Returns a doc_ids -> values function, NaN for missing values (see BM25Engine). """
+        return lambda doc_ids: self.values(column, doc_ids)
+
+    def titles(self, doc_ids):
+        """ Returns the titles of doc_ids, None for unknown documents. """
+        res = []
+        for row in self.rows(doc_ids).tolist():
+            start, end = self._title_offsets[row:row + 2].tolist() if row >= 0 else (0, 0)
+            res.append(bytes(self._titles[start:end]).decode('utf-8') if end > start else None)
+        return res
+
+    def add_column(self, name, doc_ids, values):
+        """
+        Adds (or replaces) a column computed after the store was built. Values of
+        documents that are not in the store are dropped.
+
+        Args:
+            name (str): Column name.
+            doc_ids (np.ndarray): Document IDs.
+            values (np.ndarray): Values, parallel to doc_ids.
+        """
+        rows = self.rows(doc_ids)
+        known = rows >= 0
+        column = np.full(len(self.doc_ids), np.nan)
+        column[rows[known]] = np.asarray(values, dtype=np.float64)[known]
+        np.save(self.path / f'{name}.npy', column)
+        filled = column[~np.isnan(column)]
+        self.stats[name] = {'max': float(filled.max()) if len(filled) else 0.0,
+                            'sum': float(filled.sum()),
+                            'count': int(len(filled))}
+        self.columns[name] = _load(self.path / f'{name}.npy')
+        with open(self.path / 'meta.pkl', 'wb') as f:
+            pickle.dump({'columns': list(self.columns), 'stats': self.stats}, f)
+
+    @staticmethod
+    def build(path, columns, titles=None):
+        """
+        Writes a store from per-document dictionaries.
+
+        Args:
+            path (str): Output directory.
+            columns (dict): Column name -> {doc_id: value} dictionary.
+            titles (dict, optional): doc_id -> title dictionary.
+
+        Returns:
+            DocAttributeStore: The store opened from `path`.
+        """
+        path = Path(path)
+        os.makedirs(path, exist_ok=True)
+        titles = titles or {}
+        all_ids = set(titles)
+        for values in columns.values():
+            all_ids.update(values)
+        doc_ids = np.array(sorted(all_ids), dtype=np.int64)
+        np.save(path / 'doc_ids.npy', doc_ids)
+
+        stats = {}
+        for name, values in columns.items():
+            column = np.array([values.get(doc_id, np.nan) for doc_id in doc_ids.tolist()], dtype=np.float64)
+            np.save(path / f'{name}.npy', column)
+            known = column[~np.isnan(column)]
+            stats[name] = {'max': float(known.max()) if len(known) else 0.0,
+                           'sum': float(known.sum()),
+                           'count': int(len(known))}
+
+        encoded = [(titles.get(doc_id) or '').encode('utf-8') for doc_id in doc_ids.tolist()]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        np.save(path / 'title_offsets.npy', offsets)
+        np.save(path / 'titles.npy', np.frombuffer(b''.join(encoded), dtype=np.uint8))
+
+        with open(path / 'meta.pkl', 'wb') as f:
+            pickle.dump({'columns': list(columns), 'stats': stats}, f)
+        return DocAttributeStore(path)
+
+    @staticmethod
+    def exists(path):
+        return (Path(path) / 'meta.pkl').exists()
@@ -0,0 +1,166 @@
+import threading
+from contextlib import contextmanager
+from inverted_index_gcp import InvertedIndex, TermDictionary
+
+
+def open_index(base_dir, name='index', bucket_name=None):
+    """ Opens an index, through the compact term dictionary when one was written. """
+    if bucket_name is None and TermDictionary.exists(base_dir, name):
+        return InvertedIndex.read_compact(base_dir, name)
+    return InvertedIndex.read_index(base_dir, name, bucket_name)
+
+
+class FieldIndex:
+    """
+    A named index together with where its posting lists live.
+
+    Args:
+        base_dir (str): Directory of the index pickle and the posting files.
+        name (str): Name of the index pickle.
+        bucket_name (str, optional): GCS bucket of the files, local disk when None.
+        opener (callable): (base_dir, name, bucket_name) -> index, open_index by default.
+    """
+
+    def __init__(self, base_dir, name='index', bucket_name=None, opener=open_index):
+        self.base_dir = base_dir
+        self.name = name
+        self.bucket_name = bucket_name
+        self._opener = opener
+        self._index = None
+        self._lock = threading.Lock()
+        self._readers = 0
+        self._retired = False
+
+    @property
+    def index(self):
+        """ The index, opened on first use and then shared. """
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._opener(self.base_dir, self.name, self.bucket_name)
+        return self._index
+
+    def is_open(self):
+        return self._index is not None
+
+    def _acquire(self):
+        with self._lock:
+            self._readers += 1
+
+    def _release(self):
+        with self._lock:
+            self._readers -= 1
+            drained = self._retired and self._readers == 0
+        if drained:
+            self.close()
+
+    def retire(self):
+        """ Closes the index once the requests still reading it are done. """
+        with self._lock:
+            self._retired = True
+            drained = self._readers == 0
+        if drained:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            index, self._index = self._index, None
+        if index is not None and hasattr(index, 'close'):
+            index.close()
+
+    def __repr__(self):
+        location = self.base_dir if self.bucket_name is None else f'gs://{self.bucket_name}/{self.base_dir}'
+        return f'FieldIndex({location}/{self.name})'
+
+
+class IndexRegistry:
+    """
+    Registry of the named field indexes of the search engine (e.g. 'text',
+    'title', 'anchor', 'og_text'), each with its own base dir and bucket.
+
+    Indexes are opened once on first use and shared by all requests. swap()
+    replaces an index at runtime: the new index is opened first, then installed
+    atomically, so requests see either the old or the new one. Requests take
+    their indexes with acquire(), the old index is closed once the last of them
+    is done.
+
+    Args:
+        posting_cache (PostingCache, optional): Cache attached to every opened index.
+    """
+
+    def __init__(self, posting_cache=None):
+        self.posting_cache = posting_cache
+        self._fields = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, field):
+        return field in self._fields
+
+    def fields(self):
+        return list(self._fields)
+
+    def register(self, field, base_dir, name='index', bucket_name=None, opener=open_index):
+        """ Registers (or re-registers) `field`, the index is opened on first use. """
+        field_index = FieldIndex(base_dir, name, bucket_name, self._with_cache(opener))
+        with self._lock:
+            self._fields[field] = field_index
+        return field_index
+
+    def get(self, field):
+        """ Returns the FieldIndex of `field`, KeyError if it was never registered. """
+        return self._fields[field]
+
+    def index(self, field):
+        return self._fields[field].index
+
+    @contextmanager
+    def acquire(self, *fields):
+        """
+        Yields {field: FieldIndex} for `fields`, the indexes installed now. They
+        stay open until the block exits, even if swap() replaces them meanwhile.
+        """
+        with self._lock:
+            field_indexes = {field: self._fields[field] for field in fields}
+            for field_index in field_indexes.values():
+                field_index._acquire()
+        try:
+            yield field_indexes
+        finally:
+            for field_index in field_indexes.values():
+                field_index._release()
+
+    def swap(self, field, base_dir, name='index', bucket_name=None, opener=open_index):
+        """
+        Replaces `field` by the index in base_dir/bucket_name. The new index is
+        opened before it is installed; the old one is closed once the requests
+        that acquired it are done (see acquire). The new
+        index gets its own posting cache generation, so it never reads the lists
+        cached for the old files, even when it is republished in the same base_dir.
+
+        Returns:
+            FieldIndex: The new field index.
+        """
+        field_index = FieldIndex(base_dir, name, bucket_name, self._with_cache(opener))
+        field_index.index  # open outside the lock, requests keep using the old index
+        with self._lock:
+            old = self._fields.get(field)
+            self._fields[field] = field_index
+        if old is not None:
+            old.retire()
+        return field_index
+
+    def _with_cache(self, opener):
+        if self.posting_cache is None:
+            return opener
+
+        def open_with_cache(base_dir, name, bucket_name):
+            index = opener(base_dir, name, bucket_name)
+            index.attach_cache(self.posting_cache)
+            return index
+        return open_with_cache
+
+    def close(self):
+        with self._lock:
+            fields = list(self._fields.values())
+        for field_index in fields:
+            field_index.close()
@@ -0,0 +1,178 @@
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# How long a reload waits for the queries still running on the old engine
+DRAIN_TIMEOUT_SECONDS = 60
+
+
+def rss_bytes():
+    """ Current resident set size of this process in bytes (Linux), None if unknown. """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _Generation:
+    """ One engine plus the number of requests currently using it. """
+
+    def __init__(self, engine, number):
+        self.engine = engine
+        self.number = number
+        self.in_flight = 0
+        self.retired = False
+        self.drained = threading.Event()
+
+
+class EngineHolder:
+    """
+    Holds the SearchEngine that serves requests and replaces it without downtime.
+
+    Requests use the engine through acquire(), which counts them per engine
+    generation. reload() builds a new engine with `factory` in a background
+    thread, while the current one keeps serving. Then it swaps the new engine in
+    atomically: new requests get the new engine, and requests already running
+    finish on the old one. Once they are done, the old engine's close() releases
+    its memory maps, caches and pools. Every reload is reported with its
+    duration and the change in resident memory.
+
+    With lazy=True the first engine is not built in the constructor but by
+    start(), or by the first acquire(), so a server can bind its port first.
+
+    Args:
+        factory (callable): Builds a loaded, warmed up engine.
+        engine (SearchEngine, optional): The first engine, built with factory when None.
+        drain_timeout (float): Seconds to wait for in-flight requests before
+            closing the old engine anyway.
+        lazy (bool): Defer building the first engine.
+    """
+
+    def __init__(self, factory, engine=None, drain_timeout=DRAIN_TIMEOUT_SECONDS, lazy=False):
+        self._factory = factory
+        self.drain_timeout = drain_timeout
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._current = None
+        self.reloading = False
+        self.last_reload = None
+        if engine is not None:
+            self._current = _Generation(engine, 1)
+        elif not lazy:
+            self.start(background=False)
+
+    def start(self, background=True):
+        """ Builds the first engine if there is none yet, in a thread when `background`. """
+        if background:
+            threading.Thread(target=self._first_generation, daemon=True).start()
+        else:
+            self._first_generation()
+
+    def _first_generation(self):
+        if self._current is None:
+            with self._start_lock:
+                if self._current is None:
+                    self._current = _Generation(self._factory(), 1)
+        return self._current
+
+    def is_loaded(self):
+        """ True once the first engine is built (never blocks). """
+        return self._current is not None
+
+    @property
+    def engine(self):
+        """ The current engine, for code that does not need drain tracking. """
+        return self._first_generation().engine
+
+    @contextmanager
+    def acquire(self):
+        """ Yields the current engine; a reload will not close it before the block exits.
+            Waits for the first engine if it is still being built.
+        """
+        self._first_generation()
+        with self._lock:
+            generation = self._current
+            generation.in_flight += 1
+        try:
+            yield generation.engine
+        finally:
+            with self._lock:
+                generation.in_flight -= 1
+                if generation.retired and generation.in_flight == 0:
+                    generation.drained.set()
+
+    def reload(self, background=True):
+        """
+        Builds a new engine and swaps it in.
+
+        Args:
+            background (bool): Return at once and reload in a thread.
+
+        Returns:
+            bool: False if a reload is already running, True otherwise.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        self.reloading = True
+        if background:
+            threading.Thread(target=self._reload, daemon=True).start()
+        else:
+            self._reload()
+        return True
+
+    def _reload(self):
+        try:
+            self._first_generation()
+            t_start = time.time()
+            rss_before = rss_bytes()
+            report = {'started_at': t_start, 'error': None}
+            try:
+                new_engine = self._factory()
+            except Exception as e:
+                # keep serving the old engine
+                report.update(error=repr(e), seconds=time.time() - t_start)
+                self.last_reload = report
+                return
+            build_seconds = time.time() - t_start
+
+            with self._lock:
+                old = self._current
+                self._current = _Generation(new_engine, old.number + 1)
+                old.retired = True
+                if old.in_flight == 0:
+                    old.drained.set()
+            drained = old.drained.wait(self.drain_timeout)
+            old.engine.close()
+            del old
+            gc.collect()
+
+            rss_after = rss_bytes()
+            report.update(
+                generation=self._current.number,
+                build_seconds=build_seconds,
+                seconds=time.time() - t_start,
+                drained=drained,
+                rss_before=rss_before,
+                rss_after=rss_after,
+                rss_delta=None if rss_before is None or rss_after is None else rss_after - rss_before,
+            )
+            self.last_reload = report
+        finally:
+            self.reloading = False
+            self._reload_lock.release()
+
+    def status(self):
+        """ Returns a JSON friendly report of the current generation and the last reload. """
+        with self._lock:
+            generation = self._current
+            in_flight = 0 if generation is None else generation.in_flight
+        return {
+            'generation': 0 if generation is None else generation.number,
+            'in_flight': in_flight,
+            'reloading': self.reloading,
+            'last_reload': self.last_reload,
+        }
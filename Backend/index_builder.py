@@ -0,0 +1,206 @@
+import os
+import heapq
+import pickle
+import shutil
+import hashlib
+import tempfile
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from functools import partial
+from itertools import groupby, islice
+from pathlib import Path
+import numpy as np
+from inverted_index_gcp import (InvertedIndex, MultiFileWriter, encode_posting_arrays,
+                                POSTING_FORMAT_V1)
+from Backend.tokenizer import tokenize
+
+# Same term -> bucket mapping as the GCP notebook, so the posting files keep
+# their `{bucket_id}_{i:03}.bin` names and `{bucket_id}_posting_locs.pickle` files.
+NUM_BUCKETS = 124
+
+# Rough size of one buffered posting (doc_id and tf Python ints in two lists)
+# and of one buffered term, used to decide when to spill a run to disk.
+POSTING_BYTES = 72
+TERM_BYTES = 200
+
+
+def _hash(s):
+    return hashlib.blake2b(bytes(s, encoding='utf8'), digest_size=5).hexdigest()
+
+
+def token2bucket_id(token):
+    return int(_hash(token), 16) % NUM_BUCKETS
+
+
+def _count_chunk(tokenizer, chunk):
+    """
+    Tokenizes a chunk of documents, runs in the worker processes.
+
+    Args:
+        tokenizer (callable): Function turning a text into tokens.
+        chunk (list): (doc_id, text) pairs.
+
+    Returns:
+        list: (doc_id, doc_length, [(term, tf), ...]) per document.
+    """
+    counted = []
+    for doc_id, text in chunk:
+        tokens = tokenizer(text)
+        counted.append((doc_id, len(tokens), list(Counter(tokens).items())))
+    return counted
+
+
+def _bounded_map(pool, fn, chunks, max_pending):
+    """ Like pool.map, but submits at most max_pending chunks ahead so the
+        document stream is never read into memory as a whole.
+    """
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(fn, chunk))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _chunks(docs, chunk_size):
+    docs = iter(docs)
+    while True:
+        chunk = list(islice(docs, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _spill(buffer, run_dir, run_id):
+    """
+    Writes the buffered postings as a run sorted by (bucket, term), each record
+    holding the term's postings in arrival order.
+
+    Returns:
+        str: Path of the run file.
+    """
+    path = str(Path(run_dir) / f'run_{run_id:05}.pkl')
+    with open(path, 'wb') as f:
+        for term in sorted(buffer, key=lambda t: (token2bucket_id(t), t)):
+            doc_ids, tfs = buffer[term]
+            pickle.dump((token2bucket_id(term), term, np.array(doc_ids, dtype=np.int64),
+                         np.array(tfs, dtype=np.int64)), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def build_index(docs, base_dir, name='index', tokenizer=tokenize, workers=None,
+                memory_budget=1024 * 2 ** 20, chunk_size=1000, min_df=1,
+                posting_format=POSTING_FORMAT_V1, tmp_dir=None):
+    """
+    Builds an index on a single machine, without Spark.
+
+    Documents are streamed in chunks and tokenized in a process pool. Their
+    postings are buffered until the estimated buffer size reaches
+    memory_budget, then spilled to disk as a run sorted by (bucket, term).
+    The runs are k-way merged with heapq so that each posting list is sorted
+    by doc_id. The lists are written bucket by bucket through MultiFileWriter.
+    The result has the layout of the GCP notebook's output:
+    `{bucket_id}_{i:03}.bin` posting files, `{bucket_id}_posting_locs.pickle`
+    and `{name}.pkl`, plus a doc_id -> length dictionary in `doc_lengths.pickle`.
+
+    Args:
+        docs (iterable): (doc_id, text) pairs, e.g. a generator over a dump.
+        base_dir (str): Output directory.
+        name (str): Name of the index pickle.
+        tokenizer (callable): Picklable function turning a text into tokens,
+            e.g. tokenize or tokenize_stemmed.
+        workers (int, optional): Tokenizer processes, os.cpu_count() by default.
+            1 tokenizes in the calling process.
+        memory_budget (int): Approximate bytes of postings buffered before spilling.
+        chunk_size (int): Documents sent to a worker at a time.
+        min_df (int): Terms found in fewer documents are dropped, like the
+            notebook's posting list filter.
+        posting_format (int): POSTING_FORMAT_V1 or POSTING_FORMAT_V2.
+        tmp_dir (str, optional): Where runs are spilled, a directory in base_dir by default.
+
+    Returns:
+        InvertedIndex: The index, also written to `base_dir`/`name`.pkl.
+    """
+    Path(base_dir).mkdir(parents=True, exist_ok=True)
+    run_dir = tempfile.mkdtemp(prefix='runs_', dir=tmp_dir or base_dir)
+    workers = workers or os.cpu_count()
+    count = partial(_count_chunk, tokenizer)
+    runs = []
+    doc_lengths = {}
+    try:
+        # 1. tokenize and spill sorted runs
+        buffer = defaultdict(lambda: ([], []))
+        buffered_bytes = 0
+        if workers == 1:
+            counted_chunks = map(count, _chunks(docs, chunk_size))
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            counted_chunks = _bounded_map(pool, count, _chunks(docs, chunk_size), 2 * workers)
+        try:
+            for counted in counted_chunks:
+                for doc_id, doc_length, term_tfs in counted:
+                    doc_lengths[doc_id] = doc_length
+                    for term, tf in term_tfs:
+                        if term not in buffer:
+                            buffered_bytes += TERM_BYTES
+                        doc_ids, tfs = buffer[term]
+                        doc_ids.append(doc_id)
+                        tfs.append(tf)
+                    buffered_bytes += POSTING_BYTES * len(term_tfs)
+                if buffered_bytes >= memory_budget:
+                    runs.append(_spill(buffer, run_dir, len(runs)))
+                    buffer.clear()
+                    buffered_bytes = 0
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if buffer:
+            runs.append(_spill(buffer, run_dir, len(runs)))
+            buffer.clear()
+
+        # 2. k-way merge the runs and write the posting lists bucket by bucket;
+        # heapq.merge is stable, so a term's records come in run (= input) order
+        index = InvertedIndex()
+        index.posting_format = posting_format
+        merged = heapq.merge(*[_read_run(path) for path in runs], key=lambda record: record[:2])
+        for bucket_id, bucket_records in groupby(merged, key=lambda record: record[0]):
+            bucket_locs = defaultdict(list)
+            with closing(MultiFileWriter(base_dir, bucket_id)) as writer:
+                for term, records in groupby(bucket_records, key=lambda record: record[1]):
+                    records = list(records)
+                    doc_ids = np.concatenate([record[2] for record in records])
+                    tfs = np.concatenate([record[3] for record in records])
+                    if len(doc_ids) < min_df:
+                        continue
+                    if np.any(np.diff(doc_ids) < 0):
+                        # documents did not arrive in doc_id order
+                        order = np.argsort(doc_ids, kind='stable')
+                        doc_ids, tfs = doc_ids[order], tfs[order]
+                    # store file names relative to base_dir, like the GCP notebook does
+                    locs = [(Path(f_name).name, offset) for f_name, offset
+                            in writer.write(encode_posting_arrays(doc_ids, tfs, posting_format))]
+                    bucket_locs[term] = locs
+                    index.posting_locs[term] = locs
+                    index.df[term] = len(doc_ids)
+                    index.term_total[term] = int(tfs.sum())
+            with open(Path(base_dir) / f'{bucket_id}_posting_locs.pickle', 'wb') as f:
+                pickle.dump(bucket_locs, f)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    index.write_index(base_dir, name)
+    with open(Path(base_dir) / 'doc_lengths.pickle', 'wb') as f:
+        pickle.dump(doc_lengths, f)
+    return index
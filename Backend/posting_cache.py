@@ -0,0 +1,185 @@
+import json
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+LRU = 'lru'
+LFU = 'lfu'
+
+
+def postings_nbytes(value):
+    """ Size in bytes of a cached (doc_ids, tfs) pair of arrays. """
+    return sum(array.nbytes for array in value)
+
+
+class PostingCache:
+    """
+    Size-bounded cache of decoded posting lists shared by all queries.
+
+    The bound is on the bytes of the cached arrays rather than on the number of
+    entries, since posting lists range from a few bytes to hundreds of MB.
+    Eviction is least-recently-used ('lru') or least-frequently-used ('lfu',
+    ties broken by recency).
+
+    Args:
+        max_bytes (int): Upper bound on the bytes of all cached arrays.
+        policy (str): 'lru' or 'lfu'.
+    """
+
+    def __init__(self, max_bytes=256 * 2 ** 20, policy=LRU):
+        if policy not in (LRU, LFU):
+            raise ValueError(f"unknown eviction policy: {policy}")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, nbytes), LRU order
+        self._freq = {}  # key -> access count (LFU)
+        self._by_freq = defaultdict(OrderedDict)  # count -> keys in recency order (LFU)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """ Returns the cached value of `key`, None on a miss. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touch(key)
+            return entry[0]
+
+    def put(self, key, value):
+        """ Caches `value`, evicting entries until it fits. Values larger than the
+            whole cache are not stored.
+        """
+        nbytes = postings_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        for array in value:
+            # cached arrays are shared between queries
+            array.flags.writeable = False
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries[key][1]
+                self._entries[key] = (value, nbytes)
+                self.bytes += nbytes
+                self._touch(key)
+                # a larger value may not fit next to the others any more
+                while self.bytes > self.max_bytes:
+                    self._evict()
+                return
+            while self.bytes + nbytes > self.max_bytes:
+                self._evict()
+            self._entries[key] = (value, nbytes)
+            self.bytes += nbytes
+            if self.policy == LFU:
+                self._freq[key] = 1
+                self._by_freq[1][key] = None
+
+    def _touch(self, key):
+        if self.policy == LRU:
+            self._entries.move_to_end(key)
+            return
+        count = self._freq[key]
+        del self._by_freq[count][key]
+        if not self._by_freq[count]:
+            del self._by_freq[count]
+        self._freq[key] = count + 1
+        self._by_freq[count + 1][key] = None
+
+    def _evict(self):
+        if self.policy == LRU:
+            key = next(iter(self._entries))
+        else:
+            count = min(self._by_freq)
+            key, _ = self._by_freq[count].popitem(last=False)
+            if not self._by_freq[count]:
+                del self._by_freq[count]
+            del self._freq[key]
+        _, nbytes = self._entries.pop(key)
+        self.bytes -= nbytes
+        self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._freq.clear()
+            self._by_freq.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """ Returns a JSON friendly report of the cache counters. """
+        lookups = self.hits + self.misses
+        return {
+            'policy': self.policy,
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def warm_terms(index, base_dir, terms, bucket_name=None):
+    """
+    Reads the posting arrays of `terms`, most important first, into the cache
+    attached to `index` and stops at the first eviction: once the cache is
+    full, rarer terms would only push out more frequent ones. Without a cache
+    every term is read once (warming the page cache).
+
+    Args:
+        index (InvertedIndex): The index, usually with a PostingCache attached.
+        base_dir (str): Directory of the posting list files.
+        terms (iterable): Tokens to read, e.g. the tokens of a query log ordered by frequency.
+        bucket_name (str, optional): GCS bucket of the posting list files.
+
+    Returns:
+        int: Number of posting lists that were read.
+    """
+    cache = getattr(index, 'posting_cache', None)
+    evictions_before = cache.evictions if cache is not None else 0
+    n_read = 0
+    for term in terms:
+        if term not in index.posting_locs:
+            continue
+        index.read_a_posting_array(base_dir, term, bucket_name)
+        n_read += 1
+        if cache is not None and cache.evictions > evictions_before:
+            break
+    return n_read
+
+
+def warm_from_query_log(index, base_dir, queries, tokenizer, bucket_name=None):
+    """
+    Pre-warms the cache attached to `index` with the terms of a query log, the
+    most frequent terms first, until the cache is full.
+
+    Args:
+        index (InvertedIndex): Index with a PostingCache attached (see InvertedIndex.attach_cache).
+        base_dir (str): Directory of the posting list files.
+        queries (str or iterable): Path to a JSON query log such as queries_train.json
+            (a list of queries or a dict keyed by query), or the queries themselves.
+        tokenizer (callable): Function turning a query into tokens, e.g. tokenize.
+        bucket_name (str, optional): GCS bucket of the posting list files.
+
+    Returns:
+        int: Number of posting lists loaded into the cache.
+    """
+    if isinstance(queries, str):
+        with open(queries, 'r', encoding='utf-8') as f:
+            queries = json.load(f)
+    term_counts = Counter(term for query in queries for term in tokenizer(query))
+    cache = index.posting_cache
+    n_before = len(cache)
+    warm_terms(index, base_dir, [term for term, _ in term_counts.most_common()], bucket_name)
+    return len(cache) - n_before
@@ -0,0 +1,239 @@
+import gc
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Defaults of the pre-fork server (see search_frontend.py --workers)
+WORKER_THREADS = 4
+MAX_REQUESTS = 10000
+MAX_REQUESTS_JITTER = 1000
+GRACEFUL_TIMEOUT_SECONDS = 30
+LISTEN_BACKLOG = 2048
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # one request per connection: an idle keep-alive connection would hold one
+    # of the worker's few threads, and closed connections spread over workers
+    protocol_version = "HTTP/1.0"
+
+
+class _WorkerServer(BaseWSGIServer):
+    """
+    WSGI server of one worker process, accepting from the listening socket it
+    shares with the other workers.
+
+    At most `threads` requests run at once. While they are all busy the worker
+    stops accepting, so new connections wait in the shared backlog for the
+    next idle worker instead of queueing behind a slow query. After
+    `max_requests` requests the worker finishes the running ones and exits.
+    """
+
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, app, host, port, fd, threads, max_requests):
+        super().__init__(host, port, app, handler=_RequestHandler, fd=fd)
+        self.max_requests = max_requests
+        self._slots = threading.BoundedSemaphore(threads)
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._count_lock = threading.Lock()
+        self.n_requests = 0
+        self._stopping = False
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+            with self._count_lock:
+                self.n_requests += 1
+                recycle = self.max_requests and self.n_requests >= self.max_requests
+            if recycle:
+                self.stop()
+
+    def stop(self):
+        """ Stops accepting; serve() returns once the running requests are done. """
+        if not self._stopping:
+            self._stopping = True
+            # shutdown() waits for serve_forever, so it can not run in the loop's thread
+            threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def serve(self):
+        self.serve_forever()
+        self._pool.shutdown(wait=True)
+
+
+class PreforkServer:
+    """
+    Pre-fork HTTP server for a WSGI app (e.g. the Flask app of search_frontend.py).
+
+    The parent process runs `preload` once (loading the index, the term
+    dictionary, PageRank and the doc-attribute store), freezes the loaded
+    objects out of the garbage collector, binds the socket, and forks `workers`
+    processes. The workers share the parent's pages copy-on-write; the posting
+    files and the doc store are memory-mapped, so their pages sit once in the
+    page cache. RAM therefore does not grow N times with the number of workers.
+    Per-process caches (posting/result caches) are private to each worker.
+
+    Workers are recycled: each exits after max_requests (+ random jitter, so
+    they do not all restart at once) and the parent forks a replacement. A
+    worker that dies is replaced too.
+
+    Signals to the parent:
+        SIGTERM/SIGINT: stop accepting, let workers finish their requests, exit.
+        SIGHUP: run `on_reload` (e.g. a hot reload of the engine) in the parent,
+            then fork fresh workers and retire the old ones gracefully.
+
+    Args:
+        app: The WSGI application.
+        host (str): Address to bind.
+        port (int): Port to bind.
+        workers (int): Number of worker processes, the number of cores by default.
+        threads (int): Concurrent requests per worker.
+        max_requests (int): Requests served by a worker before it is recycled, 0 for never.
+        max_requests_jitter (int): Random extra requests added to max_requests per worker.
+        preload (callable, optional): Loads the shared data in the parent before forking.
+        on_reload (callable, optional): Reloads the data in the parent on SIGHUP.
+        graceful_timeout (float): Seconds a stopping worker may take before it is killed.
+    """
+
+    def __init__(self, app, host='0.0.0.0', port=8080, workers=None, threads=WORKER_THREADS,
+                 max_requests=MAX_REQUESTS, max_requests_jitter=MAX_REQUESTS_JITTER,
+                 preload=None, on_reload=None, graceful_timeout=GRACEFUL_TIMEOUT_SECONDS):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.n_workers = workers or os.cpu_count() or 1
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.preload = preload
+        self.on_reload = on_reload
+        self.graceful_timeout = graceful_timeout
+        self.socket = None
+        self._workers = {}  # pid -> time it was asked to stop, None while serving
+        self._stopping = False
+        self._reload_requested = False
+
+    def bind(self):
+        if self.socket is None:
+            self.socket = socket.create_server((self.host, self.port), backlog=LISTEN_BACKLOG)
+            self.socket.set_inheritable(True)
+            self.port = self.socket.getsockname()[1]
+        return self.socket
+
+    def serve(self):
+        """ Loads, forks the workers and supervises them until stopped. """
+        if self.preload is not None:
+            self.preload()
+        self._freeze()
+        self.bind()
+        print(f"✓ Serving on http://{self.host}:{self.port} with {self.n_workers} workers "
+              f"x {self.threads} threads (parent pid {os.getpid()})")
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        for _ in range(self.n_workers):
+            self._spawn()
+        try:
+            self._supervise()
+        finally:
+            self.socket.close()
+
+    def _freeze(self):
+        # objects loaded so far are moved out of the GC's reach, so collections in
+        # the workers do not write to (and un-share) their pages
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                self._run_worker()
+                code = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(code)
+        self._workers[pid] = None
+        return pid
+
+    def _run_worker(self):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl+C
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        random.seed()
+        max_requests = self.max_requests
+        if max_requests and self.max_requests_jitter:
+            max_requests += random.randint(0, self.max_requests_jitter)
+        server = _WorkerServer(self.app, self.host, self.port, self.socket.fileno(),
+                               self.threads, max_requests)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+        server.serve()
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+        self._terminate(list(self._workers))
+
+    def _handle_reload(self, signum, frame):
+        self._reload_requested = True
+
+    def _terminate(self, pids):
+        now = time.time()
+        for pid in pids:
+            if self._workers.get(pid, 0) is None:
+                self._workers[pid] = now
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    def _reload(self):
+        self._reload_requested = False
+        if self.on_reload is not None:
+            self.on_reload()
+            self._freeze()
+        old = list(self._workers)
+        # new workers fork from the reloaded parent before the old ones stop
+        for _ in range(self.n_workers):
+            self._spawn()
+        self._terminate(old)
+
+    def _supervise(self):
+        while self._workers:
+            if self._reload_requested and not self._stopping:
+                self._reload()
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                self._kill_stuck()
+                time.sleep(0.1)
+                continue
+            if pid in self._workers:
+                retired = self._workers.pop(pid) is not None
+                if not self._stopping and not retired:
+                    # recycled after max_requests, or crashed
+                    self._spawn()
+
+    def _kill_stuck(self):
+        now = time.time()
+        for pid, stop_time in self._workers.items():
+            if stop_time is not None and now - stop_time > self.graceful_timeout:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
@@ -1,12 +1,9 @@
 from collections import Counter
 import math
 import numpy as np
-import pandas as pd
-import nltk
-from nltk import PorterStemmer
-from nltk.corpus import stopwords
 import re
 from inverted_index_gcp import *
+from Backend.deadline import rarest_first
 
 def query_tfidf(query, index):
     """
@@ -53,13 +50,15 @@ def calc_cosine(query_tfidf, doc_tfidf):
     return dot_product / (math.sqrt(query_magnitude) * math.sqrt(doc_magnitude))
 
 
-def cosine_similarity(tokenized_query, index):
+def cosine_similarity(tokenized_query, index, base_dir=".", bucket_name=None):
     """
     Returns a dictionary of candidates with cosine similarity scores.
 
     Args:
         tokenized_query (list): A list of tokens representing the query.
         index: The inverted index object.
+        base_dir (str): Directory of the posting list files.
+        bucket_name (str, optional): GCS bucket of the posting list files.
 
     Output:
     - A dictionary where:
@@ -72,7 +71,7 @@ def cosine_similarity(tokenized_query, index):
     results = Counter()
 
     for token in tokenized_query:
-        pl = index.read_a_posting_list(".", token)
+        pl = index.read_a_posting_list(base_dir, token, bucket_name)
         if pl == []:
             continue
         else:
@@ -91,7 +90,8 @@ def cosine_similarity(tokenized_query, index):
 
     return results
 
-def BM25_score(tokenized_query, index, doc_num, doc_lengths, avg_doc_length, k1=1.2, b=0.75):
+def BM25_score(tokenized_query, index, doc_num, doc_lengths, avg_doc_length, k1=1.2, b=0.75,
+               base_dir=".", bucket_name=None):
     """
     Calculates BM25 scores for documents based on a given query and an inverted index.
 
@@ -103,6 +103,8 @@ def BM25_score(tokenized_query, index, doc_num, doc_lengths, avg_doc_length, k1=
         avg_doc_length (float): The average document length.
         k1 (float, optional): BM25 tuning parameter. Defaults to 1.2.
         b (float, optional): BM25 tuning parameter. Defaults to 0.75.
+        base_dir (str): Directory of the posting list files.
+        bucket_name (str, optional): GCS bucket of the posting list files.
 
     Returns:
         dict: A dictionary where keys are document IDs and values are their BM25 scores.
@@ -111,7 +113,7 @@ def BM25_score(tokenized_query, index, doc_num, doc_lengths, avg_doc_length, k1=
     candidates_dict = {}  # Initialize a dictionary to store candidates of retrieval
 
     for token in tokenized_query:
-        pl = index.read_a_posting_list(".", token)
+        pl = index.read_a_posting_list(base_dir, token, bucket_name)
         if pl == []:
             continue
         else:
@@ -129,13 +131,547 @@ def BM25_score(tokenized_query, index, doc_num, doc_lengths, avg_doc_length, k1=
     return bm25_scores
 
 
-def word_count_score(tokenized_query, index):
+def dense_doc_lengths(doc_lengths):
+    """
+    Converts a document length dictionary into a dense array indexed by doc_id.
+
+    Args:
+        doc_lengths (dict): A dictionary mapping document IDs to their lengths.
+
+    Returns:
+        np.ndarray: float64 array where entry doc_id holds the document length,
+                    NaN for doc_ids that have no length.
+    """
+    doc_ids = np.fromiter(doc_lengths.keys(), dtype=np.int64, count=len(doc_lengths))
+    lengths = np.fromiter(doc_lengths.values(), dtype=np.float64, count=len(doc_lengths))
+    dense = np.full(int(doc_ids.max()) + 1 if len(doc_ids) else 0, np.nan)
+    dense[doc_ids] = lengths
+    return dense
+
+
+def doc_values(values, doc_ids):
+    """
+    Looks up per-document values (lengths, norms) of doc_ids.
+
+    Args:
+        values (np.ndarray or callable): A dense array indexed by doc_id (see
+            dense_doc_lengths) or a function mapping a doc_id array to a value
+            array (see DocAttributeStore.lookup).
+        doc_ids (np.ndarray): Document IDs.
+
+    Returns:
+        np.ndarray: float64 values, NaN for unknown documents.
+    """
+    if callable(values):
+        return values(doc_ids)
+    res = np.full(len(doc_ids), np.nan)
+    known = doc_ids < len(values)
+    res[known] = values[doc_ids[known]]
+    return res
+
+
+def top_k_arrays(doc_ids, scores, k):
+    """
+    Selects the k highest scores with argpartition instead of a full sort.
+
+    Args:
+        doc_ids (np.ndarray): Document IDs.
+        scores (np.ndarray): Scores, parallel to doc_ids.
+        k (int): Number of results to keep.
+
+    Returns:
+        list: (doc_id, score) pairs ordered from best to worst, like Counter.most_common(k).
+    """
+    if k <= 0 or len(scores) == 0:
+        return []
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    order = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return list(zip(doc_ids[order].tolist(), scores[order].tolist()))
+
+
+def bm25_term_scores(doc_ids, tfs, lengths, idf, avg_doc_length, k1=1.2, b=0.75):
+    """
+    Calculates the BM25 contribution of one term from its posting arrays.
+
+    Args:
+        doc_ids (np.ndarray): Document IDs of the posting list.
+        tfs (np.ndarray): Term frequencies, parallel to doc_ids.
+        lengths (np.ndarray): Document lengths, NaN for unknown documents.
+        idf (float): Inverse document frequency of the term.
+        avg_doc_length (float): The average document length.
+        k1 (float, optional): BM25 tuning parameter. Defaults to 1.2.
+        b (float, optional): BM25 tuning parameter. Defaults to 0.75.
+
+    Returns:
+        tuple: (doc_ids, contributions) arrays; documents without a length are dropped.
+    """
+    if len(doc_ids) == 0:
+        return doc_ids, np.empty(0)
+    known = ~np.isnan(lengths)
+    doc_ids, tfs, lengths = doc_ids[known], tfs[known], lengths[known]
+    norm = (tfs * (k1 + 1)) / (tfs + k1 * (1 - b + b * (lengths / avg_doc_length)))
+    return doc_ids, idf * norm
+
+
+def sum_term_scores(term_scores):
+    """
+    Sums per-term (doc_ids, scores) arrays into one score per document.
+
+    Returns:
+        tuple: (doc_ids, scores) arrays, doc_ids sorted.
+    """
+    if not term_scores:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    # scatter-add the contributions of every token into one slot per document
+    doc_ids, slots = np.unique(np.concatenate([ids for ids, _ in term_scores]), return_inverse=True)
+    scores = np.bincount(slots, weights=np.concatenate([scores for _, scores in term_scores]),
+                         minlength=len(doc_ids))
+    return doc_ids, scores
+
+
+def bm25_top_k_from_arrays(term_arrays, avg_doc_length, k=500, k1=1.2, b=0.75):
+    """
+    BM25 top k from already read term arrays (see BM25Engine.term_arrays). Works
+    on plain arrays only, so it can be sent to a process pool.
+
+    Args:
+        term_arrays (list): One (doc_ids, tfs, lengths, idf) tuple per query token.
+        avg_doc_length (float): The average document length.
+        k (int): Number of results to keep.
+        k1 (float, optional): BM25 tuning parameter. Defaults to 1.2.
+        b (float, optional): BM25 tuning parameter. Defaults to 0.75.
+
+    Returns:
+        list: (doc_id, score) pairs ordered from best to worst.
+    """
+    term_scores = [bm25_term_scores(*arrays, avg_doc_length, k1, b) for arrays in term_arrays]
+    return top_k_arrays(*sum_term_scores(term_scores), k)
+
+
+def word_count_top_k(doc_id_arrays, k=500):
+    """
+    Array version of word_count_score(...).most_common(k): counts in how many of
+    the query tokens' posting lists each document appears.
+
+    Args:
+        doc_id_arrays (list): The doc_ids array of every query token's posting list.
+        k (int): Number of results to keep.
+
+    Returns:
+        list: (doc_id, count) pairs ordered from best to worst, ties by doc_id.
+    """
+    if not doc_id_arrays:
+        return []
+    doc_ids, counts = np.unique(np.concatenate(doc_id_arrays), return_counts=True)
+    return [(doc_id, int(count)) for doc_id, count in top_k_arrays(doc_ids, counts.astype(np.float64), k)]
+
+
+def match_count_buckets(doc_id_arrays):
+    """
+    Groups the documents of the query tokens' posting lists by the number of
+    distinct tokens they match, without sorting by score: every count from the
+    number of tokens down to 1 is one bucket.
+
+    Args:
+        doc_id_arrays (list): The doc_ids array of every distinct query token's posting list.
+
+    Returns:
+        list: (count, doc_ids) pairs from the highest count down, doc_ids ascending
+              within a bucket. Empty buckets are left out.
+    """
+    doc_id_arrays = [doc_ids for doc_ids in doc_id_arrays if len(doc_ids)]
+    if not doc_id_arrays:
+        return []
+    if len(doc_id_arrays) == 1:
+        return [(1, doc_id_arrays[0])]
+    doc_ids, counts = np.unique(np.concatenate(doc_id_arrays), return_counts=True)
+    buckets = []
+    for count in range(len(doc_id_arrays), 0, -1):
+        in_bucket = doc_ids[counts == count]
+        if len(in_bucket):
+            buckets.append((count, in_bucket))
+    return buckets
+
+
+class MatchCountEngine:
+    """
+    Ranks ALL the documents of a field index (title or anchor) that contain a
+    query token by the number of distinct query tokens they contain.
+
+    Posting lists are read as doc_id arrays only (no tf-idf), the matches are
+    counted with one np.unique and grouped into one bucket per count, so no
+    Counter of all matching documents is built and nothing is fully sorted.
+    Results can be streamed bucket by bucket.
+
+    Args:
+        index: The inverted index object.
+        base_dir (str): Directory of the posting list files.
+        bucket_name (str, optional): GCS bucket of the posting list files.
+    """
+
+    def __init__(self, index, base_dir=".", bucket_name=None):
+        self.index = index
+        self.base_dir = base_dir
+        self.bucket_name = bucket_name
+
+    def buckets(self, tokens):
+        """ Returns the (count, doc_ids) buckets of the distinct tokens, see match_count_buckets. """
+        tokens = [token for token in dict.fromkeys(tokens) if token in self.index.posting_locs]
+        postings = self.index.read_posting_arrays(self.base_dir, tokens, self.bucket_name)
+        return match_count_buckets([postings[token][0] for token in tokens])
+
+    def iter_doc_ids(self, tokens, chunk_size=10000):
+        """
+        Yields the matching doc_ids from best to worst in arrays of at most chunk_size.
+        """
+        for _, doc_ids in self.buckets(tokens):
+            for start in range(0, len(doc_ids), chunk_size):
+                yield doc_ids[start:start + chunk_size]
+
+    def rank(self, tokens):
+        """ Returns all (doc_id, count) pairs from best to worst, ties by doc_id. """
+        return [(int(doc_id), count) for count, doc_ids in self.buckets(tokens) for doc_id in doc_ids]
+
+
+class BM25Engine:
+    """
+    Array based BM25 scorer for a single field index.
+
+    Posting lists are read as (doc_ids, tfs) arrays, document lengths are looked
+    up in a dense array and the per-term contributions are summed with a NumPy
+    scatter-add. Scores are identical to BM25_score for the same k1/b.
+
+    Args:
+        index: The inverted index object.
+        doc_lengths (dict, np.ndarray or callable): Document lengths, either a dictionary,
+            a dense array indexed by doc_id (see dense_doc_lengths) or a function mapping
+            a doc_id array to a length array with NaN for unknown documents
+            (see DocAttributeStore.lookup).
+        avg_doc_length (float): The average document length.
+        doc_num (int): Total number of documents.
+        base_dir (str): Directory of the posting list files.
+        bucket_name (str, optional): GCS bucket of the posting list files.
+    """
+
+    def __init__(self, index, doc_lengths, avg_doc_length, doc_num, base_dir=".", bucket_name=None):
+        self.index = index
+        if isinstance(doc_lengths, dict):
+            doc_lengths = dense_doc_lengths(doc_lengths)
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = avg_doc_length
+        self.doc_num = doc_num
+        self.base_dir = base_dir
+        self.bucket_name = bucket_name
+
+    def lengths(self, doc_ids):
+        """ Returns the lengths of doc_ids, NaN for documents without a length. """
+        return doc_values(self.doc_lengths, doc_ids)
+
+    def term_scores(self, token, k1=1.2, b=0.75, postings=None):
+        """
+        Calculates the BM25 contribution of a single query token.
+
+        Args:
+            token (str): The query token.
+            k1 (float, optional): BM25 tuning parameter. Defaults to 1.2.
+            b (float, optional): BM25 tuning parameter. Defaults to 0.75.
+            postings (tuple, optional): Already read (doc_ids, tfs) arrays of the token.
+
+        Returns:
+            tuple: (doc_ids, contributions) arrays; documents without a length are dropped.
+        """
+        doc_ids, tfs, lengths, idf = self.term_arrays(token, postings)
+        return bm25_term_scores(doc_ids, tfs, lengths, idf, self.avg_doc_length, k1, b)
+
+    def term_arrays(self, token, postings=None):
+        """
+        Reads everything the BM25 formula needs for one query token, so the
+        scoring itself can run elsewhere (see bm25_top_k_from_arrays).
+
+        Args:
+            token (str): The query token.
+            postings (tuple, optional): Already read (doc_ids, tfs) arrays of the token.
+
+        Returns:
+            tuple: (doc_ids, tfs, lengths, idf) with NaN lengths for unknown documents.
+        """
+        if postings is None:
+            postings = self.index.read_a_posting_array(self.base_dir, token, self.bucket_name)
+        doc_ids, tfs = postings
+        if len(doc_ids) == 0:
+            return doc_ids, tfs, np.empty(0), 0.0
+        idf = math.log(self.doc_num / self.index.df[token], 10)  # Inverse document frequency
+        return doc_ids, tfs, self.lengths(doc_ids), idf
+
+    def score(self, tokenized_query, k1=1.2, b=0.75, postings=None, deadline=None):
+        """
+        Calculates BM25 scores of every candidate document.
+
+        Args:
+            tokenized_query (list): A list of tokens representing the query.
+            k1 (float, optional): BM25 tuning parameter. Defaults to 1.2.
+            b (float, optional): BM25 tuning parameter. Defaults to 0.75.
+            postings (dict, optional): token -> (doc_ids, tfs) arrays read in advance.
+            deadline (Deadline, optional): Score the rarest tokens first and stop
+                when it runs out (see rarest_first).
+
+        Returns:
+            tuple: (doc_ids, scores) arrays of the candidate documents.
+        """
+        return sum_term_scores([self.term_scores(token, k1, b, None if postings is None else postings.get(token))
+                                for token in rarest_first(tokenized_query, self.index.df, deadline)])
+
+    def top_k(self, tokenized_query, k=500, k1=1.2, b=0.75, postings=None, deadline=None):
+        """
+        Returns the k best (doc_id, score) pairs, the same shape as BM25_score(...).most_common(k).
+        """
+        doc_ids, scores = self.score(tokenized_query, k1, b, postings, deadline)
+        return top_k_arrays(doc_ids, scores, k)
+
+    def build_max_impacts(self, k1=1.2, b=0.75):
+        """
+        Computes the maximum BM25 contribution of every term for k1/b and stores it
+        in index.max_impact[(k1, b)]. Run at index build time, then persist the
+        index with write_index so top_k_pruned can use the bounds.
+
+        Returns:
+            dict: A dictionary mapping terms to their maximum contribution.
+        """
+        max_impacts = {}
+        for token, postings in self.index.posting_arrays_iter(self.base_dir, self.bucket_name):
+            _, scores = self.term_scores(token, k1, b, postings)
+            max_impacts[token] = float(scores.max()) if len(scores) else 0.0
+        if not hasattr(self.index, 'max_impact'):
+            self.index.max_impact = {}
+        self.index.max_impact[(k1, b)] = max_impacts
+        return max_impacts
+
+    def write_impact_ordered(self, dst_dir, name, k1=1.2, b=0.75, n_tiers=8):
+        """
+        Writes an impact-ordered copy of the index (POSTING_FORMAT_IMPACT) to dst_dir.
+
+        Every posting list is split into n_tiers tiers of its BM25 contributions
+        for k1/b, quantized relative to the term's maximum contribution. Tiers are
+        stored from the highest to the lowest, doc_id order within a tier, so
+        top_k_impact can read a prefix. Documents without a length go last.
+
+        Returns:
+            InvertedIndex: The new index, also written to `dst_dir`/`name`.pkl.
+        """
+        dst = InvertedIndex()
+        dst.df.update(self.index.df)
+        dst.term_total.update(self.index.term_total)
+        dst.posting_format = POSTING_FORMAT_IMPACT
+        dst.impact_params = (k1, b)
+        dst.tier_ends = {}
+        dst.max_impact[(k1, b)] = {}
+        Path(dst_dir).mkdir(parents=True, exist_ok=True)
+        writers = {}
+        try:
+            for token, (doc_ids, tfs) in self.index.posting_arrays_iter(self.base_dir, self.bucket_name):
+                _, _, lengths, idf = self.term_arrays(token, (doc_ids, tfs))
+                known = ~np.isnan(lengths)
+                scores = np.zeros(len(doc_ids))
+                scores[known] = bm25_term_scores(doc_ids[known], tfs[known], lengths[known], idf,
+                                                 self.avg_doc_length, k1, b)[1]
+                max_score = float(scores.max()) if len(scores) else 0.0
+                levels = np.ceil(scores / max_score * n_tiers) if max_score > 0 else np.zeros(len(scores))
+                order = np.lexsort((doc_ids, -levels))
+                _, tier_sizes = np.unique(-levels[order], return_counts=True)
+
+                # keep each term in its original bucket, like convert_index
+                bucket_id = Path(self.index.posting_locs[token][0][0]).name.rsplit('_', 1)[0]
+                if bucket_id not in writers:
+                    writers[bucket_id] = MultiFileWriter(dst_dir, bucket_id)
+                encoded = encode_posting_arrays(doc_ids[order], tfs[order])
+                dst.posting_locs[token] = [(Path(f_name).name, offset)
+                                           for f_name, offset in writers[bucket_id].write(encoded)]
+                dst.tier_ends[token] = np.cumsum(tier_sizes).astype(np.uint32)
+                dst.max_impact[(k1, b)][token] = max_score
+        finally:
+            for writer in writers.values():
+                writer.close()
+        dst.write_index(dst_dir, name)
+        return dst
+
+    def has_impact_order(self, k1=1.2, b=0.75):
+        """ True when the index is impact-ordered for these k1/b (see write_impact_ordered). """
+        return (getattr(self.index, 'posting_format', None) == POSTING_FORMAT_IMPACT
+                and getattr(self.index, 'impact_params', None) == (k1, b))
+
+    def top_k_impact(self, tokenized_query, k=500, k1=1.2, b=0.75, fraction=0.25):
+        """
+        Approximate top k from the high-impact prefix of each posting list.
+
+        For every query token at least max(k, fraction * df) postings are read,
+        rounded up to a whole tier; the rest of the list is skipped. The skipped
+        postings have the lowest contributions, so the approximation only affects
+        documents that score on many terms through low-impact postings.
+        fraction trades accuracy for latency: 1.0 reads everything and gives the
+        exact top_k.
+
+        Falls back to top_k when the index is not impact-ordered for k1/b.
+
+        Returns:
+            list: (doc_id, score) pairs ordered from best to worst.
+        """
+        if not self.has_impact_order(k1, b):
+            return self.top_k(tokenized_query, k, k1, b)
+        term_scores = []
+        for token in tokenized_query:
+            if token not in self.index.posting_locs:
+                continue
+            df = self.index.df[token]
+            wanted = df if fraction >= 1 else min(df, max(k, math.ceil(fraction * df)))
+            tier_ends = self.index.tier_ends[token]
+            n = int(tier_ends[np.searchsorted(tier_ends, wanted)])
+            postings = self.index.read_a_posting_prefix(self.base_dir, token, n, self.bucket_name)
+            term_scores.append(self.term_scores(token, k1, b, postings))
+        return top_k_arrays(*sum_term_scores(term_scores), k)
+
+    def top_k_pruned(self, tokenized_query, k=500, k1=1.2, b=0.75, deadline=None):
+        """
+        Top-k retrieval with MaxScore style dynamic pruning.
+
+        Terms are processed from the highest to the lowest maximum impact. Once
+        the impacts of the remaining terms cannot lift a new document above the
+        current k-th score, the remaining (common) terms are no longer scanned:
+        their posting lists are only probed for the surviving candidates, and
+        candidates that cannot reach the top k are dropped. The result is the
+        same top k as top_k, up to floating point summation order.
+
+        Falls back to top_k when no maximum impacts were stored for k1/b. With a
+        deadline, the terms left when it runs out are skipped.
+
+        Returns:
+            list: (doc_id, score) pairs ordered from best to worst.
+        """
+        max_impact = getattr(self.index, 'max_impact', {}).get((k1, b))
+        query_counts = Counter(token for token in tokenized_query if token in self.index.posting_locs)
+        if max_impact is None or any(token not in max_impact for token in query_counts):
+            return self.top_k(tokenized_query, k, k1, b, deadline=deadline)
+
+        # a token repeated in the query contributes once per occurrence
+        bounds = {token: max_impact[token] * count for token, count in query_counts.items()}
+        terms = sorted(bounds, key=bounds.get, reverse=True)
+        # remaining_bounds[i]: best total the terms after terms[i] can still add
+        remaining_bounds = [sum(bounds[token] for token in terms[i + 1:]) for i in range(len(terms))]
+
+        doc_ids, scores = np.empty(0, dtype=np.int64), np.empty(0)
+        threshold = 0.0
+        pruning = False
+        for i, (token, remaining) in enumerate(zip(terms, remaining_bounds)):
+            if i > 0 and deadline is not None and deadline.stop():
+                break
+            count = query_counts[token]
+            if not pruning:
+                # essential term: scan the full posting list and admit new documents
+                term_doc_ids, term_scores = self.term_scores(token, k1, b)
+                merged, slots = np.unique(np.concatenate([doc_ids, term_doc_ids]), return_inverse=True)
+                scores = np.bincount(slots, weights=np.concatenate([scores, term_scores * count]),
+                                     minlength=len(merged))
+                doc_ids = merged
+            else:
+                # non-essential term: only probe the current candidates
+                tfs = self.index.probe_posting_list(self.base_dir, token, doc_ids, self.bucket_name)
+                idf = math.log(self.doc_num / self.index.df[token], 10)
+                norm = (tfs * (k1 + 1)) / (tfs + k1 * (1 - b + b * (self.lengths(doc_ids) / self.avg_doc_length)))
+                scores = scores + idf * norm * count
+
+            if len(scores) >= k:
+                threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+                # documents not seen yet can score at most `remaining`
+                pruning = pruning or remaining < threshold
+            if pruning:
+                keep = scores + remaining >= threshold
+                doc_ids, scores = doc_ids[keep], scores[keep]
+        return top_k_arrays(doc_ids, scores, k)
+
+
+def doc_tfidf_norms(index, doc_num, base_dir=".", bucket_name=None):
+    """
+    Computes the L2 norm of every document's tf-idf vector (tf * log10(N / df),
+    the weights used by cosine_top_k) in one pass over the posting lists.
+    Run at index build time and store the result, e.g. as the TEXT_NORM column
+    of the doc-attribute store (DocAttributeStore.add_column).
+
+    Args:
+        index: The inverted index object.
+        doc_num (int): Total number of documents, the same N the queries use.
+        base_dir (str): Directory of the posting list files.
+        bucket_name (str, optional): GCS bucket of the posting list files.
+
+    Returns:
+        tuple: (doc_ids, norms) arrays of every document in the index.
+    """
+    squares = np.zeros(0)
+    for token, (doc_ids, tfs) in index.posting_arrays_iter(base_dir, bucket_name):
+        if len(doc_ids) == 0:
+            continue
+        if doc_ids[-1] >= len(squares):
+            squares = np.concatenate([squares, np.zeros(int(doc_ids[-1]) + 1 - len(squares))])
+        weights = tfs * math.log(doc_num / index.df[token], 10)
+        # doc_ids are unique within a posting list, no need for np.add.at
+        squares[doc_ids] += weights * weights
+    doc_ids = np.flatnonzero(squares)
+    return doc_ids, np.sqrt(squares[doc_ids])
+
+
+def cosine_top_k(tokenized_query, index, doc_norms, doc_num, k=100, base_dir=".", bucket_name=None,
+                 deadline=None):
+    """
+    Vectorized cosine similarity between the query and document tf-idf vectors,
+    using document norms precomputed by doc_tfidf_norms.
+
+    Args:
+        tokenized_query (list): A list of tokens representing the query.
+        index: The inverted index object.
+        doc_norms (dict, np.ndarray or callable): Document norms, like
+            BM25Engine's doc_lengths (e.g. DocAttributeStore.lookup(TEXT_NORM)).
+        doc_num (int): Total number of documents, the N used for the norms.
+        k (int): Number of results to keep.
+        base_dir (str): Directory of the posting list files.
+        bucket_name (str, optional): GCS bucket of the posting list files.
+        deadline (Deadline, optional): Score the rarest tokens first and stop when
+            it runs out; the query norm still covers every token.
+
+    Returns:
+        list: (doc_id, cosine) pairs ordered from best to worst.
+    """
+    if isinstance(doc_norms, dict):
+        doc_norms = dense_doc_lengths(doc_norms)
+    query_weights = {}
+    for token, count in Counter(tokenized_query).items():
+        if token in index.posting_locs and index.df[token] > 0:
+            query_weights[token] = count * math.log(doc_num / index.df[token], 10)
+    query_norm = math.sqrt(sum(weight * weight for weight in query_weights.values()))
+    if query_norm == 0:
+        return []
+
+    term_scores = []
+    for token in rarest_first(list(query_weights), index.df, deadline):
+        query_weight = query_weights[token]
+        doc_ids, tfs = index.read_a_posting_array(base_dir, token, bucket_name)
+        idf = math.log(doc_num / index.df[token], 10)
+        term_scores.append((doc_ids, tfs * idf * query_weight))
+    doc_ids, dots = sum_term_scores(term_scores)
+    norms = doc_values(doc_norms, doc_ids)
+    known = norms > 0  # also drops NaN, documents without a norm
+    return top_k_arrays(doc_ids[known], dots[known] / (norms[known] * query_norm), k)
+
+
+def word_count_score(tokenized_query, index, base_dir=".", bucket_name=None):
     """
     Calculates the number of query terms present in each candidate document.
 
     Args:
         tokenized_query (list): A list of tokens representing the query.
         index: The inverted index object.
+        base_dir (str): Directory of the posting list files.
+        bucket_name (str, optional): GCS bucket of the posting list files.
 
     Returns:
         dict: A dictionary where keys are document IDs and values are the number of
@@ -145,7 +681,7 @@ def word_count_score(tokenized_query, index):
     candidates_dict = {}  # Initialize a regular dictionary
     doc_term_counts = Counter()
     for token in tokenized_query:
-        pl = index.read_a_posting_list(".", token)
+        pl = index.read_a_posting_list(base_dir, token, bucket_name)
         if pl == []:
             continue
         else:
@@ -155,13 +691,15 @@ def word_count_score(tokenized_query, index):
     return doc_term_counts
 
 
-def tf_count_score(tokenized_query, index):
+def tf_count_score(tokenized_query, index, base_dir=".", bucket_name=None):
     """
     Calculates the total term frequency (tf) for each document in the candidates posting list.
 
     Args:
         tokenized_query (list): A list of tokens representing the query.
         index: The inverted index object.
+        base_dir (str): Directory of the posting list files.
+        bucket_name (str, optional): GCS bucket of the posting list files.
 
     Returns:
         dict: A dictionary where keys are document IDs and values are their total tf score.
@@ -170,7 +708,7 @@ def tf_count_score(tokenized_query, index):
     doc_tf_scores = Counter()
 
     for token in tokenized_query:
-        pl = index.read_a_posting_list(".", token)
+        pl = index.read_a_posting_list(base_dir, token, bucket_name)
         if pl == []:
             continue
         else:
@@ -0,0 +1,172 @@
+import threading
+import time
+from Backend.data_Loader import load_index, load_pagerank, load_doc_store, POSTINGS_DIR
+from Backend.posting_cache import PostingCache, LRU, warm_terms
+from Backend.result_cache import ResultCache
+
+# Shared cache of decoded posting lists for the main index
+POSTING_CACHE_BYTES = 512 * 2 ** 20
+POSTING_CACHE_POLICY = LRU
+# Cache of final results of popular queries
+RESULT_CACHE_ENTRIES = 10000
+RESULT_CACHE_TTL_SECONDS = 600
+
+
+class ResidentData:
+    """
+    Process-wide holder for the data every query needs (inverted index, PageRank,
+    doc-attribute store).
+
+    The data is loaded once by `load()` and then shared by every request, so the
+    per-query cost depends only on the posting lists that are read and not on
+    the size of the index pickle or the PageRank CSVs.
+
+    Attributes:
+        index (InvertedIndex): The main inverted index.
+        pagerank (dict): Dictionary mapping document IDs to PageRank scores.
+        docs (DocAttributeStore): Memory-mapped per-document attributes, None if not built.
+        posting_cache (PostingCache): Cache attached to the index on load, None for no cache.
+        result_cache (ResultCache): Cache of query results, None for no cache.
+        postings_dir (str): Directory holding the posting list `.bin` files.
+        load_seconds (float): Time spent in `load()`, None until loaded.
+        load_phases (dict): Seconds spent loading the 'index', 'doc_store' and 'pagerank'.
+        warm_up_seconds (float): Time spent in `warm_up()`, None until warmed up.
+    """
+
+    def __init__(self, index_loader=load_index, pagerank_loader=load_pagerank,
+                 postings_dir=POSTINGS_DIR, doc_store_loader=load_doc_store, posting_cache=None,
+                 result_cache=None):
+        self._index_loader = index_loader
+        self._pagerank_loader = pagerank_loader
+        self._doc_store_loader = doc_store_loader
+        self.posting_cache = posting_cache
+        self.result_cache = result_cache
+        self._lock = threading.Lock()
+        self.postings_dir = postings_dir
+        self.index = None
+        self.pagerank = None
+        self.docs = None
+        self.load_seconds = None
+        self.load_phases = {}
+        self.warm_up_seconds = None
+
+    def load(self):
+        """ Loads the index and PageRank if they are not resident yet. Safe to call
+            from several threads, only the first call does the work.
+        """
+        if self.is_loaded():
+            return self
+        with self._lock:
+            if not self.is_loaded():
+                t_start = time.time()
+                index = self._index_loader()
+                # nothing cached before this load may be served against the new index
+                self.invalidate_caches()
+                if self.posting_cache is not None:
+                    index.attach_cache(self.posting_cache)
+                t_index = time.time()
+                docs = self._doc_store_loader() if self._doc_store_loader else None
+                t_docs = time.time()
+                # the store holds PageRank as a column, the CSVs are only parsed without it
+                if docs is not None and 'pagerank' in docs.columns:
+                    pagerank = {}
+                else:
+                    pagerank = self._pagerank_loader()
+                self.load_phases = {'index': t_index - t_start, 'doc_store': t_docs - t_index,
+                                    'pagerank': time.time() - t_docs}
+                # publish everything together so readers never see a half loaded state
+                self.docs = docs
+                self.index, self.pagerank = index, pagerank
+                self.load_seconds = time.time() - t_start
+        return self
+
+    def warm_up(self, terms=()):
+        """ Reads the posting arrays of `terms` once, so the first real queries do
+            not pay for cold file handles and page faults, and pre-fills the
+            posting cache until it is full (see warm_terms).
+
+        Args:
+            terms (iterable): Tokens to read, most important first, e.g. the
+                tokens of a query log ordered by frequency.
+
+        Returns:
+            int: Number of posting lists that were read.
+        """
+        self.load()
+        t_start = time.time()
+        n_read = warm_terms(self.index, self.postings_dir, terms)
+        self.warm_up_seconds = time.time() - t_start
+        return n_read
+
+    def is_loaded(self):
+        return self.index is not None and self.pagerank is not None
+
+    def is_ready(self):
+        """ True once the data is loaded and the warm-up step has run. """
+        return self.is_loaded() and self.warm_up_seconds is not None
+
+    def status(self):
+        """ Returns a JSON friendly readiness report. """
+        return {
+            'ready': self.is_ready(),
+            'loaded': self.is_loaded(),
+            'terms': len(self.index.df) if self.index is not None else 0,
+            'pagerank_docs': len(self.pagerank) if self.pagerank is not None else 0,
+            'store_docs': len(self.docs) if self.docs is not None else 0,
+            'load_seconds': self.load_seconds,
+            'load_phases': self.load_phases,
+            'warm_up_seconds': self.warm_up_seconds,
+        }
+
+    def invalidate_caches(self):
+        """ Drops the cached posting lists and results, they belong to the old index. """
+        if self.posting_cache is not None:
+            self.posting_cache.clear()
+        if self.result_cache is not None:
+            self.result_cache.invalidate()
+
+    def release(self):
+        """ Drops the data and caches of a ResidentData that was replaced by a
+            reload, closing the memory maps of the index.
+        """
+        with self._lock:
+            index, self.index = self.index, None
+            self.pagerank = None
+            self.docs = None
+        if index is not None and hasattr(index, 'close'):
+            index.close()
+        self.invalidate_caches()
+
+    def stats(self):
+        """ Returns the counters of the shared caches. """
+        return {
+            'posting_cache': self.posting_cache.stats() if self.posting_cache is not None else None,
+            'result_cache': self.result_cache.stats() if self.result_cache is not None else None,
+        }
+
+
+_resident_data = None
+_resident_lock = threading.Lock()
+
+
+def create_resident_data():
+    """ Returns a new, not yet loaded `ResidentData` with the default caches. """
+    return ResidentData(posting_cache=PostingCache(POSTING_CACHE_BYTES, POSTING_CACHE_POLICY),
+                        result_cache=ResultCache(RESULT_CACHE_ENTRIES, RESULT_CACHE_TTL_SECONDS))
+
+
+def get_resident_data():
+    """ Returns the process-wide `ResidentData` instance, creating it on first use. """
+    global _resident_data
+    if _resident_data is None:
+        with _resident_lock:
+            if _resident_data is None:
+                _resident_data = create_resident_data()
+    return _resident_data
+
+
+def install_resident_data(data):
+    """ Makes `data` the process-wide instance, used after a hot reload. """
+    global _resident_data
+    with _resident_lock:
+        _resident_data = data
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_tokens(tokens):
+    """ Order-insensitive form of a token list (repeated tokens are kept, they
+        change BM25 and TF-IDF scores).
+    """
+    return tuple(sorted(tokens))
+
+
+class ResultCache:
+    """
+    Cache of final query results keyed on endpoint + normalized tokens + ranking
+    parameters, with a time-to-live and LRU eviction past `max_entries`.
+
+    Besides hits and misses it reports the latency saved: every entry remembers
+    how long it took to compute, and each hit adds that time to saved_seconds.
+
+    Args:
+        max_entries (int): Maximum number of cached results.
+        ttl_seconds (float): Seconds a result stays valid.
+        clock (callable): Time source, time.monotonic by default.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (result, expires_at, compute_seconds)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.saved_seconds = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(endpoint, tokens, params=None):
+        return endpoint, normalize_tokens(tokens), tuple(sorted((params or {}).items()))
+
+    def get_or_compute(self, endpoint, tokens, params, compute, cacheable=None):
+        """
+        Returns the cached result of (endpoint, tokens, params), or calls compute()
+        and caches its result.
+
+        Args:
+            endpoint (str): Name of the search method, e.g. 'search_body'.
+            tokens (list): Query tokens from tokenize / og_tokenize.
+            params (dict): Ranking parameters that change the result (weights, k1, b).
+            compute (callable): Function producing the result on a miss.
+            cacheable (callable, optional): Called after compute(), the result is
+                only stored when it returns True (e.g. not for partial results).
+        """
+        key = self.key(endpoint, tokens, params)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += entry[2]
+                return entry[0]
+            self.misses += 1
+            generation = self.generation
+
+        t_start = self._clock()
+        result = compute()
+        compute_seconds = self._clock() - t_start
+
+        with self._lock:
+            # results computed against an index that was reloaded meanwhile are dropped
+            if generation == self.generation and (cacheable is None or cacheable()):
+                self._entries[key] = (result, self._clock() + self.ttl_seconds, compute_seconds)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return result
+
+    def invalidate(self):
+        """ Drops every cached result, called when the index is (re)loaded. """
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        """ Returns a JSON friendly report of the cache counters. """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'saved_seconds': self.saved_seconds,
+        }
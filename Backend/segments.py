@@ -0,0 +1,368 @@
+import os
+import pickle
+import shutil
+import threading
+from collections.abc import Mapping
+from contextlib import closing
+from pathlib import Path
+import numpy as np
+from inverted_index_gcp import InvertedIndex, MultiFileWriter, encode_posting_arrays
+from Backend.index_builder import build_index
+from Backend.tokenizer import tokenize
+
+MANIFEST = 'segments.pkl'
+INDEX_NAME = 'index'
+
+
+class Segment:
+    """
+    One immutable segment: an index written by build_index in its own directory.
+
+    Args:
+        path (Path): Directory of the segment.
+        seq (int): Creation order. A tombstone with a higher seq hides the
+            segment's copy of the document.
+    """
+
+    def __init__(self, path, seq):
+        self.path = Path(path)
+        self.seq = seq
+        self.index = InvertedIndex.read_index(str(self.path), INDEX_NAME)
+        with open(self.path / 'doc_lengths.pickle', 'rb') as f:
+            self.doc_lengths = pickle.load(f)
+
+    @property
+    def name(self):
+        return self.path.name
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+
+class _Snapshot:
+    """ The segments and tombstones a query runs against; replaced, never mutated. """
+
+    def __init__(self, segments, tombstones):
+        self.segments = segments
+        self.tombstones = tombstones
+        # doc_ids each segment must hide, sorted for np.isin
+        self.dead = {}
+        for segment in segments:
+            dead = [doc_id for doc_id, seq in tombstones.items()
+                    if seq > segment.seq and doc_id in segment.doc_lengths]
+            self.dead[segment.name] = np.array(sorted(dead), dtype=np.int64)
+        self.df_cache = {}
+
+    def live(self, segment, doc_ids, tfs):
+        dead = self.dead[segment.name]
+        if len(dead) == 0 or len(doc_ids) == 0:
+            return doc_ids, tfs
+        keep = ~np.isin(doc_ids, dead, assume_unique=True)
+        return doc_ids[keep], tfs[keep]
+
+
+class _SegmentDf(Mapping):
+    """ Global document frequency: live postings over all segments, missing terms -> 0. """
+
+    def __init__(self, index):
+        self._index = index
+
+    def __getitem__(self, w):
+        snapshot = self._index._snapshot
+        df = snapshot.df_cache.get(w)
+        if df is None:
+            df = 0
+            for segment in snapshot.segments:
+                segment_df = segment.index.df.get(w, 0)
+                if segment_df and len(snapshot.dead[segment.name]):
+                    doc_ids, _ = segment.index.read_a_posting_array(str(segment.path), w)
+                    segment_df = len(snapshot.live(segment, doc_ids, doc_ids)[0])
+                df += segment_df
+            snapshot.df_cache[w] = df
+        return df
+
+    def get(self, w, default=0):
+        return self[w] if w in self._index.posting_locs else default
+
+    def __contains__(self, w):
+        return w in self._index.posting_locs
+
+    def __iter__(self):
+        return iter(self._index.posting_locs)
+
+    def __len__(self):
+        return len(self._index.posting_locs)
+
+
+class _SegmentPostingLocs(Mapping):
+    """ term -> [(segment name, posting locations)] over all segments. """
+
+    def __init__(self, index):
+        self._index = index
+
+    def __getitem__(self, w):
+        locs = [(segment.name, segment.index.posting_locs[w])
+                for segment in self._index._snapshot.segments if w in segment.index.posting_locs]
+        if not locs:
+            raise KeyError(w)
+        return locs
+
+    def __contains__(self, w):
+        return any(w in segment.index.posting_locs for segment in self._index._snapshot.segments)
+
+    def __iter__(self):
+        seen = set()
+        for segment in self._index._snapshot.segments:
+            for w in segment.index.posting_locs:
+                if w not in seen:
+                    seen.add(w)
+                    yield w
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class SegmentedIndex:
+    """
+    An index made of small immutable segments, so new and edited articles can be
+    added without a full rebuild.
+
+    Each add_documents call writes a new segment (with its own posting_locs and
+    df) under `base_dir`. Deletes and updates write tombstones: a tombstone
+    hides every copy of the document in segments older than it. Queries fan out
+    over all segments. df, read_a_posting_array and n_docs count only live
+    documents, so idf is global and exact. When there are more than
+    max_segments segments, the merge policy merges the smallest merge_factor
+    segments into one and drops their dead postings. It runs in a background
+    thread and swaps the manifest atomically.
+
+    Provides the read side of InvertedIndex (df, posting_locs, read_a_posting_array,
+    read_a_posting_list), so it can be passed to the rankers and BM25Engine. Each
+    segment reads from its own directory, so the `base_dir` argument of the read
+    methods is ignored.
+
+    Args:
+        base_dir (str): Directory holding the segments and the manifest.
+        max_segments (int): Segment count above which segments are merged.
+        merge_factor (int): Number of segments merged at a time.
+        tokenizer (callable): Tokenizer used for new documents.
+    """
+
+    def __init__(self, base_dir, max_segments=10, merge_factor=4, tokenizer=tokenize):
+        self.base_dir = Path(base_dir)
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.max_segments = max_segments
+        self.merge_factor = merge_factor
+        self.tokenizer = tokenizer
+        self._lock = threading.RLock()  # serializes writers, readers use _snapshot
+        self._merge_lock = threading.Lock()  # one merge at a time
+        self._merge_thread = None
+        self._retired = []  # merged segments, deleted once no query can still read them
+        self.df = _SegmentDf(self)
+        self.posting_locs = _SegmentPostingLocs(self)
+        self.posting_cache = None
+
+        manifest = self._read_manifest()
+        self._next_seq = manifest['next_seq']
+        self._snapshot = _Snapshot([Segment(self.base_dir / name, seq) for name, seq in manifest['segments']],
+                                   manifest['tombstones'])
+
+    def _read_manifest(self):
+        path = self.base_dir / MANIFEST
+        if not path.exists():
+            return {'segments': [], 'tombstones': {}, 'next_seq': 0}
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def _publish(self, segments, tombstones):
+        """ Persists and installs a new snapshot; the manifest is replaced atomically. """
+        oldest = min((segment.seq for segment in segments), default=self._next_seq)
+        # tombstones older than every segment cannot hide anything anymore
+        tombstones = {doc_id: seq for doc_id, seq in tombstones.items() if seq > oldest}
+        manifest = {'segments': [(segment.name, segment.seq) for segment in segments],
+                    'tombstones': tombstones, 'next_seq': self._next_seq}
+        tmp_path = self.base_dir / (MANIFEST + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(manifest, f)
+        os.replace(tmp_path, self.base_dir / MANIFEST)
+        snapshot = _Snapshot(segments, tombstones)
+        if self.posting_cache is not None:
+            for segment in segments:
+                segment.index.attach_cache(self.posting_cache)
+        self._snapshot = snapshot
+
+    @property
+    def segments(self):
+        return list(self._snapshot.segments)
+
+    @property
+    def n_docs(self):
+        snapshot = self._snapshot
+        return sum(len(segment) - len(snapshot.dead[segment.name]) for segment in snapshot.segments)
+
+    def doc_lengths(self):
+        """ Returns a doc_id -> length dictionary of the live documents. """
+        snapshot = self._snapshot
+        lengths = {}
+        for segment in snapshot.segments:
+            dead = set(snapshot.dead[segment.name].tolist())
+            lengths.update((doc_id, length) for doc_id, length in segment.doc_lengths.items()
+                           if doc_id not in dead)
+        return lengths
+
+    def add_documents(self, docs, workers=1):
+        """
+        Indexes (doc_id, text) pairs as a new segment. Documents already in the
+        index are replaced.
+
+        Returns:
+            Segment: The new segment.
+        """
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            path = self.base_dir / f'segment_{seq:06}'
+            build_index(docs, str(path), INDEX_NAME, tokenizer=self.tokenizer, workers=workers)
+            segment = Segment(path, seq)
+            tombstones = dict(self._snapshot.tombstones)
+            for old in self._snapshot.segments:
+                for doc_id in old.doc_lengths.keys() & segment.doc_lengths.keys():
+                    tombstones[doc_id] = seq
+            self._publish(self._snapshot.segments + [segment], tombstones)
+        self.maybe_merge(background=True)
+        return segment
+
+    def delete_documents(self, doc_ids):
+        """ Tombstones doc_ids in every current segment. """
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            tombstones = dict(self._snapshot.tombstones)
+            tombstones.update((doc_id, seq) for doc_id in doc_ids)
+            self._publish(self._snapshot.segments, tombstones)
+
+    def maybe_merge(self, background=False):
+        """
+        Merges segments while there are more than max_segments of them.
+
+        Args:
+            background (bool): Run the merges in a background thread (one at a time).
+        """
+        if not background:
+            with self._merge_lock:
+                while len(self._snapshot.segments) > self.max_segments:
+                    self._merge_smallest()
+            return
+        with self._lock:
+            if len(self._snapshot.segments) <= self.max_segments:
+                return
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return
+            self._merge_thread = threading.Thread(target=self.maybe_merge, daemon=True)
+            self._merge_thread.start()
+
+    def wait_for_merges(self):
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    def _merge_smallest(self):
+        """ Merges the merge_factor smallest segments into one, dropping dead postings. """
+        snapshot = self._snapshot
+        victims = sorted(snapshot.segments, key=len)[:max(2, self.merge_factor)]
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+        path = self.base_dir / f'segment_{seq:06}'
+        merged = self._write_merged(victims, snapshot, path)
+
+        with self._lock:
+            # segments and tombstones added meanwhile are kept; tombstones newer
+            # than the merge still hide documents of the merged segment
+            merged.seq = max(victim.seq for victim in victims)
+            victim_names = {victim.name for victim in victims}
+            segments = [segment for segment in self._snapshot.segments if segment.name not in victim_names]
+            segments.append(merged)
+            segments.sort(key=lambda segment: segment.seq)
+            self._publish(segments, self._snapshot.tombstones)
+            retired, self._retired = self._retired, victims
+        # segments retired by the previous merge are no longer referenced by any snapshot
+        for segment in retired:
+            segment.index.close()
+            shutil.rmtree(segment.path, ignore_errors=True)
+
+    def _write_merged(self, victims, snapshot, path):
+        """ Streams the live postings of `victims` into one segment at `path`,
+            term by term, as a single posting file bucket.
+        """
+        index = InvertedIndex()
+        doc_lengths = {}
+        for victim in victims:
+            dead = set(snapshot.dead[victim.name].tolist())
+            doc_lengths.update((doc_id, length) for doc_id, length in victim.doc_lengths.items()
+                               if doc_id not in dead)
+        terms = sorted({w for victim in victims for w in victim.index.posting_locs})
+        path.mkdir(parents=True, exist_ok=True)
+        with closing(MultiFileWriter(str(path), 0)) as writer:
+            for w in terms:
+                doc_ids, tfs = [], []
+                for victim in victims:
+                    if w in victim.index.posting_locs:
+                        ids, counts = victim.index.read_a_posting_array(str(victim.path), w)
+                        ids, counts = snapshot.live(victim, ids, counts)
+                        doc_ids.append(ids)
+                        tfs.append(counts)
+                doc_ids, tfs = np.concatenate(doc_ids), np.concatenate(tfs)
+                if len(doc_ids) == 0:
+                    continue
+                order = np.argsort(doc_ids, kind='stable')
+                doc_ids, tfs = doc_ids[order], tfs[order]
+                # store file names relative to the segment, like build_index does
+                index.posting_locs[w] = [(Path(f_name).name, offset) for f_name, offset
+                                         in writer.write(encode_posting_arrays(doc_ids, tfs))]
+                index.df[w] = len(doc_ids)
+                index.term_total[w] = int(tfs.sum())
+        with open(path / '0_posting_locs.pickle', 'wb') as f:
+            pickle.dump(index.posting_locs, f)
+        index.write_index(str(path), INDEX_NAME)
+        with open(path / 'doc_lengths.pickle', 'wb') as f:
+            pickle.dump(doc_lengths, f)
+        return Segment(path, 0)
+
+    def attach_cache(self, cache):
+        """ Shares a posting cache between all segments, see InvertedIndex.attach_cache. """
+        self.posting_cache = cache
+        for segment in self._snapshot.segments:
+            segment.index.attach_cache(cache)
+
+    def read_a_posting_array(self, base_dir, w, bucket_name=None):
+        """ Returns the live postings of `w` over all segments as (doc_ids, tfs)
+            arrays sorted by doc_id.
+        """
+        snapshot = self._snapshot
+        doc_ids, tfs = [], []
+        for segment in snapshot.segments:
+            if w in segment.index.posting_locs:
+                ids, counts = segment.index.read_a_posting_array(str(segment.path), w)
+                ids, counts = snapshot.live(segment, ids, counts)
+                doc_ids.append(ids)
+                tfs.append(counts)
+        if not doc_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        doc_ids, tfs = np.concatenate(doc_ids), np.concatenate(tfs)
+        if len(doc_ids) > 1 and np.any(np.diff(doc_ids) < 0):
+            order = np.argsort(doc_ids, kind='stable')
+            doc_ids, tfs = doc_ids[order], tfs[order]
+        return doc_ids, tfs
+
+    def read_a_posting_list(self, base_dir, w, bucket_name=None):
+        doc_ids, tfs = self.read_a_posting_array(base_dir, w, bucket_name)
+        return list(zip(doc_ids.tolist(), tfs.tolist()))
+
+    def read_posting_arrays(self, base_dir, words, bucket_name=None):
+        return {w: self.read_a_posting_array(base_dir, w) for w in dict.fromkeys(words) if w in self.posting_locs}
+
+    def close(self):
+        self.wait_for_merges()
+        for segment in self._snapshot.segments + self._retired:
+            segment.index.close()
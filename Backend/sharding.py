@@ -0,0 +1,270 @@
+import os
+import math
+import heapq
+import pickle
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from multiprocessing.connection import Listener, Client
+from operator import itemgetter
+from pathlib import Path
+from Backend.field_indexes import open_index
+from Backend.index_builder import build_index
+from Backend.ranking import BM25Engine, bm25_top_k_from_arrays
+
+# Shared secret of the shard connections, set SHARD_AUTHKEY on every node. The
+# connections unpickle what they receive, so there is no default key.
+SHARD_AUTHKEY = os.environ.get('SHARD_AUTHKEY', '').encode() or None
+SHARD_INDEX_NAME = 'index'
+
+
+def _authkey(authkey=None):
+    """ Returns `authkey`, SHARD_AUTHKEY by default, RuntimeError if neither is set. """
+    authkey = authkey or SHARD_AUTHKEY
+    if not authkey:
+        raise RuntimeError("SHARD_AUTHKEY is not set: shard connections unpickle requests "
+                           "and must not run without a shared secret")
+    return authkey
+
+
+def shard_of(doc_id, n_shards):
+    """ The shard holding doc_id: documents are partitioned by doc_id modulo n_shards. """
+    return doc_id % n_shards
+
+
+def shard_dirs(base_dir, n_shards):
+    return [str(Path(base_dir) / f'shard_{shard:03}') for shard in range(n_shards)]
+
+
+def build_shards(docs, base_dir, n_shards, **build_kwargs):
+    """
+    Builds one index per shard with build_index, in `base_dir`/shard_XXX.
+
+    Args:
+        docs (iterable): (doc_id, text) pairs. It is iterated once per shard, so it
+            must be re-iterable (a list, or an object re-reading a dump in __iter__).
+        base_dir (str): Output directory.
+        n_shards (int): Number of shards.
+        build_kwargs: Passed to build_index (tokenizer, workers, ...). min_df is
+            applied per shard, keep it at 1 to match an unsharded index.
+
+    Returns:
+        list: The shard directories, in shard order.
+    """
+    dirs = shard_dirs(base_dir, n_shards)
+    for shard, shard_dir in enumerate(dirs):
+        build_index(((doc_id, text) for doc_id, text in docs if shard_of(doc_id, n_shards) == shard),
+                    shard_dir, SHARD_INDEX_NAME, **build_kwargs)
+    return dirs
+
+
+class ShardEngine:
+    """
+    BM25 over the index of one shard.
+
+    Scores use the statistics of the whole collection, sent by the coordinator,
+    instead of the shard's own: idf from the global df and N, and the global
+    average document length. A document therefore gets the same score it would
+    get in an unsharded index.
+
+    Args:
+        shard_dir (str): Directory written by build_shards (index and doc_lengths.pickle).
+        name (str): Name of the index pickle.
+    """
+
+    def __init__(self, shard_dir, name=SHARD_INDEX_NAME):
+        self.shard_dir = shard_dir
+        self.index = open_index(shard_dir, name)
+        with open(Path(shard_dir) / 'doc_lengths.pickle', 'rb') as f:
+            doc_lengths = pickle.load(f)
+        self.n_docs = len(doc_lengths)
+        self.total_length = float(sum(doc_lengths.values()))
+        self.bm25 = BM25Engine(self.index, doc_lengths, self.total_length / max(self.n_docs, 1),
+                               self.n_docs, base_dir=shard_dir)
+
+    def info(self):
+        """ Collection statistics of this shard that do not depend on the query. """
+        return {'n_docs': self.n_docs, 'total_length': self.total_length}
+
+    def df(self, tokens):
+        """ Local document frequency of the tokens found in this shard. """
+        return {token: self.index.df[token] for token in set(tokens) if token in self.index.df}
+
+    def top_k(self, tokens, idf, avg_doc_length, k=100, k1=1.2, b=0.75):
+        """
+        The shard's k best (doc_id, score) pairs, scored with the global idf
+        (token -> idf) and average document length.
+        """
+        postings = self.index.read_posting_arrays(self.shard_dir, [t for t in tokens if t in idf])
+        term_arrays = [self.bm25.term_arrays(token, postings[token])[:3] + (idf[token],)
+                       for token in tokens if token in postings]
+        return bm25_top_k_from_arrays(term_arrays, avg_doc_length, k, k1, b)
+
+    def handle(self, method, *args):
+        if method not in ('info', 'df', 'top_k'):
+            raise ValueError(f'unknown shard method {method!r}')
+        return getattr(self, method)(*args)
+
+
+def _serve_connection(engine, conn):
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+            try:
+                conn.send(('ok', engine.handle(*request)))
+            except Exception as e:
+                conn.send(('error', repr(e)))
+
+
+def serve_shard(shard_dir, address=('127.0.0.1', 0), authkey=None, ready=None):
+    """
+    Serves one shard over multiprocessing connections, one thread per coordinator
+    connection. Runs until the process is stopped.
+
+    Args:
+        shard_dir (str): The shard's directory.
+        address (tuple): (host, port) to listen on, port 0 picks a free one.
+        authkey (bytes, optional): Shared secret of the connections, SHARD_AUTHKEY by default.
+        ready (Connection, optional): Receives the bound address once the shard is loaded.
+    """
+    authkey = _authkey(authkey)
+    engine = ShardEngine(shard_dir)
+    with Listener(address, authkey=authkey) as listener:
+        if ready is not None:
+            ready.send(listener.address)
+            ready.close()
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_serve_connection, args=(engine, conn), daemon=True).start()
+
+
+class ShardClient:
+    """ Connection to one shard server; calls are serialized on the connection. """
+
+    def __init__(self, address, authkey=None):
+        self.address = tuple(address)
+        self._conn = Client(self.address, authkey=_authkey(authkey))
+        self._lock = threading.Lock()
+
+    def call(self, method, *args):
+        with self._lock:
+            self._conn.send((method,) + args)
+            status, result = self._conn.recv()
+        if status != 'ok':
+            raise RuntimeError(f'shard {self.address}: {result}')
+        return result
+
+    def close(self):
+        self._conn.close()
+
+
+class ShardCoordinator:
+    """
+    Scatter-gather BM25 over doc-id partitioned shards.
+
+    A query is answered in two rounds sent to all shards in parallel: the local
+    df of the query tokens, summed into the global df and idf, then each shard's
+    top k scored with those global statistics. The per-shard top k lists are
+    merged into the global top k. N and the average document length are summed
+    once, when the coordinator connects.
+
+    Args:
+        addresses (list): (host, port) of every shard server.
+        authkey (bytes, optional): Shared secret of the shard connections, SHARD_AUTHKEY by default.
+    """
+
+    def __init__(self, addresses, authkey=None):
+        authkey = _authkey(authkey)
+        self.shards = [ShardClient(address, authkey) for address in addresses]
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards))
+        infos = self._scatter('info')
+        self.n_docs = sum(info['n_docs'] for info in infos)
+        self.avg_doc_length = sum(info['total_length'] for info in infos) / max(self.n_docs, 1)
+
+    def _scatter(self, method, *args):
+        return list(self._pool.map(lambda shard: shard.call(method, *args), self.shards))
+
+    def global_idf(self, tokens):
+        """ token -> idf over the whole collection, for the tokens found in any shard. """
+        df = {}
+        for shard_df in self._scatter('df', list(tokens)):
+            for token, n in shard_df.items():
+                df[token] = df.get(token, 0) + n
+        return {token: math.log(self.n_docs / n, 10) for token, n in df.items()}
+
+    def top_k(self, tokens, k=100, k1=1.2, b=0.75):
+        """
+        Returns the k best (doc_id, score) pairs of the whole collection.
+        """
+        idf = self.global_idf(tokens)
+        if not idf:
+            return []
+        shard_results = self._scatter('top_k', list(tokens), idf, self.avg_doc_length, k, k1, b)
+        return heapq.nlargest(k, chain.from_iterable(shard_results), key=itemgetter(1))
+
+    def close(self):
+        self._pool.shutdown()
+        for shard in self.shards:
+            shard.close()
+
+
+class LocalShards:
+    """
+    Starts one shard server process per shard directory on this host, standing in
+    for one node per shard. Use as a context manager; `addresses` lists where the
+    shards listen.
+
+    Args:
+        dirs (list): Shard directories, see build_shards.
+        authkey (bytes, optional): Shared secret of the shard connections, SHARD_AUTHKEY by default.
+    """
+
+    def __init__(self, dirs, authkey=None):
+        authkey = _authkey(authkey)
+        self.processes = []
+        self.addresses = []
+        for shard_dir in dirs:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=serve_shard, daemon=True,
+                                              args=(shard_dir, ('127.0.0.1', 0), authkey, sender))
+            process.start()
+            sender.close()
+            self.processes.append(process)
+            try:
+                self.addresses.append(receiver.recv())
+            except EOFError:
+                self.close()
+                raise RuntimeError(f'shard {shard_dir} failed to start')
+            finally:
+                receiver.close()
+
+    def close(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    # on every node: SHARD_AUTHKEY=... python -m Backend.sharding data/shards/shard_000 --host <private ip>
+    parser = argparse.ArgumentParser(description="Serve one index shard.")
+    parser.add_argument('shard_dir')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="address to listen on, bind a private network address only")
+    parser.add_argument('--port', type=int, default=9000)
+    args = parser.parse_args()
+    try:
+        serve_shard(args.shard_dir, (args.host, args.port))
+    except RuntimeError as e:
+        parser.exit(1, f"{e}\n")
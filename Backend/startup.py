@@ -0,0 +1,45 @@
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """
+    Records how long each phase of the server start takes (imports, index
+    load, warm-up, ...), in the order the phases ran.
+
+    Attributes:
+        phases (dict): Phase name -> seconds.
+        started_at (float): time.time() when the timer was created.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        """ Times the enclosed block as phase `name`. """
+        t_start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - t_start)
+
+    def record(self, name, seconds):
+        """ Adds `seconds` to phase `name`, for phases timed elsewhere. """
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def report(self):
+        """ Returns a JSON friendly report of the phases and the time since start. """
+        return {
+            'phases': {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            'total_seconds': round(time.time() - self.started_at, 4),
+        }
+
+    def print_report(self):
+        report = self.report()
+        width = max([len(name) for name in report['phases']] + [5])
+        print("⏱ Startup timing:")
+        for name, seconds in report['phases'].items():
+            print(f"  {name:<{width}} {seconds:8.3f}s")
+        print(f"  {'total':<{width}} {report['total_seconds']:8.3f}s")
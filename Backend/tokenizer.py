@@ -1,40 +1,117 @@
 import re
-from nltk.corpus import stopwords
-from nltk import PorterStemmer
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from Backend.stopwords import ENGLISH_STOPWORDS, CORPUS_STOPWORDS
 
-# Exact same stopwords from GCP notebook
-english_stopwords = frozenset(stopwords.words('english'))
-corpus_stopwords = ["category", "references", "also", "external", "links",
-                    "may", "first", "see", "history", "people", "one", "two",
-                    "part", "thumb", "including", "second", "following",
-                    "many", "however", "would", "became"]
+# Exact same stopwords from GCP notebook, bundled (see Backend/stopwords.py)
+english_stopwords = frozenset(ENGLISH_STOPWORDS)
+corpus_stopwords = list(CORPUS_STOPWORDS)
 
 all_stopwords = english_stopwords.union(corpus_stopwords)
 RE_WORD = re.compile(r"""[\#\@\w](['\-]?\w){2,24}""", re.UNICODE)
 
+# Distinct words cached by a stemming TokenizerEngine
+STEM_CACHE_SIZE = 2 ** 18
+
+
+class TokenizerEngine:
+    """
+    Tokenizer with all of its state built once: the stopword set, the compiled
+    word regex and, when stemming, one PorterStemmer behind a bounded LRU cache
+    (the Wikipedia vocabulary repeats heavily, so most words are stemmed once).
+
+    tokenize_many() tokenizes a stream of documents, optionally in a process
+    pool, and yields the token lists in input order.
+
+    Args:
+        stem (bool): Porter-stem the tokens (as tokenize_stemmed does).
+        stop_words (frozenset): Tokens to drop before stemming.
+        stem_cache_size (int): Maximum number of cached stems.
+    """
+
+    def __init__(self, stem=False, stop_words=all_stopwords, stem_cache_size=STEM_CACHE_SIZE):
+        self.stem = stem
+        self.stop_words = frozenset(stop_words)
+        self.stem_cache_size = stem_cache_size
+        self._stem = None
+
+    def _init_stemmer(self):
+        # nltk is imported on first use, it is slow to import
+        from nltk import PorterStemmer
+        self._stem = lru_cache(maxsize=self.stem_cache_size)(PorterStemmer().stem)
+        return self._stem
+
+    def __getstate__(self):
+        # the cache is per process, workers start with an empty one
+        state = self.__dict__.copy()
+        state['_stem'] = None
+        return state
+
+    def tokenize(self, text):
+        stop_words = self.stop_words
+        tokens = [token.group() for token in RE_WORD.finditer(text.lower())]
+        if not self.stem:
+            return [t for t in tokens if t not in stop_words]
+        stem = self._stem or self._init_stemmer()
+        return [stem(t) for t in tokens if t not in stop_words]
+
+    __call__ = tokenize
+
+    def _tokenize_chunk(self, texts):
+        return [self.tokenize(text) for text in texts]
+
+    def tokenize_many(self, texts, workers=1, chunk_size=1000):
+        """
+        Tokenizes a stream of texts.
+
+        Args:
+            texts (iterable): The texts, read lazily.
+            workers (int): Number of processes, 1 tokenizes in the calling process.
+            chunk_size (int): Number of texts sent to a worker at once.
+
+        Yields:
+            list: The tokens of every text, in input order.
+        """
+        texts = iter(texts)
+        chunks = iter(lambda: list(islice(texts, chunk_size)), [])
+        if workers <= 1:
+            for chunk in chunks:
+                yield from self._tokenize_chunk(chunk)
+            return
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # at most 2 chunks per worker in flight, the stream is never read as a whole
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(self._tokenize_chunk, chunk))
+                if len(pending) >= 2 * workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+    def cache_info(self):
+        """ Hit/miss counters of the stem cache, None before the first stemmed token. """
+        return None if self._stem is None else self._stem.cache_info()
+
+
+# Shared engines behind the module functions; the functions stay picklable
+# (e.g. for build_index), every process builds its own engines on import
+_engine = TokenizerEngine()
+_stemmed_engine = TokenizerEngine(stem=True)
+
+
 def tokenize(text):
     """
     Tokenize text and remove stopwords.
     Matches the tokenization from GCP notebook exactly.
     """
-    tokens = [token.group() for token in RE_WORD.finditer(text.lower())]
-    return [t for t in tokens if t not in all_stopwords]
+    return _engine.tokenize(text)
 
 def tokenize_stemmed(text):
-    stemmer = PorterStemmer()
-    tokens = [token.group() for token in RE_WORD.finditer(text.lower())]
-    stemmed = [stemmer.stem(token) for token in tokens if token not in all_stopwords]
-    return stemmed
+    return _stemmed_engine.tokenize(text)
 
 
 def og_tokenize(query):
-    english_sw = frozenset(stopwords.words('english'))
-    corpus_sw = ["category", "references", "also", "external", "links",
-                        "may", "first", "see", "history", "people", "one", "two",
-                        "part", "thumb", "including", "second", "following",
-                        "many", "however", "would", "became"]
-
-    all_sw = english_sw.union(corpus_sw)
-    RE_W = re.compile(r"""[\#\@\w](['\-]?\w){2,24}""", re.UNICODE)
-    tokens = [token.group() for token in RE_W.finditer(query.lower())]
-    return [token for token in tokens if token not in all_sw]
\ No newline at end of file
+    # same tokens as tokenize, kept for the raw-token (og_*) indexes
+    return _engine.tokenize(query)
@@ -1,27 +1,87 @@
 import sys
 from collections import Counter, OrderedDict
+from collections.abc import Mapping
 import itertools
 from itertools import islice, count, groupby
-import pandas as pd
 import os
 import re
 from operator import itemgetter
 from time import time
 from pathlib import Path
 import pickle
-from google.cloud import storage
+import numpy as np
+import mmap
+import threading
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from collections import defaultdict
 from contextlib import closing
 
 PROJECT_ID = 'YOUR-PROJECT-ID-HERE'
+# one storage.Client per process, buckets are created once and reused
+_storage_client = None
+_buckets = {}
+_buckets_lock = threading.Lock()
+
 def get_bucket(bucket_name):
-    return storage.Client(PROJECT_ID).bucket(bucket_name)
+    """ Returns `bucket_name` through the process-wide storage.Client. Set
+        STORAGE_EMULATOR_HOST to run against a local GCS emulator.
+    """
+    global _storage_client
+    with _buckets_lock:
+        bucket = _buckets.get(bucket_name)
+        if bucket is None:
+            if _storage_client is None:
+                # imported on first use, google.cloud is slow to import
+                from google.cloud import storage
+                _storage_client = storage.Client(PROJECT_ID)
+            bucket = _buckets[bucket_name] = _storage_client.bucket(bucket_name)
+        return bucket
+
+def register_bucket(bucket_name, bucket):
+    """ Makes get_bucket(bucket_name) return `bucket`, e.g. a LocalBucket. """
+    with _buckets_lock:
+        _buckets[bucket_name] = bucket
 
 def _open(path, mode, bucket=None):
     if bucket is None:
         return open(path, mode)
     return bucket.blob(path).open(mode)
 
+class LocalBlob:
+    """ Filesystem stand-in for the parts of google.cloud.storage.Blob used here. """
+    def __init__(self, bucket, name):
+        self.name = name
+        self._bucket = bucket
+        self._path = bucket.root / name
+
+    def open(self, mode):
+        if 'w' in mode:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+        return open(self._path, mode)
+
+    def download_as_bytes(self, start=None, end=None):
+        # like GCS, `end` is inclusive
+        with self._bucket._lock:
+            self._bucket.range_requests += 1
+        start = start or 0
+        with open(self._path, 'rb') as f:
+            f.seek(start)
+            return f.read(-1 if end is None else end + 1 - start)
+
+class LocalBucket:
+    """ Filesystem stand-in for a GCS bucket rooted at `root`, for tests and
+        development without GCS access (see register_bucket). Counts the range
+        requests it serves.
+    """
+    def __init__(self, root):
+        self.root = Path(root)
+        self.range_requests = 0
+        self._lock = threading.Lock()
+
+    def blob(self, name):
+        return LocalBlob(self, name)
+
 # Let's start with a small block size of 30 bytes just to test things out. 
 BLOCK_SIZE = 1999998
 
@@ -83,9 +143,310 @@ class MultiFileReader:
         self.close()
         return False 
 
+def file_ranges(locs, n_bytes):
+    """ Splits a posting list read of `n_bytes` at `locs` into per-file
+        (f_name, start, end) byte ranges, end exclusive.
+    """
+    ranges = []
+    for f_name, offset in locs:
+        if n_bytes <= 0:
+            break
+        n_read = min(n_bytes, BLOCK_SIZE - offset)
+        ranges.append((f_name, offset, offset + n_read))
+        n_bytes -= n_read
+    return ranges
+
+def merge_ranges(ranges, max_gap=0):
+    """ Merges byte ranges of the same file that overlap, touch or are at most
+        `max_gap` bytes apart, so they are fetched with a single request.
+    """
+    merged = []
+    for f_name, start, end in sorted(ranges):
+        if merged and merged[-1][0] == f_name and start <= merged[-1][2] + max_gap:
+            merged[-1] = (f_name, merged[-1][1], max(merged[-1][2], end))
+        else:
+            merged.append((f_name, start, end))
+    return merged
+
+class RangeFetcher:
+    """ Concurrent byte-range reader of posting files in a GCS bucket.
+
+        Instead of opening a blob stream per file and reading one posting list
+        at a time (MultiFileReader), fetch() takes the reads of a whole query,
+        merges adjacent ranges of the same file and issues the range requests
+        at once from a thread pool. Meant to stay open across queries.
+
+    Parameters:
+    -----------
+        base_dir: str
+            Directory of the posting files inside the bucket.
+        bucket: google.cloud.storage.Bucket or LocalBucket
+        max_workers: int
+            Number of concurrent range requests.
+        max_gap: int
+            Ranges at most this many bytes apart are merged into one request.
+    """
+    def __init__(self, base_dir, bucket, max_workers=16, max_gap=0):
+        self._base_dir = Path(base_dir)
+        self._bucket = bucket
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_gap = max_gap
+
+    def _get(self, byte_range):
+        f_name, start, end = byte_range
+        blob = self._bucket.blob(str(self._base_dir / f_name))
+        return blob.download_as_bytes(start=start, end=end - 1)  # GCS ranges are inclusive
+
+    def fetch(self, reads):
+        """ Reads many posting lists at once.
+
+        Parameters:
+        -----------
+            reads: dict
+                key -> (locs, n_bytes) of every posting list to read.
+
+        Returns:
+        --------
+            dict: key -> bytes.
+        """
+        pieces = {key: file_ranges(locs, n_bytes) for key, (locs, n_bytes) in reads.items()}
+        requests = merge_ranges([r for ranges in pieces.values() for r in ranges], self.max_gap)
+        fetched = defaultdict(list)  # f_name -> [(start, bytes)] sorted by start
+        for (f_name, start, _), b in zip(requests, self._pool.map(self._get, requests)):
+            fetched[f_name].append((start, b))
+        starts = {f_name: [start for start, _ in blocks] for f_name, blocks in fetched.items()}
+
+        result = {}
+        for key, ranges in pieces.items():
+            parts = []
+            for f_name, start, end in ranges:
+                block_start, b = fetched[f_name][bisect_right(starts[f_name], start) - 1]
+                parts.append(b[start - block_start:end - block_start])
+            result[key] = b''.join(parts)
+        return result
+
+    def read(self, locs, n_bytes):
+        """ Reads a single posting list, same interface as MultiFileReader.read. """
+        return self.fetch({None: (locs, n_bytes)})[None]
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+class MmapFileReader:
+    """ Persistent reader of local posting files that memory-maps each file once
+        and returns zero-copy memoryview slices of it. Unlike MultiFileReader it
+        is meant to stay open across queries, files are mapped on first use.
+    """
+    def __init__(self, base_dir):
+        self._base_dir = Path(base_dir)
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def _map(self, f_name):
+        m = self._maps.get(f_name)
+        if m is None:
+            with self._lock:
+                m = self._maps.get(f_name)
+                if m is None:
+                    with open(self._base_dir / f_name, 'rb') as f:
+                        # mmap keeps its own handle, the file can be closed right away
+                        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+                            if os.fstat(f.fileno()).st_size > 0 else b''
+                    self._maps[f_name] = m
+        return m
+
+    def read(self, locs, n_bytes):
+        """ Returns a memoryview over `n_bytes` starting at `locs`. The view is
+            zero-copy unless the posting list spans more than one file.
+        """
+        views = []
+        for f_name, offset in locs:
+            if n_bytes <= 0:
+                break
+            n_read = min(n_bytes, BLOCK_SIZE - offset)
+            views.append(memoryview(self._map(f_name))[offset:offset + n_read])
+            n_bytes -= n_read
+        if len(views) == 1:
+            return views[0]
+        return memoryview(b''.join(views))
+
+    def close(self):
+        with self._lock:
+            maps, self._maps = self._maps, {}
+        for m in maps.values():
+            try:
+                m.close()
+            except (AttributeError, BufferError):
+                # empty files map to b'' and views still held by callers keep
+                # their mapping alive, it is released once they are collected
+                pass
+
 TUPLE_SIZE = 6       # We're going to pack the doc_id and tf values in this 
                      # many bytes.
 TF_MASK = 2 ** 16 - 1 # Masking the 16 low bits of an integer
+# The same layout as a structured dtype: a big-endian 4-byte doc_id followed by
+# the 2 low (TF_MASK) bytes of the tf.
+POSTING_DTYPE = np.dtype([('doc_id', '>u4'), ('tf', '>u2')])
+assert POSTING_DTYPE.itemsize == TUPLE_SIZE
+
+def decode_posting_list(b, n=None):
+    """ Decodes the packed posting bytes `b` in one shot.
+    Parameters:
+    -----------
+      b: bytes-like of (doc_id, tf) tuples, TUPLE_SIZE bytes each.
+      n: number of postings to decode (default: all of `b`).
+    Returns:
+    --------
+      (doc_ids, tfs): parallel native-endian int64 / int32 NumPy arrays.
+    """
+    postings = np.frombuffer(b, dtype=POSTING_DTYPE, count=-1 if n is None else n)
+    return postings['doc_id'].astype(np.int64), postings['tf'].astype(np.int32)
+
+def search_sorted_postings(postings, doc_ids):
+    """ Vectorized binary search of `doc_ids` in the doc_id-sorted structured
+        `postings` array. Only O(len(doc_ids) * log(len(postings))) entries are
+        touched, so a memory-mapped list is not read in full.
+    Returns:
+    --------
+      (positions, found): insertion positions and a boolean mask of the hits.
+    """
+    n = len(postings)
+    targets = np.asarray(doc_ids, dtype=np.int64)
+    lo = np.zeros(len(targets), dtype=np.int64)
+    hi = np.full(len(targets), n, dtype=np.int64)
+    active = np.nonzero(lo < hi)[0]
+    while len(active):
+        mid = (lo[active] + hi[active]) // 2
+        go_right = postings['doc_id'][mid].astype(np.int64) < targets[active]
+        lo[active[go_right]] = mid[go_right] + 1
+        hi[active[~go_right]] = mid[~go_right]
+        active = active[lo[active] < hi[active]]
+    found = lo < n
+    found[found] = postings['doc_id'][lo[found]].astype(np.int64) == targets[found]
+    return lo, found
+
+def _empty_posting_arrays():
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+
+#### POSTING FORMATS ####
+# Version 1 is the fixed-size TUPLE_SIZE layout above, as written by the GCP
+# notebook. Version 2 compresses each posting list:
+#   header      n_bytes (>u4, whole list incl. header), n_blocks (>u4)
+#   skip table  n_blocks x (last_doc_id >u4, end >u4), `end` being the offset
+#               of the block end from the start of the block data
+#   blocks      POSTINGS_PER_BLOCK postings each (the last one may be shorter):
+#               varint doc_id gaps, then varint tfs. Gaps chain across blocks,
+#               the first gap of a block is relative to the previous block's
+#               last doc_id (and to 0 for the first block).
+# The impact-ordered format keeps the version 1 tuples but orders each list by
+# tier of decreasing quantized BM25 contribution, doc_id order within a tier
+# (see BM25Engine.write_impact_ordered). index.tier_ends[w] holds the
+# cumulative end of each tier, so the best postings are a prefix of the list.
+POSTING_FORMAT_V1 = 1
+POSTING_FORMAT_V2 = 2
+POSTING_FORMAT_IMPACT = 3
+POSTINGS_PER_BLOCK = 128
+V2_HEADER_DTYPE = np.dtype([('n_bytes', '>u4'), ('n_blocks', '>u4')])
+V2_SKIP_DTYPE = np.dtype([('last_doc_id', '>u4'), ('end', '>u4')])
+
+def varint_encode(values):
+    """ Encodes non-negative integers (< 2**35) as LEB128 varints, 7 bits per
+        byte, high bit set on every byte but the last of a value.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28):
+        n_bytes += values >= (1 << shift)
+    starts = np.cumsum(n_bytes) - n_bytes
+    out = np.empty(int(n_bytes.sum()), dtype=np.uint8)
+    for j in range(int(n_bytes.max()) if len(values) else 0):
+        has_byte = n_bytes > j
+        chunk = (values[has_byte] >> np.uint64(7 * j)) & np.uint64(0x7f)
+        more = (n_bytes[has_byte] > j + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[has_byte] + j] = chunk | more
+    return out.tobytes()
+
+def varint_decode(b):
+    """ Decodes a LEB128 varint byte string into an int64 array. """
+    data = np.frombuffer(b, dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=np.int64)
+    ends = np.nonzero(data < 0x80)[0]
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    value_of_byte = np.repeat(np.arange(len(starts)), ends - starts + 1)
+    shifts = (np.arange(len(data)) - starts[value_of_byte]) * 7
+    parts = (data & 0x7f).astype(np.int64) << shifts
+    return np.add.reduceat(parts, starts)
+
+def encode_posting_list_v2(doc_ids, tfs):
+    """ Encodes parallel (doc_ids, tfs) arrays into the version 2 layout. """
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    tfs = np.asarray(tfs, dtype=np.int64) & TF_MASK
+    order = np.argsort(doc_ids, kind='stable')
+    doc_ids, tfs = doc_ids[order], tfs[order]
+    gaps = np.diff(doc_ids, prepend=0)
+    blocks = []
+    skips = np.empty((len(doc_ids) + POSTINGS_PER_BLOCK - 1) // POSTINGS_PER_BLOCK, dtype=V2_SKIP_DTYPE)
+    end = 0
+    for i, start in enumerate(range(0, len(doc_ids), POSTINGS_PER_BLOCK)):
+        stop = start + POSTINGS_PER_BLOCK
+        block = varint_encode(gaps[start:stop]) + varint_encode(tfs[start:stop])
+        end += len(block)
+        skips[i] = (doc_ids[stop - 1 if stop <= len(doc_ids) else -1], end)
+        blocks.append(block)
+    header = np.array([(V2_HEADER_DTYPE.itemsize + skips.nbytes + end, len(skips))], dtype=V2_HEADER_DTYPE)
+    return header.tobytes() + skips.tobytes() + b''.join(blocks)
+
+def _v2_parts(b):
+    """ Splits a version 2 posting list into its skip table and block data. """
+    n_blocks = int(np.frombuffer(b, dtype=V2_HEADER_DTYPE, count=1)['n_blocks'][0])
+    skips = np.frombuffer(b, dtype=V2_SKIP_DTYPE, count=n_blocks, offset=V2_HEADER_DTYPE.itemsize)
+    data = b[V2_HEADER_DTYPE.itemsize + skips.nbytes:]
+    return skips, data
+
+def _decode_v2_blocks(data, n_postings, first_doc_id=0):
+    """ Decodes consecutive full blocks (the last may be shorter) of n_postings. """
+    values = varint_decode(data)
+    # every block holds its gaps first and its tfs second
+    position = np.arange(len(values))
+    block_size = np.minimum(POSTINGS_PER_BLOCK, n_postings - position // (2 * POSTINGS_PER_BLOCK) * POSTINGS_PER_BLOCK)
+    is_gap = position % (2 * POSTINGS_PER_BLOCK) < block_size
+    doc_ids = first_doc_id + np.cumsum(values[is_gap])
+    return doc_ids, values[~is_gap].astype(np.int32)
+
+def decode_posting_list_v2(b, n):
+    """ Decodes a whole version 2 posting list of `n` postings into
+        (doc_ids, tfs) arrays, like decode_posting_list.
+    """
+    skips, data = _v2_parts(b)
+    return _decode_v2_blocks(data, n)
+
+def probe_posting_list_v2(b, n, doc_ids):
+    """ Looks up the tf of each of `doc_ids` in a version 2 posting list of `n`
+        postings. The skip table selects the blocks that may hold each doc_id,
+        only those blocks are decoded.
+    """
+    targets = np.asarray(doc_ids, dtype=np.int64)
+    tfs = np.zeros(len(targets), dtype=np.int32)
+    skips, data = _v2_parts(b)
+    last_doc_ids = skips['last_doc_id'].astype(np.int64)
+    ends = skips['end'].astype(np.int64)
+    block_of_target = np.searchsorted(last_doc_ids, targets)
+    for block in np.unique(block_of_target[block_of_target < len(skips)]):
+        start = ends[block - 1] if block > 0 else 0
+        first_doc_id = last_doc_ids[block - 1] if block > 0 else 0
+        n_block = min(POSTINGS_PER_BLOCK, n - block * POSTINGS_PER_BLOCK)
+        block_doc_ids, block_tfs = _decode_v2_blocks(data[start:ends[block]], n_block, first_doc_id)
+        in_block = np.nonzero(block_of_target == block)[0]
+        positions = np.searchsorted(block_doc_ids, targets[in_block])
+        positions = np.minimum(positions, len(block_doc_ids) - 1)
+        found = block_doc_ids[positions] == targets[in_block]
+        tfs[in_block[found]] = block_tfs[positions[found]]
+    return tfs
+
+
+# generation of each attach_cache call, part of the posting cache keys
+_cache_generations = count(1)
 
 
 class InvertedIndex:  
@@ -110,6 +471,16 @@ class InvertedIndex:
         # the number of bytes from the beginning of the file where the posting list
         # starts. 
         self.posting_locs = defaultdict(list)
+        # maximum BM25 contribution of each term, keyed by the (k1, b) it was
+        # computed for: {(k1, b): {term: max impact}}. Filled at build time and
+        # used to skip documents that cannot reach the top k (MaxScore).
+        self.max_impact = {}
+        # on-disk layout of the posting lists (see POSTING_FORMAT_V1/V2)
+        self.posting_format = POSTING_FORMAT_V1
+        # persistent mmap readers per local base_dir, opened on first read
+        self._readers = {}
+        # optional shared cache of decoded posting lists (see attach_cache)
+        self.posting_cache = None
 
         for doc_id, tokens in docs.items():
             self.add_doc(doc_id, tokens)
@@ -143,46 +514,236 @@ class InvertedIndex:
             from the object's state dictionary. 
         """
         state = self.__dict__.copy()
-        del state['_posting_list']
+        state.pop('_posting_list', None)
+        state.pop('_readers', None)
+        state.pop('_fetchers', None)
+        state.pop('posting_cache', None)
+        state.pop('_cache_generation', None)
         return state
 
+    def attach_cache(self, cache):
+        """ Caches decoded posting lists in `cache`, any object with get(key) and
+            put(key, (doc_ids, tfs)) such as Backend.posting_cache.PostingCache.
+            Pass None to detach. Every attach starts a new cache generation, so an
+            index republished in place under the same base_dir never gets the
+            lists decoded from the files it replaced.
+        """
+        self.posting_cache = cache
+        self._cache_generation = next(_cache_generations)
+
+    def _cache_key(self, base_dir, bucket_name, w):
+        return (base_dir, bucket_name, w, getattr(self, '_cache_generation', 0))
+
+    def _reader(self, base_dir):
+        """ Returns the persistent MmapFileReader for a local `base_dir`. """
+        readers = self.__dict__.setdefault('_readers', {})
+        reader = readers.get(base_dir)
+        if reader is None:
+            reader = readers.setdefault(base_dir, MmapFileReader(base_dir))
+        return reader
+
+    def _fetcher(self, base_dir, bucket_name):
+        """ Returns the persistent RangeFetcher for `base_dir` in `bucket_name`. """
+        fetchers = self.__dict__.setdefault('_fetchers', {})
+        fetcher = fetchers.get((base_dir, bucket_name))
+        if fetcher is None:
+            fetcher = fetchers.setdefault((base_dir, bucket_name),
+                                          RangeFetcher(base_dir, get_bucket(bucket_name)))
+        return fetcher
+
+    def _format(self):
+        # indexes pickled before posting_format existed are all version 1
+        return getattr(self, 'posting_format', POSTING_FORMAT_V1)
+
+    def _read_with(self, reader, w):
+        """ Reads the raw posting list bytes of `w` with `reader`. """
+        locs = self.posting_locs[w]
+        if self._format() == POSTING_FORMAT_V2:
+            # version 2 lists are variable-sized, their header holds the size
+            header = reader.read(locs, V2_HEADER_DTYPE.itemsize)
+            n_bytes = int(np.frombuffer(header, dtype=V2_HEADER_DTYPE, count=1)['n_bytes'][0])
+        else:
+            n_bytes = self.df[w] * TUPLE_SIZE
+        return reader.read(locs, n_bytes)
+
+    def _decode(self, b, w):
+        if self._format() == POSTING_FORMAT_V2:
+            return decode_posting_list_v2(b, self.df[w])
+        doc_ids, tfs = decode_posting_list(b, self.df[w])
+        if self._format() == POSTING_FORMAT_IMPACT:
+            # whole lists are returned in doc_id order, like the other formats
+            order = np.argsort(doc_ids, kind='stable')
+            doc_ids, tfs = doc_ids[order], tfs[order]
+        return doc_ids, tfs
+
+    def _read_bytes(self, base_dir, w, bucket_name=None):
+        """ Reads the raw posting list bytes of `w`, through the persistent mmap
+            reader for local indexes and the persistent RangeFetcher for GCS.
+        """
+        if bucket_name is None:
+            return self._read_with(self._reader(base_dir), w)
+        return self._read_with(self._fetcher(base_dir, bucket_name), w)
+
+    def close(self):
+        """ Releases the memory maps and fetch threads held by the persistent readers. """
+        for attr in ('_readers', '_fetchers'):
+            readers = self.__dict__.get(attr, {})
+            for reader in list(readers.values()):
+                reader.close()
+            readers.clear()
+
+    def posting_arrays_iter(self, base_dir, bucket_name=None):
+        """ A generator that reads one posting list from disk and yields 
+            a (word:str, (doc_ids:np.ndarray, tfs:np.ndarray)) tuple.
+        """
+        if bucket_name is None:
+            reader = self._reader(base_dir)
+        else:
+            reader = MultiFileReader(base_dir, bucket_name)
+        try:
+            for w in self.posting_locs:
+                yield w, self._decode(self._read_with(reader, w), w)
+        finally:
+            # the persistent mmap reader stays open for later queries
+            if bucket_name is not None:
+                reader.close()
+
     def posting_lists_iter(self, base_dir, bucket_name=None):
         """ A generator that reads one posting list from disk and yields 
             a (word:str, [(doc_id:int, tf:int), ...]) tuple.
         """
-        with closing(MultiFileReader(base_dir, bucket_name)) as reader:
-            for w, locs in self.posting_locs.items():
-                b = reader.read(locs, self.df[w] * TUPLE_SIZE)
-                posting_list = []
-                for i in range(self.df[w]):
-                    doc_id = int.from_bytes(b[i*TUPLE_SIZE:i*TUPLE_SIZE+4], 'big')
-                    tf = int.from_bytes(b[i*TUPLE_SIZE+4:(i+1)*TUPLE_SIZE], 'big')
-                    posting_list.append((doc_id, tf))
-                yield w, posting_list
+        for w, (doc_ids, tfs) in self.posting_arrays_iter(base_dir, bucket_name):
+            yield w, list(zip(doc_ids.tolist(), tfs.tolist()))
 
-    def read_a_posting_list(self, base_dir, w, bucket_name=None):
-        posting_list = []
+    def read_a_posting_array(self, base_dir, w, bucket_name=None):
+        """ Reads the posting list of `w` as parallel (doc_ids, tfs) NumPy arrays,
+            both empty if `w` is not in the index.
+        """
+        if not w in self.posting_locs:
+            return _empty_posting_arrays()
+        cache = getattr(self, 'posting_cache', None)
+        if cache is not None:
+            postings = cache.get(self._cache_key(base_dir, bucket_name, w))
+            if postings is not None:
+                return postings
+        b = self._read_bytes(base_dir, w, bucket_name)
+        postings = self._decode(b, w)
+        if cache is not None:
+            cache.put(self._cache_key(base_dir, bucket_name, w), postings)
+        return postings
+
+    def read_posting_arrays(self, base_dir, words, bucket_name=None):
+        """ Reads the posting lists of many words as (doc_ids, tfs) arrays. On GCS
+            all lists missing from the cache are fetched with concurrent, merged
+            range requests (version 2 lists take one extra round for their headers).
+            Words that are not in the index are left out of the result.
+        """
+        words = [w for w in dict.fromkeys(words) if w in self.posting_locs]
+        if bucket_name is None:
+            # local reads are memory-mapped, there is nothing to batch
+            return {w: self.read_a_posting_array(base_dir, w) for w in words}
+
+        result = {}
+        cache = getattr(self, 'posting_cache', None)
+        if cache is not None:
+            for w in words:
+                postings = cache.get(self._cache_key(base_dir, bucket_name, w))
+                if postings is not None:
+                    result[w] = postings
+        missing = [w for w in words if w not in result]
+        if not missing:
+            return result
+
+        fetcher = self._fetcher(base_dir, bucket_name)
+        if self._format() == POSTING_FORMAT_V2:
+            headers = fetcher.fetch({w: (self.posting_locs[w], V2_HEADER_DTYPE.itemsize) for w in missing})
+            sizes = {w: int(np.frombuffer(b, dtype=V2_HEADER_DTYPE, count=1)['n_bytes'][0])
+                     for w, b in headers.items()}
+        else:
+            sizes = {w: self.df[w] * TUPLE_SIZE for w in missing}
+        raw = fetcher.fetch({w: (self.posting_locs[w], sizes[w]) for w in missing})
+        for w in missing:
+            result[w] = self._decode(raw[w], w)
+            if cache is not None:
+                cache.put(self._cache_key(base_dir, bucket_name, w), result[w])
+        return result
+
+    def read_a_posting_view(self, base_dir, w, bucket_name=None):
+        """ Returns the posting list of `w` as a POSTING_DTYPE structured array.
+            For local indexes it is a zero-copy view over the memory map, so only
+            the entries that are accessed get paged in.
+        """
+        if not w in self.posting_locs:
+            return np.empty(0, dtype=POSTING_DTYPE)
+        b = self._read_bytes(base_dir, w, bucket_name)
+        if self._format() in (POSTING_FORMAT_V2, POSTING_FORMAT_IMPACT):
+            doc_ids, tfs = self._decode(b, w)
+            postings = np.empty(len(doc_ids), dtype=POSTING_DTYPE)
+            postings['doc_id'], postings['tf'] = doc_ids, tfs
+            return postings
+        return np.frombuffer(b, dtype=POSTING_DTYPE, count=self.df[w])
+
+    def probe_posting_list(self, base_dir, w, doc_ids, bucket_name=None):
+        """ Looks up the tf of `w` in each of `doc_ids` without decoding the whole
+            posting list. Posting lists are sorted by doc_id (as written by the
+            GCP notebook), documents that do not contain `w` get a tf of 0.
+        """
+        tfs = np.zeros(len(doc_ids), dtype=np.int32)
+        cache = getattr(self, 'posting_cache', None)
+        if cache is not None and self._cache_key(base_dir, bucket_name, w) in cache:
+            # already decoded, a plain binary search over the cached doc_ids
+            posting_doc_ids, posting_tfs = self.read_a_posting_array(base_dir, w, bucket_name)
+            if len(posting_doc_ids) == 0:
+                return tfs
+            targets = np.asarray(doc_ids, dtype=np.int64)
+            positions = np.minimum(np.searchsorted(posting_doc_ids, targets), len(posting_doc_ids) - 1)
+            found = posting_doc_ids[positions] == targets
+            tfs[found] = posting_tfs[positions[found]]
+            return tfs
+        if self._format() == POSTING_FORMAT_V2:
+            if w in self.posting_locs and len(doc_ids) > 0:
+                tfs = probe_posting_list_v2(self._read_bytes(base_dir, w, bucket_name), self.df[w], doc_ids)
+            return tfs
+        postings = self.read_a_posting_view(base_dir, w, bucket_name)
+        if len(postings) == 0 or len(doc_ids) == 0:
+            return tfs
+        positions, found = search_sorted_postings(postings, doc_ids)
+        tfs[found] = postings['tf'][positions[found]]
+        return tfs
+
+    def read_a_posting_prefix(self, base_dir, w, n, bucket_name=None):
+        """ Reads only the first `n` postings of `w`, in their stored order, as
+            (doc_ids, tfs) arrays. For impact-ordered indexes these are the
+            postings with the highest contributions.
+        """
         if not w in self.posting_locs:
-            return posting_list
-        with closing(MultiFileReader(base_dir, bucket_name)) as reader:
-            locs = self.posting_locs[w]
-            b = reader.read(locs, self.df[w] * TUPLE_SIZE)
-            for i in range(self.df[w]):
-                doc_id = int.from_bytes(b[i*TUPLE_SIZE:i*TUPLE_SIZE+4], 'big')
-                tf = int.from_bytes(b[i*TUPLE_SIZE+4:(i+1)*TUPLE_SIZE], 'big')
-                posting_list.append((doc_id, tf))
-        return posting_list
+            return _empty_posting_arrays()
+        if self._format() == POSTING_FORMAT_V2:
+            raise ValueError("version 2 posting lists are variable-sized, read them whole")
+        n = min(n, self.df[w])
+        if bucket_name is None:
+            b = self._reader(base_dir).read(self.posting_locs[w], n * TUPLE_SIZE)
+        else:
+            b = self._fetcher(base_dir, bucket_name).read(self.posting_locs[w], n * TUPLE_SIZE)
+        return decode_posting_list(b, n)
+
+    def read_a_posting_list(self, base_dir, w, bucket_name=None):
+        doc_ids, tfs = self.read_a_posting_array(base_dir, w, bucket_name)
+        return list(zip(doc_ids.tolist(), tfs.tolist()))
 
     @staticmethod
-    def write_a_posting_list(b_w_pl, base_dir, bucket_name=None):
+    def write_a_posting_list(b_w_pl, base_dir, bucket_name=None, posting_format=POSTING_FORMAT_V1):
         posting_locs = defaultdict(list)
         bucket_id, list_w_pl = b_w_pl
         
         with closing(MultiFileWriter(base_dir, bucket_id, bucket_name)) as writer:
             for w, pl in list_w_pl: 
                 # convert to bytes
-                b = b''.join([(doc_id << 16 | (tf & TF_MASK)).to_bytes(TUPLE_SIZE, 'big')
-                              for doc_id, tf in pl])
+                if posting_format == POSTING_FORMAT_V2:
+                    b = encode_posting_list_v2([doc_id for doc_id, _ in pl], [tf for _, tf in pl])
+                else:
+                    b = b''.join([(doc_id << 16 | (tf & TF_MASK)).to_bytes(TUPLE_SIZE, 'big')
+                                  for doc_id, tf in pl])
                 # write to file(s)
                 locs = writer.write(b)
                 # save file locations to index
@@ -199,4 +760,215 @@ class InvertedIndex:
         path = str(Path(base_dir) / f'{name}.pkl')
         bucket = None if bucket_name is None else get_bucket(bucket_name)
         with _open(path, 'rb', bucket) as f:
-            return pickle.load(f)
\ No newline at end of file
+            return pickle.load(f)
+
+    def write_compact(self, base_dir, name):
+        """ Writes the global term stats as a memory-mappable TermDictionary
+            (local only), an alternative to the `name`.pkl pickle.
+        """
+        TermDictionary.write(self, base_dir, name)
+
+    @staticmethod
+    def read_compact(base_dir, name):
+        """ Opens an index written by write_compact. df, term_total, posting_locs
+            and max_impact are read-only views over the memory-mapped term
+            dictionary, nothing is materialized per term.
+        """
+        terms = TermDictionary(base_dir, name)
+        index = InvertedIndex.__new__(InvertedIndex)
+        index.df = terms.column('df')
+        index.term_total = terms.column('term_total')
+        index.posting_locs = terms.posting_locs()
+        index.max_impact = terms.max_impacts()
+        index.posting_format = terms.posting_format
+        index._readers = {}
+        index.posting_cache = None
+        return index
+
+
+def encode_posting_arrays(doc_ids, tfs, posting_format=POSTING_FORMAT_V1):
+    """ Encodes parallel (doc_ids, tfs) arrays into the bytes of one posting
+        list in `posting_format`.
+    """
+    if posting_format == POSTING_FORMAT_V2:
+        return encode_posting_list_v2(doc_ids, tfs)
+    postings = np.empty(len(doc_ids), dtype=POSTING_DTYPE)
+    postings['doc_id'], postings['tf'] = doc_ids, np.asarray(tfs) & TF_MASK
+    return postings.tobytes()
+
+
+def convert_index(src_dir, dst_dir, name, posting_format=POSTING_FORMAT_V2):
+    """ Rewrites the local index `name` in `src_dir` into `dst_dir` using
+        `posting_format`. Terms keep their bucket (the `{bucket}_` prefix of
+        their posting files) and the global stats are copied as-is.
+    Returns:
+    --------
+      The converted InvertedIndex, also written to `dst_dir`/`name`.pkl.
+    """
+    src = InvertedIndex.read_index(src_dir, name)
+    dst = InvertedIndex.read_index(src_dir, name)
+    dst.posting_locs = defaultdict(list)
+    dst.posting_format = posting_format
+    terms_by_bucket = defaultdict(list)
+    for w, locs in src.posting_locs.items():
+        terms_by_bucket[Path(locs[0][0]).name.rsplit('_', 1)[0]].append(w)
+    Path(dst_dir).mkdir(parents=True, exist_ok=True)
+    for bucket_id, terms in terms_by_bucket.items():
+        with closing(MultiFileWriter(dst_dir, bucket_id)) as writer:
+            for w in terms:
+                b = encode_posting_arrays(*src.read_a_posting_array(src_dir, w), posting_format)
+                # store file names relative to dst_dir, like the GCP notebook does
+                dst.posting_locs[w].extend((Path(f_name).name, offset)
+                                           for f_name, offset in writer.write(b))
+    src.close()
+    dst.write_index(dst_dir, name)
+    return dst
+
+
+#### COMPACT TERM DICTIONARY ####
+# A term dictionary that is memory-mapped instead of unpickled. For an index
+# `name` it is made of these files in base_dir:
+#   {name}_terms.npy        UTF-8 bytes of all terms, sorted by their bytes
+#   {name}_term_offsets.npy start of each term in the blob (+ a final end)
+#   {name}_records.npy      TERM_RECORD_DTYPE record per term, same order
+#   {name}_locs.npy         LOC_DTYPE (file id, offset) posting locations
+#   {name}_max_impact_{i}.npy  optional float64 column per max_impact key
+#   {name}_terms_meta.pkl   posting file names, posting format, max_impact keys
+TERM_RECORD_DTYPE = np.dtype([('df', '<u4'), ('term_total', '<u8'),
+                              ('loc_start', '<u4'), ('n_locs', '<u4')])
+LOC_DTYPE = np.dtype([('file_id', '<u4'), ('offset', '<u4')])
+
+
+class TermDictionary:
+    """ Sorted, memory-mapped term dictionary with fixed-width records. Terms
+        are found by binary search over the sorted term blob.
+    """
+    def __init__(self, base_dir, name):
+        base_dir = Path(base_dir)
+        self._blob = np.load(base_dir / f'{name}_terms.npy', mmap_mode='r')
+        self._offsets = np.load(base_dir / f'{name}_term_offsets.npy', mmap_mode='r')
+        self.records = np.load(base_dir / f'{name}_records.npy', mmap_mode='r')
+        self._locs = np.load(base_dir / f'{name}_locs.npy', mmap_mode='r')
+        with open(base_dir / f'{name}_terms_meta.pkl', 'rb') as f:
+            meta = pickle.load(f)
+        self.files = meta['files']
+        self.posting_format = meta['posting_format']
+        self._max_impacts = {key: np.load(base_dir / f'{name}_max_impact_{i}.npy', mmap_mode='r')
+                             for i, key in enumerate(meta['max_impact_keys'])}
+
+    def __len__(self):
+        return len(self.records)
+
+    def term(self, row):
+        return bytes(self._blob[self._offsets[row]:self._offsets[row + 1]]).decode('utf-8')
+
+    def find(self, term):
+        """ Returns the row of `term`, or -1 if it is not in the dictionary. """
+        if not isinstance(term, str):
+            return -1
+        key = term.encode('utf-8')
+        lo, hi = 0, len(self.records)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(self._blob[self._offsets[mid]:self._offsets[mid + 1]]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.records) and bytes(self._blob[self._offsets[lo]:self._offsets[lo + 1]]) == key:
+            return lo
+        return -1
+
+    def locs(self, row):
+        """ Returns the posting_locs entry of `row`: a list of (file_name, offset). """
+        record = self.records[row]
+        start = int(record['loc_start'])
+        return [(self.files[int(file_id)], int(offset))
+                for file_id, offset in self._locs[start:start + int(record['n_locs'])].tolist()]
+
+    def column(self, field):
+        return _TermColumn(self, self.records[field])
+
+    def posting_locs(self):
+        return _TermPostingLocs(self)
+
+    def max_impacts(self):
+        return {key: _TermColumn(self, values) for key, values in self._max_impacts.items()}
+
+    @staticmethod
+    def write(index, base_dir, name):
+        """ Writes the df, term_total, posting_locs and max_impact of `index`. """
+        base_dir = Path(base_dir)
+        terms = sorted(index.df, key=lambda w: w.encode('utf-8'))
+        encoded = [w.encode('utf-8') for w in terms]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        records = np.zeros(len(terms), dtype=TERM_RECORD_DTYPE)
+        file_ids, locs = {}, []
+        for row, w in enumerate(terms):
+            term_locs = index.posting_locs.get(w, [])
+            records[row] = (index.df[w], index.term_total.get(w, 0), len(locs), len(term_locs))
+            for f_name, offset in term_locs:
+                locs.append((file_ids.setdefault(f_name, len(file_ids)), offset))
+        max_impact = getattr(index, 'max_impact', {})
+        np.save(base_dir / f'{name}_terms.npy', np.frombuffer(b''.join(encoded), dtype=np.uint8))
+        np.save(base_dir / f'{name}_term_offsets.npy', offsets)
+        np.save(base_dir / f'{name}_records.npy', records)
+        np.save(base_dir / f'{name}_locs.npy', np.array(locs, dtype=LOC_DTYPE))
+        for i, key in enumerate(max_impact):
+            column = np.array([max_impact[key].get(w, np.inf) for w in terms], dtype=np.float64)
+            np.save(base_dir / f'{name}_max_impact_{i}.npy', column)
+        with open(base_dir / f'{name}_terms_meta.pkl', 'wb') as f:
+            pickle.dump({'files': list(file_ids),
+                         'posting_format': getattr(index, 'posting_format', POSTING_FORMAT_V1),
+                         'max_impact_keys': list(max_impact)}, f)
+
+    @staticmethod
+    def exists(base_dir, name):
+        return (Path(base_dir) / f'{name}_terms_meta.pkl').exists()
+
+
+class _TermColumn(Mapping):
+    """ Read-only term -> value view of one record column. Like the Counter it
+        replaces, missing terms read as 0 but are not contained.
+    """
+    def __init__(self, terms, values):
+        self._terms = terms
+        self._values = values
+
+    def __getitem__(self, w):
+        row = self._terms.find(w)
+        return self._values[row].item() if row >= 0 else 0
+
+    def __contains__(self, w):
+        return self._terms.find(w) >= 0
+
+    def __iter__(self):
+        return (self._terms.term(row) for row in range(len(self._terms)))
+
+    def __len__(self):
+        return len(self._terms)
+
+    def items(self):
+        return ((self._terms.term(row), value) for row, value in enumerate(self._values.tolist()))
+
+
+class _TermPostingLocs(Mapping):
+    """ Read-only view with the posting_locs API over a TermDictionary. """
+    def __init__(self, terms):
+        self._terms = terms
+
+    def __getitem__(self, w):
+        row = self._terms.find(w)
+        return self._terms.locs(row) if row >= 0 else []
+
+    def __contains__(self, w):
+        return self._terms.find(w) >= 0
+
+    def __iter__(self):
+        return (self._terms.term(row) for row in range(len(self._terms)))
+
+    def __len__(self):
+        return len(self._terms)
+
+    def items(self):
+        return ((self._terms.term(row), self._terms.locs(row)) for row in range(len(self._terms)))
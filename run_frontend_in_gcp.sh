@@ -62,6 +62,9 @@ gcloud compute ssh $GOOGLE_ACCOUNT_NAME@$INSTANCE_NAME --zone $ZONE
 
 # 7. Run the server
 nohup ~/venv/bin/python ~/search_frontend.py > ~/frontend.log 2>&1 &
+# or, in production, one pre-forked worker per core sharing the loaded index
+# (reload the index in all workers with: kill -HUP <parent pid>)
+# nohup ~/venv/bin/python ~/search_frontend.py --workers -1 --threads 4 > ~/frontend.log 2>&1 &
 
 # 8. Start querying
 curl "http://127.0.0.1:8080/search?query=hello"
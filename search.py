@@ -6,42 +6,68 @@ import math
 from io import BytesIO
 from flask import jsonify
 import numpy as np
-import pandas as pd
 from collections import Counter
-from nltk.stem.porter import *
-from nltk.corpus import stopwords
-from nltk.corpus import wordnet
-import nltk
 import builtins
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from inverted_index_gcp import *
-nltk.download('stopwords')
 
 from Backend.ranking import *
 from Backend.tokenizer import *
-from Backend.data_Loader import load_index, load_pagerank
-
-N_DOCS = 6348910  # Wikipedia size (from hw3)
+from Backend.data_Loader import load_index, load_pagerank, load_doc_lengths, N_DOCS, FIELD_INDEX_DIRS
+from Backend.field_indexes import IndexRegistry
+from Backend.resident_data import get_resident_data
+from Backend.doc_store import PAGERANK, PAGEVIEW, TEXT_LEN, TITLE_LEN, TEXT_NORM
+from Backend.deadline import rarest_first
+
+# how search_prm runs its text, title and anchor fields (SearchEngine.field_execution)
+SEQUENTIAL = 'sequential'
+THREADS = 'thread'  # postings reads and scoring of the fields overlap in a thread pool
+PROCESSES = 'process'  # reads in the thread pool, CPU bound scoring in a process pool
+# concurrent queries per process the field thread pool is sized for (two pooled
+# fields per query, the third runs in the request's thread); past it field jobs queue
+QUERY_CONCURRENCY = 16
 
 class SearchEngine:
-    def __init__(self):
+    def __init__(self, resident=None):
         """
         Class to encapsulate and manage search indices and related data.
 
+        Args:
+            resident (ResidentData, optional): Data to serve from, the process-wide
+                instance by default. A hot reload passes a freshly loaded one.
+
         Attributes:
-            self.index_name : string of index name.
-            self.text_index (InvertedIndex): Inverted index for document text content.
-            self.title_index (InvertedIndex): Inverted index for document titles.
-            self.anchor_index (InvertedIndex): Inverted index for anchor text.
-            self.text_doc_len_dict (dict): Dictionary mapping document IDs to their lengths (in terms of number of words) for text content.
-            self.title_doc_len_dict (dict): Dictionary mapping document IDs to their lengths (in terms of words) for titles.
+            self.indexes (IndexRegistry): Field indexes by name: 'text', 'title' and
+                'anchor' (stemmed) and 'og_text', 'og_title', 'og_anchor' (raw tokens),
+                each opened once on first use (see FIELD_INDEX_DIRS and swap_index).
             self.corpus_size (int): Total number of documents in the corpus.
-            self.text_avg_doc_len (float): Average document length (in terms of words) for text content.
-            self.title_avg_doc_len (float): Average document length (in terms of words) for titles.
-            self.doc_id_title_even_dict (dict): Dictionary mapping even document IDs to their corresponding titles.
-            self.doc_id_title_odd_dict (dict): Dictionary mapping odd document IDs to their corresponding titles.
-            self.page_rank (dict): Dictionary mapping document IDs to their normalized PageRank scores.
-            self.page_views (dict): Dictionary mapping document IDs to their normalized PageView counts.
+            self.docs (DocAttributeStore): Memory-mapped per-document PageRank, page views,
+                text/title lengths (in terms of words) and titles, shared by all workers.
         """
+        # index and PageRank are loaded once per process and shared by all requests
+        self.resident = (get_resident_data() if resident is None else resident).load()
+        self.docs = self.resident.docs
+        self.corpus_size = N_DOCS
+        self.indexes = IndexRegistry(self.resident.posting_cache)
+        for field, base_dir in FIELD_INDEX_DIRS.items():
+            self.indexes.register(field, base_dir)
+        # array based BM25 scorers per field, built on first use
+        self._bm25_engines = {}
+        self._match_engines = {}
+        # maximum of the CSV PageRank, used without a doc-attribute store
+        self._pagerank_max = None
+        # use MaxScore pruning for the BM25 top 500 (needs index.max_impact, see
+        # BM25Engine.build_max_impacts, otherwise every posting is scored)
+        self.pruned_top_k = True
+        # when the index is impact-ordered (BM25Engine.write_impact_ordered), read only
+        # this fraction of each posting list for the BM25 top 500; None reads everything
+        self.impact_fraction = None
+        # SEQUENTIAL, THREADS or PROCESSES, see _score_fields
+        self.field_execution = THREADS
+        self.query_concurrency = QUERY_CONCURRENCY
+        self._field_pool = None
+        self._score_pool = None
+
         # indices paths
         # print("init backend class")
         # self.index_name = 'index'
@@ -101,57 +127,285 @@ class SearchEngine:
 
         # self.views_max = max(self.page_views.values())
 
-    def search_basic(self, query):
-        inverted_index = load_index()
-        pagerank_dict = load_pagerank()
-    
+    def warm_up(self, queries=()):
+        """ Warms up the resident data with the tokens of `queries` (e.g. queries_train.json),
+            the most frequent tokens first so they are the ones kept in the posting cache.
+        """
+        term_counts = Counter(term for query in queries for term in tokenize(query))
+        return self.resident.warm_up([term for term, _ in term_counts.most_common()])
+
+    def is_ready(self):
+        return self.resident.is_ready()
+
+    def close(self):
+        """ Releases the memory maps, caches and worker pools of this engine once a
+            reload has replaced it.
+        """
+        for pool in (self._field_pool, self._score_pool):
+            if pool is not None:
+                pool.shutdown(wait=False)
+        self._bm25_engines.clear()
+        self._match_engines.clear()
+        self.indexes.close()
+        self.resident.release()
+
+    def swap_index(self, field, base_dir, name='index', bucket_name=None):
+        """ Replaces the index of `field` without a restart; cached results are dropped. """
+        field_index = self.indexes.swap(field, base_dir, name, bucket_name)
+        if self.resident.result_cache is not None:
+            self.resident.result_cache.invalidate()
+        return field_index
+
+    def _doc_lengths(self, field):
+        """ Returns the document lengths of `field` ('text' or 'title') and their
+            average: from the doc-attribute store, or from the field's doc length
+            pickle when no store was built.
+        """
+        length_column = {'text': TEXT_LEN, 'title': TITLE_LEN}[field]
+        if self.docs is not None and length_column in self.docs.columns:
+            return self.docs.lookup(length_column), self.docs.stats[length_column]['sum'] / self.corpus_size
+        doc_lengths = load_doc_lengths(field)
+        if not doc_lengths:
+            raise RuntimeError(f"no {field} document lengths: build the doc-attribute store "
+                               f"(Backend.data_Loader.build_doc_store)")
+        return doc_lengths, builtins.sum(doc_lengths.values()) / self.corpus_size
+
+    def _field_engine(self, engines, field, field_index, build):
+        """ Returns the engine of `field_index` from `engines`, building it on first
+            use or after a swap. Requests still on a swapped out index get an
+            engine that is not kept.
+        """
+        field_engine = engines.get(field)
+        if field_engine is not None and field_engine[0] is field_index:
+            return field_engine[1]
+        engine = build()
+        if self.indexes.get(field) is field_index:
+            engines[field] = (field_index, engine)
+        return engine
+
+    def _bm25_engine(self, field, field_index):
+        """ Returns the BM25Engine of `field` ('text' or 'title') over the acquired
+            `field_index` (see IndexRegistry.acquire).
+        """
+        def build():
+            doc_lengths, avg_doc_length = self._doc_lengths(field)
+            return BM25Engine(field_index.index,
+                              doc_lengths,
+                              avg_doc_length,
+                              self.corpus_size,
+                              base_dir=field_index.base_dir,
+                              bucket_name=field_index.bucket_name)
+        return self._field_engine(self._bm25_engines, field, field_index, build)
+
+    def _match_count_engine(self, field, field_index):
+        """ Returns the MatchCountEngine of `field` ('og_title' or 'og_anchor'). """
+        return self._field_engine(self._match_engines, field, field_index, lambda: MatchCountEngine(
+            field_index.index, field_index.base_dir, field_index.bucket_name))
+
+    def _normalized_pr_pv(self, doc_ids):
+        """ Returns the PageRank and page views of doc_ids, both divided by their maximum. """
+        if self.docs is None:
+            # no store: PageRank from the CSVs and no page views, like pagerank() and pageview()
+            if self._pagerank_max is None:
+                self._pagerank_max = builtins.max(self.resident.pagerank.values(), default=0.0) or 1.0
+            return [page_rank / self._pagerank_max for page_rank in self.pagerank(doc_ids)], self.pageview(doc_ids)
+        page_ranks = self.docs.values(PAGERANK, doc_ids, 0.0) / (self.docs.stats[PAGERANK]['max'] or 1.0)
+        page_views = self.docs.values(PAGEVIEW, doc_ids, 0.0) / (self.docs.stats[PAGEVIEW]['max'] or 1.0)
+        return page_ranks.tolist(), page_views.tolist()
+
+    def _with_titles(self, doc_ids):
+        return [(str(doc_id), title) for doc_id, title in zip(doc_ids, self.doc_titles(doc_ids))]
+
+    def _cached(self, endpoint, tokens, params, compute, deadline=None):
+        """ Serves the result of `endpoint` for tokens/params from the shared result
+            cache, calling compute() on a miss. Partial results (the deadline ran
+            out) are returned but not cached.
+        """
+        result_cache = self.resident.result_cache
+        if result_cache is None:
+            return compute()
+        cacheable = None if deadline is None else (lambda: not deadline.partial)
+        return result_cache.get_or_compute(endpoint, tokens, params, compute, cacheable)
+
+    def search_basic(self, query, deadline=None):
+        """ TF-IDF search on the main index. With a `deadline` (Backend.deadline.Deadline)
+            terms are scored rarest first until it runs out, and deadline.partial
+            tells whether some were skipped.
+        """
         query_tokens = tokenize(query)
         if not query_tokens:
             return jsonify([])
-    
+        return self._cached('search_basic', query_tokens, {},
+                            lambda: self._search_basic_tokens(query_tokens, deadline=deadline), deadline)
+
+    def _search_basic_tokens(self, query_tokens, postings=None, deadline=None):
+        """ Scores tokenized query with TF-IDF on the main index. `postings` maps
+            terms to already read (doc_ids, tfs) arrays, missing terms are read here.
+        """
+        inverted_index = self.resident.index
+
         # Calculate TF-IDF scores for better relevance ranking
-        doc_scores = defaultdict(float)
+        all_doc_ids, all_scores = [], []
     
-        for term in query_tokens:
+        for term in rarest_first(query_tokens, inverted_index.df, deadline):
             if term not in inverted_index.posting_locs:
                 continue
         
-        # Calculate IDF (inverse document frequency)
-        df = inverted_index.df[term]
-        idf = math.log10(N_DOCS / df) if df > 0 else 0
-        
-        # Read posting list for this term (local)
-        posting_list = inverted_index.read_a_posting_list("data/postings_gcp", term)
+            # Calculate IDF (inverse document frequency)
+            df = inverted_index.df[term]
+            idf = math.log10(N_DOCS / df) if df > 0 else 0
         
-        for doc_id, tf in posting_list:
+            # Read posting list for this term (local)
+            if postings is not None and term in postings:
+                doc_ids, tfs = postings[term]
+            else:
+                doc_ids, tfs = inverted_index.read_a_posting_array(self.resident.postings_dir, term)
+
             # TF-IDF scoring: term frequency * inverse document frequency
-            doc_scores[doc_id] += tf * idf
-    
-        # Sort by relevance score (highest first)
-        sorted_docs = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)[:10]
+            all_doc_ids.append(doc_ids)
+            all_scores.append(tfs * idf)
+
+        # Sum the scores per document and keep the 10 most relevant (highest first)
+        if all_doc_ids:
+            doc_ids, slots = np.unique(np.concatenate(all_doc_ids), return_inverse=True)
+            scores = np.bincount(slots, weights=np.concatenate(all_scores), minlength=len(doc_ids))
+            sorted_docs = top_k_arrays(doc_ids, scores, 10)
+        else:
+            sorted_docs = []
     
         # Return list of [doc_id, title] tuples
-        # For now, use doc_id as placeholder for title (we don't have titles yet)
-        res = [[int(doc_id), f"Article {doc_id}"] for doc_id, _ in sorted_docs]
+        # Use doc_id as placeholder for documents without a title
+        doc_ids = [int(doc_id) for doc_id, _ in sorted_docs]
+        res = [[doc_id, title or f"Article {doc_id}"] for doc_id, title in zip(doc_ids, self.doc_titles(doc_ids))]
         return res
 
-    def search(self, query):
+    def search_batch(self, queries, max_workers=8, deadline=None):
+        """
+        Runs many /search queries at once, sharing posting list reads between them.
+
+        All queries are tokenized first, the posting list of every distinct term is
+        read once, then the queries are scored in parallel against those arrays.
+
+        Args:
+            queries (list): Query strings.
+            max_workers (int): Number of scoring threads.
+            deadline (Deadline, optional): Budget of the whole batch. Every query
+                scores its terms rarest first and skips the rest once it runs
+                out; deadline.partial tells whether any query did.
+
+        Returns:
+            list: One result list per query (see search_basic), in input order.
+        """
+        tokenized_queries = [tokenize(query) for query in queries]
+        index = self.resident.index
+        # one batched read for all the terms (concurrent range requests on GCS)
+        postings = index.read_posting_arrays(self.resident.postings_dir,
+                                             [term for tokens in tokenized_queries for term in tokens])
+
+        def score(tokens):
+            return self._search_basic_tokens(tokens, postings, deadline) if tokens else []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map keeps the input order
+            return list(executor.map(score, tokenized_queries))
+
+    def _bm25_top_k(self, field, field_index, tokenized_query, k, k1, b, deadline=None):
+        engine = self._bm25_engine(field, field_index)
+        if self.impact_fraction is not None and engine.has_impact_order(k1, b):
+            # already bounded: reads only a prefix of every posting list
+            return engine.top_k_impact(tokenized_query, k, k1=k1, b=b, fraction=self.impact_fraction)
+        if self.pruned_top_k:
+            return engine.top_k_pruned(tokenized_query, k, k1=k1, b=b, deadline=deadline)
+        return engine.top_k(tokenized_query, k, k1=k1, b=b, deadline=deadline)
+
+    def _field_doc_ids(self, field_index, tokenized_query, deadline=None):
+        """ Reads the doc_ids of every query token's posting list in `field_index`. """
+        index = field_index.index
+        return [index.read_a_posting_array(field_index.base_dir, token, field_index.bucket_name)[0]
+                for token in rarest_first(tokenized_query, index.df, deadline)
+                if token in index.posting_locs]
+
+    def _pools(self):
+        if self._field_pool is None:
+            self._field_pool = ThreadPoolExecutor(max_workers=2 * self.query_concurrency)
+        if self.field_execution == PROCESSES and self._score_pool is None:
+            # CPU bound: one process per core
+            self._score_pool = ProcessPoolExecutor()
+        return self._field_pool, self._score_pool
+
+    def _score_fields(self, tokenized_query, k1, b, deadline=None):
+        """
+        Scores the text (BM25), title and anchor (word count) fields of a query.
+
+        SEQUENTIAL scores one field after the other. THREADS runs the title and
+        anchor fields (their postings reads and NumPy scoring, which releases the
+        GIL) in a thread pool shared by the queries, sized for query_concurrency
+        queries, while the calling thread scores the text field. PROCESSES reads
+        the postings the same way and sends the arrays to a process pool for
+        scoring; it pays for pickling the arrays and does not use MaxScore
+        pruning, so it only helps queries with long posting lists.
+        All modes return the same top 500 lists, up to floating point summation order.
+        A deadline is shared by the three fields, each skips its remaining terms
+        once it runs out.
+
+        Returns:
+            tuple: text, title and anchor lists of (doc_id, score) pairs, best first.
+        """
+        with self.indexes.acquire('text', 'title', 'anchor') as field_indexes:
+            return self._score_field_indexes(field_indexes, tokenized_query, k1, b, deadline)
+
+    def _score_field_indexes(self, field_indexes, tokenized_query, k1, b, deadline):
+        text_index, title_index, anchor_index = (field_indexes[field] for field in ('text', 'title', 'anchor'))
+        text_engine = self._bm25_engine('text', text_index)
+        fields = [
+            lambda: self._bm25_top_k('text', text_index, tokenized_query, 500, k1=k1, b=b, deadline=deadline),
+            lambda: word_count_top_k(self._field_doc_ids(title_index, tokenized_query, deadline), 500),
+            lambda: word_count_top_k(self._field_doc_ids(anchor_index, tokenized_query, deadline), 500),
+        ]
+        if self.field_execution == SEQUENTIAL:
+            return tuple(field() for field in fields)
+
+        field_pool, score_pool = self._pools()
+        if self.field_execution == THREADS:
+            futures = [field_pool.submit(field) for field in fields[1:]]
+            return (fields[0](),) + tuple(future.result() for future in futures)
+
+        # reads are I/O bound: overlap them in threads, then score in processes
+        reads = [
+            field_pool.submit(self._field_doc_ids, title_index, tokenized_query, deadline),
+            field_pool.submit(self._field_doc_ids, anchor_index, tokenized_query, deadline),
+        ]
+        text_arrays = [text_engine.term_arrays(token)
+                       for token in rarest_first(tokenized_query, text_engine.index.df, deadline)
+                       if token in text_engine.index.posting_locs]
+        title_doc_ids, anchor_doc_ids = (read.result() for read in reads)
+        futures = [
+            score_pool.submit(bm25_top_k_from_arrays, text_arrays, text_engine.avg_doc_length, 500, k1, b),
+            score_pool.submit(word_count_top_k, title_doc_ids, 500),
+            score_pool.submit(word_count_top_k, anchor_doc_ids, 500),
+        ]
+        return tuple(future.result() for future in futures)
+
+    def search(self, query, deadline=None):
         # tokenize the query and create candidates dictionaries for each index
         tokenized_query = tokenize(query)
+        return self._cached('search', tokenized_query, {},
+                            lambda: self._search_tokens(tokenized_query, deadline), deadline)
+
+    def _search_tokens(self, tokenized_query, deadline=None):
+
+        with self.indexes.acquire('text', 'title') as field_indexes:
+            # collect scores for query in text index using bm25
+            text_bm25_scores_top_500 = self._bm25_top_k('text', field_indexes['text'], tokenized_query, 500,
+                                                        k1=1.2, b=0.6, deadline=deadline)
 
-        # collect scores for query in text index using bm25
-        bm25_scores_text = BM25_score(tokenized_query, self.text_index, self.corpus_size,
-                                        self.text_doc_len_dict, self.text_avg_doc_len, k1=1.2, b=0.6)
-        text_bm25_scores_top_500 = bm25_scores_text.most_common(500)
+            # collect scores for query in title index using binary word count
+            title_word_count_scores_top_500 = self._bm25_top_k('title', field_indexes['title'], tokenized_query,
+                                                               500, k1=1.5, b=0.4, deadline=deadline)
 
         # normalize text scores
         text_max_score = text_bm25_scores_top_500[0][1]
 
-        # collect scores for query in title index using binary word count
-        word_count_scores_title = BM25_score(tokenized_query, self.title_index, self.corpus_size, self.title_doc_len_dict,
-                                             self.title_avg_doc_len, k1=1.5, b=0.4)
-        title_word_count_scores_top_500 = word_count_scores_title.most_common(500)
-
         # normalize title scores
         title_max_score = title_word_count_scores_top_500[0][1]
 
@@ -166,99 +420,124 @@ class SearchEngine:
         pv_weight = 0.6
 
 
+        candidates = list(set(text_bm25_dict) | set(title_word_count_dict))
+        page_ranks, page_views = self._normalized_pr_pv(candidates)
         weighted_scores = [
             (doc_id,
              text_bm25_dict.get(doc_id, 0.0) * text_weight +
              title_word_count_dict.get(doc_id, 0.0) * title_weight +
-             self.page_rank.get(doc_id, 0.0) * pr_weight +
-             self.page_views.get(doc_id, 0.0) * pv_weight / self.views_max)
-            for doc_id in set(text_bm25_dict) | set(title_word_count_dict)
+             page_rank * pr_weight +
+             page_view * pv_weight)
+            for doc_id, page_rank, page_view in zip(candidates, page_ranks, page_views)
         ]
 
 
         # sort the combined scores, transform to a list of top 100 doc_ids
         sorted_scores = sorted(weighted_scores, key=lambda x: x[1], reverse=True)
-        res = []
-        for doc_id, _ in sorted_scores[:100]:
-            if doc_id % 2 == 0:
-                res.append((str(doc_id), self.doc_id_title_even_dict.get(doc_id)))
-            else:
-                res.append((str(doc_id), self.doc_id_title_odd_dict.get(doc_id)))
-        return res
+        return self._with_titles([doc_id for doc_id, _ in sorted_scores[:100]])
     
-    def search_partial(self, query, partial_index):
+    def search_partial(self, query, partial_index, tokens=None, doc_norms=None, base_dir=".", bucket_name=None,
+                       deadline=None):
+        if tokens is None:
+            tokens = og_tokenize(query)
+        if doc_norms is not None:
+            # true cosine with precomputed document norms
+            top_100 = cosine_top_k(tokens, partial_index, doc_norms, self.corpus_size, 100,
+                                   base_dir=base_dir, bucket_name=bucket_name, deadline=deadline)
+        else:
+            top_100 = cosine_similarity(tokens, partial_index, base_dir, bucket_name).most_common(100)
+        return self._with_titles([doc_id for doc_id, _ in top_100])
+
+    def _search_og(self, endpoint, query, field, doc_norms=None, deadline=None):
         tokens = og_tokenize(query)
-        scored = cosine_similarity(tokens, partial_index)
-        top_100 = scored.most_common(100)
-        res = []
-        for doc_id, _ in top_100:
-            if doc_id % 2 == 0:
-                res.append((str(doc_id), self.doc_id_title_even_dict.get(doc_id)))
-            else:
-                res.append((str(doc_id), self.doc_id_title_odd_dict.get(doc_id)))
-        return res
 
-    def search_body(self, query):
-        og_text_index = InvertedIndex.read_index(self.og_text_idx_path, self.index_name)
-        return self.search_partial(query, og_text_index)
+        def compute():
+            # the raw-token index is opened once and shared (see self.indexes)
+            with self.indexes.acquire(field) as field_indexes:
+                field_index = field_indexes[field]
+                return self.search_partial(query, field_index.index, tokens, doc_norms,
+                                           field_index.base_dir, field_index.bucket_name, deadline)
+        return self._cached(endpoint, tokens, {}, compute, deadline)
+
+    def search_body(self, query, deadline=None):
+        """ Cosine search on the body index. The deadline is applied when the
+            document norms are stored (cosine_top_k), the Counter based fallback
+            scores every term.
+        """
+        doc_norms = None
+        if self.docs is not None and TEXT_NORM in self.docs.columns:
+            doc_norms = self.docs.lookup(TEXT_NORM)
+        return self._search_og('search_body', query, 'og_text', doc_norms, deadline)
+
+    def stream_matches(self, query, field, chunk_size=10000):
+        """ Yields ALL documents whose `field` ('og_title' or 'og_anchor') contains a
+            query word as lists of (wiki_id, title), ordered by the number of distinct
+            query words they match. Nothing is cached, so huge result sets are never
+            held in memory at once.
+        """
+        with self.indexes.acquire(field) as field_indexes:
+            engine = self._match_count_engine(field, field_indexes[field])
+            for doc_ids in engine.iter_doc_ids(og_tokenize(query), chunk_size):
+                yield self._with_titles(doc_ids.tolist())
+
+    def _search_matches(self, query, field):
+        """ Returns the whole stream_matches result as one list. It is not cached: a
+            common word matches hundreds of thousands of documents and the result
+            cache is bounded by entries, not bytes. The endpoints stream instead.
+        """
+        return [pair for chunk in self.stream_matches(query, field) for pair in chunk]
 
     def search_title(self, query):
-        og_title_index = InvertedIndex.read_index(self.og_title_idx_path, self.index_name)
-        return self.search_partial(query, og_title_index)
+        return self._search_matches(query, 'og_title')
 
     def search_anchor(self, query):
-        og_anchor_index = InvertedIndex.read_index(self.og_anchor_idx_path, self.index_name)
-        return self.search_partial(query, og_anchor_index)
+        return self._search_matches(query, 'og_anchor')
 
     def pagerank(self, page_ids):
-        res = []
-        for id in page_ids:
-            res.append(self.page_rank.get(id, 0.0))
-        return res
+        if self.docs is None or PAGERANK not in self.docs.columns:
+            # no store built yet, fall back to the PageRank CSVs
+            return [self.resident.pagerank.get(id, 0.0) for id in page_ids]
+        return self.docs.get(PAGERANK, page_ids, 0.0)
 
 
     def pageview(self, page_ids):
-        res = []
-        for id in page_ids:
-            res.append(self.page_views.get(id, 0.0))
-        return res
+        if self.docs is None:
+            return [0.0 for id in page_ids]
+        return self.docs.get(PAGEVIEW, page_ids, 0.0)
 
 
     def doc_titles(self,id_list):
-        res = []
-        for id in id_list:
-            if id % 2 == 0:
-                res.append(self.doc_id_title_even_dict.get(id))
-            else:
-                res.append(self.doc_id_title_odd_dict.get(id))
-        return res
+        if self.docs is None:
+            return [None for id in id_list]
+        return self.docs.titles(id_list)
 
 
-    def search_prm(self, query, in_text_weight = 0.65 ,in_title_weight = 0.25,in_anchor_weight = 0.1 ,in_pr_weight = 1 ,in_pv_weight = 1,k=1.2,b=0.5):
+    def search_prm(self, query, in_text_weight = 0.65 ,in_title_weight = 0.25,in_anchor_weight = 0.1 ,in_pr_weight = 1 ,in_pv_weight = 1,k=1.2,b=0.5,
+                   deadline=None):
         # tokenize the query and create candidates dictionaries for each index
         tokenized_query = tokenize(query)
+        params = dict(in_text_weight=in_text_weight, in_title_weight=in_title_weight,
+                      in_anchor_weight=in_anchor_weight, in_pr_weight=in_pr_weight,
+                      in_pv_weight=in_pv_weight, k=k, b=b)
+        return self._cached('search_prm', tokenized_query, params,
+                            lambda: self._search_prm_tokens(tokenized_query, **params, deadline=deadline),
+                            deadline)
 
-        # collect scores for query in text index using bm25
-        bm25_scores_text = BM25_score(tokenized_query, self.text_index, self.corpus_size,
-                                        self.text_doc_len_dict, self.text_avg_doc_len, k1=k, b=b)
-        text_bm25_scores_top_500 = bm25_scores_text.most_common(500)
+    def _search_prm_tokens(self, tokenized_query, in_text_weight, in_title_weight, in_anchor_weight,
+                           in_pr_weight, in_pv_weight, k, b, deadline=None):
+
+        # text (bm25), title and anchor (word count) top 500, possibly in parallel
+        text_bm25_scores_top_500, title_word_count_scores_top_500, anchor_word_count_scores_top_500 = \
+            self._score_fields(tokenized_query, k, b, deadline)
 
         # normalize text scores
         text_max_score = text_bm25_scores_top_500[0][1]
         text_bm25_scores_top_500 = [(pair[0], pair[1]/text_max_score) for pair in text_bm25_scores_top_500]
 
-        # collect scores for query in title index using binary word count
-        word_count_scores_title = word_count_score(tokenized_query, self.title_index)
-        title_word_count_scores_top_500 = word_count_scores_title.most_common(500)
-
         # normalize title scores
         title_max_score = title_word_count_scores_top_500[0][1]
         title_word_count_scores_top_500 = [(pair[0], pair[1]/title_max_score) for pair in title_word_count_scores_top_500]
 
-        # collect and merge scores for query in anchor index using word count
-        word_count_scores_anchor = word_count_score(tokenized_query, self.anchor_index)
-        anchor_word_count_scores_top_500 = word_count_scores_anchor.most_common(500)
-
         # normalize anchor scores
         anchor_max_score = anchor_word_count_scores_top_500[0][1]
         anchor_word_count_scores_top_500 = [(pair[0], pair[1]/anchor_max_score) for pair in anchor_word_count_scores_top_500]
@@ -274,14 +553,16 @@ class SearchEngine:
         anchor_weight = in_anchor_weight
         pr_weight = in_pr_weight
         pv_weight = in_pv_weight
+        candidates = list(set(text_bm25_dict) | set(title_word_count_dict) | set(anchor_word_count_dict))
+        page_ranks, page_views = self._normalized_pr_pv(candidates)
         weighted_scores = [
             (doc_id,
              text_bm25_dict.get(doc_id, 0.0) * text_weight +
              title_word_count_dict.get(doc_id, 0.0) * title_weight +
              anchor_word_count_dict.get(doc_id, 0.0) * anchor_weight +
-             self.page_rank.get(doc_id, 0.0) * pr_weight +
-             self.page_views.get(doc_id, 0.0) * pv_weight / self.views_max)
-            for doc_id in set(text_bm25_dict) | set(title_word_count_dict) | set(anchor_word_count_dict)
+             page_rank * pr_weight +
+             page_view * pv_weight)
+            for doc_id, page_rank, page_view in zip(candidates, page_ranks, page_views)
         ]
 
         # sort the combined scores, transform to a list of top 100 doc_ids
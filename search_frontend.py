@@ -1,9 +1,16 @@
-from collections import defaultdict
-from flask import Flask, request, jsonify, render_template
-from Backend.tokenizer import tokenize
-from Backend.data_Loader import load_index, load_pagerank
-import os
-import math
+from Backend.startup import StartupTimer
+# per-phase startup timing, reported by /ready
+startup = StartupTimer()
+
+with startup.phase('imports'):
+    from collections import defaultdict
+    from flask import Flask, Response, g, request, jsonify, render_template
+    from Backend.tokenizer import tokenize
+    import os
+    import math
+    import json
+    import signal
+    import argparse
 
 class MyFlaskApp(Flask):
     def run(self, host=None, port=None, debug=None, **options):
@@ -16,34 +23,166 @@ app = MyFlaskApp(__name__,
                  static_url_path='/static')
 app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
 
-# Global variables for data (loaded once)
-inverted_index = None
-pagerank_dict = None
 N_DOCS = 6348910  # Wikipedia size
+QUERIES_FILE = "queries_train.json"
+
+# The engine fills the process-wide resident data layer (index + PageRank) once,
+# every endpoint below shares it. The holder swaps in a new engine on reload.
+with startup.phase('imports'):
+    from search import SearchEngine
+    from Backend.hot_reload import EngineHolder
+    from Backend.prefork import PreforkServer, WORKER_THREADS, MAX_REQUESTS
+    from Backend.deadline import Deadline
+    from Backend.admission import AdmissionControl
+    from Backend.resident_data import create_resident_data, install_resident_data
+
+# 'eager' loads the engine on import, 'background' loads it in a thread while the
+# server starts (/ready answers 503 meanwhile), 'lazy' loads it on the first request
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'eager')
+
+# Optional shared secret for the /admin endpoints (X-Admin-Token header)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Time budget of /search and /search_body: when it runs out the best results so
+# far are returned with an `X-Search-Partial: 1` header (0 for no budget)
+QUERY_BUDGET_SECONDS = float(os.environ.get('QUERY_BUDGET_SECONDS', '2.0'))
+# Search requests admitted at once per process, more are rejected with 503 (0 for no limit)
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', '64'))
+# Queries accepted in one /search_batch request, more are rejected with 413
+MAX_BATCH_QUERIES = int(os.environ.get('MAX_BATCH_QUERIES', '100'))
+SEARCH_ENDPOINTS = {'search', 'search_batch', 'search_body', 'search_title', 'search_anchor'}
+admission = AdmissionControl(MAX_IN_FLIGHT)
+# pid of the pre-fork parent, set by serve_prefork before the workers are forked
+prefork_parent_pid = None
 
-from search import SearchEngine
-search_engine = SearchEngine()
+def load_queries(path=QUERIES_FILE):
+    """Load the training queries used for warm-up (empty list if unavailable)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return list(json.load(f))
+    except (OSError, ValueError):
+        return []
 
-def load_data():
-    """Load data only once, even with Flask's debug reloader."""
-    global inverted_index, pagerank_dict
-    
-    if inverted_index is None or pagerank_dict is None:
+def load_data(engine):
+    """Warm up the data of `engine` only once, even with Flask's debug reloader."""
+    if not engine.is_ready():
         print("="*50)
         print("🚀 Starting search engine...")
         print("="*50)
-        inverted_index = load_index()
-        pagerank_dict = load_pagerank()
+        n_warm = engine.warm_up(load_queries())
+        print(f"✓ Warm-up read {n_warm} posting lists")
         print("✓ All data loaded successfully!")
         print("="*50)
+    return engine
+
+def build_engine():
+    """Build a fresh, loaded and warmed up engine: the first one, or a new one next
+    to the serving one (hot reload). The phases of the first build are timed."""
+    timer = StartupTimer() if engines.is_loaded() else startup
+    resident = create_resident_data().load()
+    for name, seconds in resident.load_phases.items():
+        timer.record(f'load_{name}', seconds)
+    with timer.phase('engine'):
+        engine = SearchEngine(resident)
+    with timer.phase('warm_up'):
+        load_data(engine)
+    install_resident_data(resident)
+    if timer is startup:
+        startup.print_report()
+    return engine
+
+engines = EngineHolder(build_engine, lazy=True)
+if STARTUP_MODE != 'lazy':
+    # Load data when module is first imported
+    engines.start(background=STARTUP_MODE == 'background')
+
+def stream_matches(query, field):
+    """Stream the (wiki_id, title) list of a title/anchor query as a JSON array,
+    one chunk of results at a time, so ALL results are never built in memory."""
+    def generate():
+        with engines.acquire() as search_engine:
+            chunks = search_engine.stream_matches(query, field)
+            # the first chunk is read before anything is sent, so errors still become a 500
+            first = next(chunks, [])
+            yield '[' + json.dumps(first)[1:-1]
+            for chunk in chunks:
+                yield ',' + json.dumps(chunk)[1:-1]
+            yield ']'
+    response = Response(generate(), mimetype='application/json')
+    if g.pop('admitted', False):
+        # the work happens while the body streams, after teardown: hold the
+        # admission slot until the server closes the response
+        response.call_on_close(admission.release)
+    return response
+
+def with_partial_header(res, deadline):
+    """Return `res` as JSON, marked partial if the deadline cut scoring short."""
+    response = jsonify(res)
+    if deadline.partial:
+        response.headers['X-Search-Partial'] = '1'
+    return response
 
-# Load data when module is first imported
-load_data()
+@app.before_request
+def admit():
+    ''' Admission control: sheds search requests past MAX_IN_FLIGHT with a 503. '''
+    if request.endpoint in SEARCH_ENDPOINTS:
+        if not admission.try_acquire():
+            return jsonify({'error': 'overloaded'}), 503, {'Retry-After': '1'}
+        g.admitted = True
+
+@app.teardown_request
+def release(exc):
+    if g.pop('admitted', False):
+        admission.release()
 
 @app.route("/")
 def home():
     return render_template('index.html')
 
+@app.route("/ready")
+def ready():
+    ''' Readiness check: 200 once the index and PageRank are resident and warmed
+        up, 503 otherwise. Useful as a load balancer health check. Also reports
+        the time taken by every startup phase.
+    '''
+    if not engines.is_loaded():
+        # still starting, do not wait for (or trigger) the load
+        return jsonify({'ready': False, 'loaded': False, 'startup': startup.report()}), 503
+    with engines.acquire() as search_engine:
+        status = dict(search_engine.resident.status(), startup=startup.report())
+    return jsonify(status), (200 if status['ready'] else 503)
+
+@app.route("/stats")
+def stats():
+    ''' Returns the hit/miss/eviction counters of the shared caches and the
+        admission control counters.
+    '''
+    with engines.acquire() as search_engine:
+        return jsonify(dict(search_engine.resident.stats(), admission=admission.stats()))
+
+@app.route("/admin/reload", methods=['GET', 'POST'])
+def admin_reload():
+    ''' POST starts a hot reload of the index and data from disk: a new engine
+        is built in the background while the current one keeps serving, then
+        swapped in once in-flight queries finish. GET reports the current
+        generation and the duration and memory delta of the last reload.
+        In pre-fork mode (serve_prefork) POST signals the parent instead, which
+        reloads once and forks fresh workers, so all workers keep sharing one
+        generation.
+
+        Test this by issuing a POST request to a URL like:
+          http://YOUR_SERVER_DOMAIN/admin/reload
+    '''
+    if ADMIN_TOKEN is not None and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'forbidden'}), 403
+    if request.method == 'POST':
+        if prefork_parent_pid is not None:
+            os.kill(prefork_parent_pid, signal.SIGHUP)
+            return jsonify(dict(engines.status(), started=True, prefork=True)), 202
+        started = engines.reload(background=True)
+        return jsonify(dict(engines.status(), started=started)), 202 if started else 409
+    return jsonify(engines.status())
+
 @app.route("/search")
 def search():
     ''' Returns up to a 100 of your best search results for the query. This is 
@@ -67,9 +206,41 @@ def search():
     if len(query) == 0:
       return jsonify(res)
     # BEGIN SOLUTION
-    res = search_engine.search_basic(query)
+    deadline = Deadline(QUERY_BUDGET_SECONDS or None)
+    with engines.acquire() as search_engine:
+        res = search_engine.search_basic(query, deadline)
     # END SOLUTION
-    return jsonify(res)
+    return with_partial_header(res, deadline)
+
+@app.route("/search_batch", methods=['POST'])
+def search_batch():
+    ''' Returns the /search results of many queries at once. Posting lists of
+        terms shared by several queries are read only once.
+
+        Test this by issuing a POST request to a URL like:
+          http://YOUR_SERVER_DOMAIN/search_batch
+        with a json payload of the list of queries. In python do:
+          import requests
+          requests.post('http://YOUR_SERVER_DOMAIN/search_batch', json=['hello world', 'python'])
+        The whole batch shares the /search time budget and holds at most
+        MAX_BATCH_QUERIES queries.
+    Returns:
+    --------
+        list of result lists, one per query in the order of the payload, each
+        like the output of /search.
+    '''
+    res = []
+    queries = request.get_json()
+    if not queries:
+      return jsonify(res)
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'at most {MAX_BATCH_QUERIES} queries per batch'}), 413
+    # BEGIN SOLUTION
+    deadline = Deadline(QUERY_BUDGET_SECONDS or None)
+    with engines.acquire() as search_engine:
+        res = search_engine.search_batch([str(query) for query in queries], deadline=deadline)
+    # END SOLUTION
+    return with_partial_header(res, deadline)
 
 @app.route("/search_body")
 def search_body():
@@ -92,9 +263,11 @@ def search_body():
     if len(query) == 0:
       return jsonify(res)
     # BEGIN SOLUTION
-    res =search_engine.search_body(query)
+    deadline = Deadline(QUERY_BUDGET_SECONDS or None)
+    with engines.acquire() as search_engine:
+        res = search_engine.search_body(query, deadline)
     # END SOLUTION
-    return jsonify(res)
+    return with_partial_header(res, deadline)
 
 @app.route("/search_title")
 def search_title():
@@ -122,9 +295,8 @@ def search_title():
     if len(query) == 0:
       return jsonify(res)
     # BEGIN SOLUTION
-    res =search_engine.search_title(query)
+    return stream_matches(query, 'og_title')
     # END SOLUTION
-    return jsonify(res)
 
 @app.route("/search_anchor")
 def search_anchor():
@@ -152,9 +324,8 @@ def search_anchor():
     if len(query) == 0:
       return jsonify(res)
     # BEGIN SOLUTION
-    res = search_engine.search_anchor(query)
+    return stream_matches(query, 'og_anchor')
     # END SOLUTION
-    return jsonify(res)
 
 @app.route("/get_pagerank", methods=['POST'])
 def get_pagerank():
@@ -177,7 +348,8 @@ def get_pagerank():
     if len(wiki_ids) == 0:
       return jsonify(res)
     # BEGIN SOLUTION
-    res = search_engine.pagerank(wiki_ids)
+    with engines.acquire() as search_engine:
+        res = search_engine.pagerank(wiki_ids)
     # END SOLUTION
     return jsonify(res)
 
@@ -204,14 +376,42 @@ def get_pageview():
     if len(wiki_ids) == 0:
       return jsonify(res)
     # BEGIN SOLUTION
-    res = search_engine.pageview(wiki_ids)
+    with engines.acquire() as search_engine:
+        res = search_engine.pageview(wiki_ids)
     # END SOLUTION
     return jsonify(res)
 
 def run(**options):
     app.run(**options)
 
+def serve_prefork(host='0.0.0.0', port=8080, workers=None, threads=WORKER_THREADS,
+                  max_requests=MAX_REQUESTS):
+    """Production mode: load the engine once, then fork `workers` processes that
+    share its memory (see Backend/prefork.py). In this mode, reload the index for
+    all workers with `kill -HUP <parent pid>` or POST /admin/reload, which sends
+    that signal."""
+    global prefork_parent_pid
+    prefork_parent_pid = os.getpid()
+    PreforkServer(app, host, port, workers, threads, max_requests,
+                  preload=lambda: engines.start(background=False),
+                  on_reload=lambda: engines.reload(background=False)).serve()
+
 if __name__ == '__main__':
-    # run the Flask RESTful API, make the server publicly available (host='0.0.0.0') on port 8080
-    # use_reloader=False prevents double loading in debug mode
-    app.run(host='0.0.0.0', port=8080, debug=True, use_reloader=False)
+    parser = argparse.ArgumentParser(description="Run the search engine server.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=0,
+                        help="pre-forked worker processes (-1 for one per core); "
+                             "0 runs the single-process Flask debug server")
+    parser.add_argument('--threads', type=int, default=WORKER_THREADS,
+                        help="concurrent requests per worker")
+    parser.add_argument('--max-requests', type=int, default=MAX_REQUESTS,
+                        help="requests served before a worker is recycled (0 for never)")
+    args = parser.parse_args()
+    if args.workers == 0:
+        # run the Flask RESTful API, make the server publicly available (host='0.0.0.0') on port 8080
+        # use_reloader=False prevents double loading in debug mode
+        app.run(host=args.host, port=args.port, debug=True, use_reloader=False)
+    else:
+        serve_prefork(args.host, args.port, None if args.workers < 0 else args.workers,
+                      args.threads, args.max_requests)
@@ -0,0 +1,114 @@
+"""
+Test per-query deadlines (rarest terms first, partial results) and admission control.
+Run: python tests/test_deadline.py
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from Backend.admission import AdmissionControl
+from Backend.deadline import Deadline, rarest_first
+from Backend.ranking import BM25Engine
+from Backend.hot_reload import EngineHolder
+import inverted_index_gcp
+from inverted_index_gcp import InvertedIndex
+from test_inverted_index import build_index
+from test_ranking import FakeIndex
+from test_search_engine import build_engine
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_deadline():
+    """Test that an expired deadline keeps the rarest term and marks the result partial."""
+    index = FakeIndex()
+    avg_len = sum(index.doc_lengths.values()) / len(index.doc_lengths)
+    engine = BM25Engine(index, index.doc_lengths, avg_len, 6348910)
+    query = ['common', 'python', 'rare', 'missing']
+    clock = FakeClock()
+
+    # Test 1: without a deadline every term is scored, in query order
+    assert list(rarest_first(query, index.df)) == query
+    deadline = Deadline(1.0, clock)
+    assert engine.top_k(query, 50, deadline=deadline) == engine.top_k(query, 50)
+    assert not deadline.partial
+    print("✓ within budget")
+
+    # Test 2: once the budget is spent only the rarest term is scored
+    clock.now = 2.0
+    assert list(rarest_first(query, index.df, deadline)) == ['rare']
+    deadline = Deadline(0.0, clock)
+    assert engine.top_k(query, 50, deadline=deadline) == engine.top_k(['rare'], 50)
+    assert deadline.partial
+    print("✓ partial results")
+
+
+def test_rarest_first_compact_index():
+    """Test that tokens missing from a compact term dictionary still go last."""
+    original_block_size = inverted_index_gcp.BLOCK_SIZE
+    try:
+        with tempfile.TemporaryDirectory() as base_dir:
+            build_index(base_dir).write_compact(base_dir, 'index')
+            index = InvertedIndex.read_compact(base_dir, 'index')
+            clock = FakeClock()
+            deadline = Deadline(0.0, clock)
+            assert list(rarest_first(['zzz', 'python', 'java'], index.df, deadline)) == ['java']
+            assert list(rarest_first(['zzz', 'python', 'java'], index.df, Deadline(1.0, clock))) == \
+                ['java', 'python', 'zzz']
+            index.close()
+            print("✓ rarest first over a compact term dictionary")
+    finally:
+        inverted_index_gcp.BLOCK_SIZE = original_block_size
+
+
+def test_admission_control():
+    """Test that requests past the queue depth are rejected."""
+    admission = AdmissionControl(2)
+    assert admission.try_acquire() and admission.try_acquire()
+    assert not admission.try_acquire()
+    admission.release()
+    assert admission.try_acquire()
+    assert admission.stats() == {'max_in_flight': 2, 'in_flight': 2, 'admitted': 3, 'rejected': 1}
+    print("✓ admission control")
+
+
+def test_streaming_admission():
+    """Test that a streamed /search_title response holds its slot until it is closed."""
+    os.environ.setdefault('STARTUP_MODE', 'lazy')
+    import search_frontend
+    with tempfile.TemporaryDirectory() as base_dir:
+        engine, dirs = build_engine(base_dir)
+        engine.indexes.register('og_title', dirs['title'])
+        original = search_frontend.engines, search_frontend.admission
+        search_frontend.engines = EngineHolder(lambda: engine)
+        search_frontend.admission = admission = AdmissionControl(1)
+        try:
+            client = search_frontend.app.test_client()
+            response = client.get('/search_title?query=python+programming')
+            assert response.status_code == 200 and admission.in_flight == 1
+            assert client.get('/search?query=python').status_code == 503
+            assert [doc_id for doc_id, _ in response.get_json()] == ['1', '2', '3', '7']
+            response.close()
+            assert admission.stats()['in_flight'] == 0 and admission.rejected == 1
+            print("✓ streamed responses hold their admission slot")
+        finally:
+            search_frontend.engines, search_frontend.admission = original
+            engine.close()
+
+
+if __name__ == "__main__":
+    test_deadline()
+    test_rarest_first_compact_index()
+    test_admission_control()
+    test_streaming_admission()
+    print("✅ ALL DEADLINE TESTS PASSED!")
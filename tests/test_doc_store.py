@@ -0,0 +1,57 @@
+"""
+Test the memory-mapped doc-attribute store.
+Run: python tests/test_doc_store.py
+"""
+
+import sys
+import math
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+from Backend.doc_store import DocAttributeStore, PAGERANK, PAGEVIEW, TEXT_LEN, TEXT_NORM
+
+
+def test_doc_store():
+    """Test building, reopening and querying the store."""
+    columns = {
+        PAGERANK: {12: 0.5, 7: 2.0},
+        PAGEVIEW: {7: 100, 30: 5},
+        TEXT_LEN: {12: 250, 30: 40},
+    }
+    titles = {7: 'Python (programming language)', 12: 'Tel Aviv', 30: 'Zürich'}
+
+    with tempfile.TemporaryDirectory() as path:
+        DocAttributeStore.build(path, columns, titles)
+        store = DocAttributeStore(path)
+
+        # Test 1: doc_id -> row mapping
+        assert len(store) == 3
+        assert store.rows([7, 12, 30, 8]).tolist() == [0, 1, 2, -1]
+        print("✓ rows")
+
+        # Test 2: column lookups with defaults for missing values and documents
+        assert store.get(PAGERANK, [7, 30, 99]) == [2.0, 0.0, 0.0]
+        assert store.get(PAGEVIEW, [30, 12]) == [5.0, 0.0]
+        lengths = store.lookup(TEXT_LEN)([12, 7])
+        assert lengths[0] == 250 and math.isnan(lengths[1])
+        assert store.stats[PAGERANK]['max'] == 2.0 and store.stats[TEXT_LEN]['sum'] == 290
+        print("✓ column lookups")
+
+        # Test 3: titles from the offsets + blob files
+        assert store.titles([30, 7, 99]) == ['Zürich', 'Python (programming language)', None]
+        print("✓ titles")
+
+        # Test 4: columns computed later (e.g. tf-idf norms) survive reopening
+        store.add_column(TEXT_NORM, np.array([30, 12, 99]), np.array([1.5, 2.5, 9.0]))
+        reopened = DocAttributeStore(path)
+        assert reopened.get(TEXT_NORM, [7, 12, 30]) == [0.0, 2.5, 1.5]
+        assert reopened.stats[TEXT_NORM]['count'] == 2
+        print("✓ added column")
+
+
+if __name__ == "__main__":
+    test_doc_store()
+    print("✅ ALL DOC STORE TESTS PASSED!")
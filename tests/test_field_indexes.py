@@ -0,0 +1,75 @@
+"""
+Test the registry of named field indexes.
+Run: python tests/test_field_indexes.py
+"""
+
+import sys
+import pickle
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from Backend.field_indexes import IndexRegistry
+from Backend.posting_cache import PostingCache
+from Backend.ranking import word_count_score
+from inverted_index_gcp import InvertedIndex
+
+
+def write_index(base_dir, postings):
+    """Writes a one-bucket index of `postings` to base_dir."""
+    index = InvertedIndex()
+    index.df.update({w: len(pl) for w, pl in postings.items()})
+    InvertedIndex.write_a_posting_list((0, list(postings.items())), base_dir)
+    with open(Path(base_dir) / '0_posting_locs.pickle', 'rb') as f:
+        index.posting_locs.update(pickle.load(f))
+    index.write_index(base_dir, 'index')
+
+
+def test_index_registry():
+    """Test that field indexes are opened once, read from their own dir and can be swapped."""
+    with tempfile.TemporaryDirectory() as old_dir, tempfile.TemporaryDirectory() as new_dir:
+        write_index(old_dir, {'python': [(1, 2), (4, 1)]})
+        write_index(new_dir, {'python': [(7, 3)], 'java': [(7, 1)]})
+        registry = IndexRegistry(PostingCache())
+
+        # Test 1: opened lazily, once, with the shared posting cache attached
+        field_index = registry.register('og_title', old_dir)
+        assert not field_index.is_open()
+        index = registry.index('og_title')
+        assert registry.index('og_title') is index and index.posting_cache is registry.posting_cache
+        print("✓ opened once")
+
+        # Test 2: rankers read from the field's own directory, not "."
+        scores = word_count_score(['python'], index, field_index.base_dir)
+        assert dict(scores) == {1: 1, 4: 1}
+        print("✓ per-field base dir")
+
+        # Test 3: swapping installs the new index and closes the old one
+        swapped = registry.swap('og_title', new_dir)
+        assert registry.get('og_title') is swapped and not field_index.is_open()
+        scores = word_count_score(['python', 'java'], registry.index('og_title'), swapped.base_dir)
+        assert dict(scores) == {7: 2}
+        print("✓ swap")
+
+        # Test 4: an index republished in place is not served the cached lists of the old one
+        assert registry.index('og_title').read_a_posting_list(new_dir, 'python') == [(7, 3)]
+        write_index(new_dir, {'python': [(2, 5), (9, 1)]})
+        republished = registry.swap('og_title', new_dir)
+        assert republished.index.read_a_posting_list(new_dir, 'python') == [(2, 5), (9, 1)]
+        print("✓ no stale cached postings after an in-place swap")
+
+        # Test 5: an index still read by a request is closed once that request is done
+        with registry.acquire('og_title') as field_indexes:
+            in_use = field_indexes['og_title']
+            registry.swap('og_title', old_dir)
+            assert in_use.is_open() and registry.get('og_title') is not in_use
+            assert in_use.index.read_a_posting_list(new_dir, 'python') == [(2, 5), (9, 1)]
+        assert not in_use.is_open()
+        registry.close()
+        print("✓ swapped out index drained before closing")
+
+
+if __name__ == "__main__":
+    test_index_registry()
+    print("✅ ALL FIELD INDEX TESTS PASSED!")
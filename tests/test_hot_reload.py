@@ -0,0 +1,90 @@
+"""
+Test swapping search engines without dropping in-flight requests.
+Run: python tests/test_hot_reload.py
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from Backend.hot_reload import EngineHolder
+
+
+class FakeEngine:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_engine_holder():
+    """Test that a reload drains the old engine before closing it."""
+    built = []
+
+    def factory():
+        built.append(FakeEngine(len(built) + 1))
+        return built[-1]
+
+    holder = EngineHolder(factory, drain_timeout=5)
+    started, release = threading.Event(), threading.Event()
+
+    def long_query():
+        with holder.acquire() as engine:
+            started.set()
+            release.wait()
+            assert not engine.closed
+
+    query = threading.Thread(target=long_query)
+    query.start()
+    started.wait()
+
+    # Test 1: new requests get the new engine while the old one drains
+    assert holder.reload()
+    while holder.engine.number != 2:
+        threading.Event().wait(0.01)
+    with holder.acquire() as engine:
+        assert engine.number == 2
+    assert not built[0].closed and holder.status()['reloading']
+    print("✓ swap")
+
+    # Test 2: only one reload at a time
+    assert not holder.reload()
+    print("✓ single reload")
+
+    # Test 3: the old engine is closed once its last request is done
+    release.set()
+    query.join()
+    while holder.status()['reloading']:
+        threading.Event().wait(0.01)
+    report = holder.status()['last_reload']
+    assert built[0].closed and not built[1].closed
+    assert report['drained'] and report['generation'] == 2 and 'rss_delta' in report
+    print("✓ drain and close")
+
+    # Test 4: a failed build keeps serving the current engine
+    holder._factory = lambda: 1 / 0
+    holder.reload(background=False)
+    assert holder.engine is built[1] and 'ZeroDivisionError' in holder.status()['last_reload']['error']
+    print("✓ failed reload")
+
+
+def test_lazy_start():
+    """Test that a lazy holder builds its first engine on start() or first use only."""
+    built = []
+    holder = EngineHolder(lambda: built.append(FakeEngine(1)) or built[-1], lazy=True)
+    assert not built and not holder.is_loaded() and holder.status()['generation'] == 0
+    with holder.acquire() as engine:
+        assert engine is built[0]
+    holder.start(background=False)
+    assert len(built) == 1 and holder.is_loaded()
+    print("✓ lazy start")
+
+
+if __name__ == "__main__":
+    test_engine_holder()
+    test_lazy_start()
+    print("✅ ALL HOT RELOAD TESTS PASSED!")
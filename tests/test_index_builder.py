@@ -0,0 +1,67 @@
+"""
+Test the local streaming index builder against the in-memory InvertedIndex.
+Run: python tests/test_index_builder.py
+"""
+
+import sys
+import pickle
+import random
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from Backend.index_builder import build_index
+from Backend.tokenizer import tokenize
+from inverted_index_gcp import InvertedIndex, POSTING_FORMAT_V1, POSTING_FORMAT_V2
+
+WORDS = ['python', 'java', 'language', 'programming', 'snake', 'coffee', 'island',
+         'war', 'city', 'river', 'the', 'and']
+
+
+def make_docs(n_docs=300, seed=5):
+    """Random documents, in shuffled doc_id order."""
+    rng = random.Random(seed)
+    docs = [(doc_id, ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 40))))
+            for doc_id in range(1, n_docs + 1)]
+    rng.shuffle(docs)
+    return docs
+
+
+def test_build_index():
+    """Test that spilled and merged runs give the same index as building in memory."""
+    docs = make_docs()
+    expected = InvertedIndex({doc_id: tokenize(text) for doc_id, text in docs})
+
+    for posting_format in [POSTING_FORMAT_V1, POSTING_FORMAT_V2]:
+        with tempfile.TemporaryDirectory() as base_dir:
+            # a tiny budget forces many runs
+            build_index(iter(docs), base_dir, workers=2, memory_budget=20000, chunk_size=25,
+                        posting_format=posting_format)
+            index = InvertedIndex.read_index(base_dir, 'index')
+
+            # Test 1: global stats ('the'/'and' are stopwords)
+            assert dict(index.df) == dict(expected.df)
+            assert dict(index.term_total) == dict(expected.term_total)
+            assert 'the' not in index.df
+            print("✓ df and term_total")
+
+            # Test 2: posting lists sorted by doc_id
+            for w, pl in expected._posting_list.items():
+                assert index.read_a_posting_list(base_dir, w) == sorted(pl)
+            index.close()
+            print("✓ posting lists")
+
+            # Test 3: notebook layout, the run files are gone
+            with open(Path(base_dir) / 'doc_lengths.pickle', 'rb') as f:
+                doc_lengths = pickle.load(f)
+            assert doc_lengths == {doc_id: len(tokenize(text)) for doc_id, text in docs}
+            assert all(Path(base_dir, f"{locs[0][0].rsplit('_', 1)[0]}_posting_locs.pickle").exists()
+                       for locs in index.posting_locs.values())
+            assert not list(Path(base_dir).glob('runs_*'))
+            print("✓ output layout")
+
+
+if __name__ == "__main__":
+    test_build_index()
+    print("✅ ALL INDEX BUILDER TESTS PASSED!")
@@ -0,0 +1,184 @@
+"""
+Test reading posting lists back from a small on-disk index.
+Run: python tests/test_inverted_index.py
+"""
+
+import sys
+import pickle
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import inverted_index_gcp
+from inverted_index_gcp import (InvertedIndex, MmapFileReader, LocalBucket, convert_index,
+                                register_bucket, encode_posting_list_v2, decode_posting_list_v2,
+                                probe_posting_list_v2, POSTING_FORMAT_V2, POSTINGS_PER_BLOCK)
+
+POSTINGS = {
+    'python': [(1, 2), (5, 3), (9, 1), (12, 7), (20, 1), (33, 2), (70000, 65535)],
+    'java': [(3, 1)],
+}
+
+
+def build_index(base_dir, block_size=30):
+    """Writes POSTINGS to `base_dir` with tiny files so lists span several files."""
+    inverted_index_gcp.BLOCK_SIZE = block_size
+    index = InvertedIndex()
+    for w, pl in POSTINGS.items():
+        index.df[w] = len(pl)
+        index.term_total[w] = sum(tf for _, tf in pl)
+    InvertedIndex.write_a_posting_list((0, list(POSTINGS.items())), base_dir)
+    with open(Path(base_dir) / '0_posting_locs.pickle', 'rb') as f:
+        index.posting_locs.update(pickle.load(f))
+    index.write_index(base_dir, 'index')
+    return InvertedIndex.read_index(base_dir, 'index')
+
+
+def test_read_posting_lists():
+    """Test that posting lists round-trip through the persistent mmap reader."""
+    original_block_size = inverted_index_gcp.BLOCK_SIZE
+    try:
+        with tempfile.TemporaryDirectory() as base_dir:
+            index = build_index(base_dir)
+
+            # Test 1: single posting lists, including one spanning two files
+            for w, pl in POSTINGS.items():
+                assert index.read_a_posting_list(base_dir, w) == pl
+            assert index.read_a_posting_list(base_dir, 'missing') == []
+            print("✓ read_a_posting_list")
+
+            # Test 2: iterating over all posting lists
+            assert dict(index.posting_lists_iter(base_dir)) == POSTINGS
+            print("✓ posting_lists_iter")
+
+            # Test 3: NumPy decoding into parallel arrays
+            doc_ids, tfs = index.read_a_posting_array(base_dir, 'python')
+            assert doc_ids.tolist() == [doc_id for doc_id, _ in POSTINGS['python']]
+            assert tfs.tolist() == [tf for _, tf in POSTINGS['python']]
+            doc_ids, tfs = index.read_a_posting_array(base_dir, 'missing')
+            assert len(doc_ids) == 0 and len(tfs) == 0
+            print("✓ read_a_posting_array")
+
+            # Test 4: the reader is persistent and returns zero-copy views
+            reader = index._reader(base_dir)
+            assert index._reader(base_dir) is reader
+            view = reader.read(index.posting_locs['java'], 6)
+            assert isinstance(view, memoryview) and bytes(view) == (3 << 16 | 1).to_bytes(6, 'big')
+            del view
+            index.close()
+            print("✓ persistent mmap reader")
+    finally:
+        inverted_index_gcp.BLOCK_SIZE = original_block_size
+
+
+def test_convert_to_compressed_format():
+    """Test that a converted (version 2) index reads back the same postings."""
+    original_block_size = inverted_index_gcp.BLOCK_SIZE
+    try:
+        with tempfile.TemporaryDirectory() as src_dir, tempfile.TemporaryDirectory() as dst_dir:
+            build_index(src_dir)
+            index = convert_index(src_dir, dst_dir, 'index')
+            assert index.posting_format == POSTING_FORMAT_V2
+            index = InvertedIndex.read_index(dst_dir, 'index')
+
+            # Test 1: the old and the new format decode to the same posting lists
+            for w, pl in POSTINGS.items():
+                assert index.read_a_posting_list(dst_dir, w) == pl
+            assert dict(index.posting_lists_iter(dst_dir)) == POSTINGS
+            print("✓ version 2 round-trip")
+
+            # Test 2: probing through the skip table
+            tfs = index.probe_posting_list(dst_dir, 'python', [5, 6, 70000, 99999999])
+            assert tfs.tolist() == [3, 0, 65535, 0]
+            index.close()
+            print("✓ version 2 probe")
+
+        # Test 3: a list spanning several skip blocks (128 + 128 + 44 postings)
+        n = 2 * POSTINGS_PER_BLOCK + 44
+        doc_ids = [3 * i + 1 for i in range(n)]
+        tfs = [i % 7 + 1 for i in range(n)]
+        b = encode_posting_list_v2(doc_ids, tfs)
+        decoded_doc_ids, decoded_tfs = decode_posting_list_v2(b, n)
+        assert decoded_doc_ids.tolist() == doc_ids and decoded_tfs.tolist() == tfs
+        # first and last doc_id of every block, gaps between postings, before and past the list
+        probes = [0, 1]
+        for i in (POSTINGS_PER_BLOCK - 1, POSTINGS_PER_BLOCK, 2 * POSTINGS_PER_BLOCK - 1,
+                  2 * POSTINGS_PER_BLOCK, n - 1):
+            probes += [doc_ids[i], doc_ids[i] + 1]
+        probes += [doc_ids[-1] + 100, doc_ids[POSTINGS_PER_BLOCK]]
+        expected = {doc_id: tf for doc_id, tf in zip(doc_ids, tfs)}
+        assert probe_posting_list_v2(b, n, probes).tolist() == [expected.get(d, 0) for d in probes]
+        print("✓ version 2 multi-block probe")
+    finally:
+        inverted_index_gcp.BLOCK_SIZE = original_block_size
+
+
+def test_compact_term_dictionary():
+    """Test that the memory-mapped term dictionary answers like the pickled index."""
+    original_block_size = inverted_index_gcp.BLOCK_SIZE
+    try:
+        with tempfile.TemporaryDirectory() as base_dir:
+            pickled = build_index(base_dir)
+            pickled.max_impact[(1.2, 0.75)] = {'python': 2.5, 'java': 1.0}
+            pickled.write_compact(base_dir, 'index')
+            index = InvertedIndex.read_compact(base_dir, 'index')
+
+            # Test 1: term stats and lookups, missing terms behave like the Counters
+            assert len(index.df) == len(pickled.df)
+            for w in POSTINGS:
+                assert w in index.df and w in index.posting_locs
+                assert index.df[w] == pickled.df[w]
+                assert index.term_total[w] == pickled.term_total[w]
+                assert index.posting_locs[w] == pickled.posting_locs[w]
+            assert 'missing' not in index.posting_locs and index.df['missing'] == 0
+            assert index.max_impact[(1.2, 0.75)]['python'] == 2.5
+            print("✓ term dictionary lookups")
+
+            # Test 2: posting lists read through the compact dictionary
+            assert dict(index.posting_lists_iter(base_dir)) == POSTINGS
+            index.close()
+            print("✓ posting lists through the term dictionary")
+    finally:
+        inverted_index_gcp.BLOCK_SIZE = original_block_size
+
+
+def test_bucket_range_reads():
+    """Test batched posting reads from a bucket, served by the filesystem stand-in."""
+    original_block_size = inverted_index_gcp.BLOCK_SIZE
+    try:
+        with tempfile.TemporaryDirectory() as src_dir, tempfile.TemporaryDirectory() as dst_dir:
+            build_index(src_dir)
+            bucket = LocalBucket(src_dir)
+            register_bucket('test-bucket', bucket)
+            index = InvertedIndex.read_index(src_dir, 'index')
+
+            # Test 1: 'python' spans both files and 'java' follows it in the second one,
+            # the three byte ranges are merged into one request per file
+            postings = index.read_posting_arrays(src_dir, ['python', 'java', 'missing', 'java'], 'test-bucket')
+            assert set(postings) == {'python', 'java'}
+            for w, (doc_ids, tfs) in postings.items():
+                assert list(zip(doc_ids.tolist(), tfs.tolist())) == POSTINGS[w]
+            assert bucket.range_requests == 2
+            assert index.read_a_posting_list(src_dir, 'python', 'test-bucket') == POSTINGS['python']
+            index.close()
+            print("✓ merged range reads")
+
+            # Test 2: version 2 lists read their headers first
+            convert_index(src_dir, dst_dir, 'index')
+            register_bucket('test-bucket', LocalBucket(dst_dir))
+            index = InvertedIndex.read_index(dst_dir, 'index')
+            postings = index.read_posting_arrays(dst_dir, POSTINGS, 'test-bucket')
+            assert {w: list(zip(d.tolist(), t.tolist())) for w, (d, t) in postings.items()} == POSTINGS
+            index.close()
+            print("✓ version 2 range reads")
+    finally:
+        inverted_index_gcp.BLOCK_SIZE = original_block_size
+
+
+if __name__ == "__main__":
+    test_read_posting_lists()
+    test_convert_to_compressed_format()
+    test_compact_term_dictionary()
+    test_bucket_range_reads()
+    print("✅ ALL INVERTED INDEX TESTS PASSED!")
@@ -0,0 +1,61 @@
+"""
+Test the byte-bounded posting list cache.
+Run: python tests/test_posting_cache.py
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+from Backend.posting_cache import PostingCache, LRU, LFU
+
+
+def postings(n):
+    """(doc_ids, tfs) arrays taking n * 12 bytes."""
+    return np.arange(n, dtype=np.int64), np.ones(n, dtype=np.int32)
+
+
+def test_lru_eviction():
+    """Test that LRU evicts the least recently used list once the byte bound is hit."""
+    cache = PostingCache(max_bytes=1200, policy=LRU)
+    cache.put('a', postings(40))
+    cache.put('b', postings(40))
+    assert cache.get('a') is not None  # 'b' is now the least recently used
+    cache.put('c', postings(40))
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+    assert cache.bytes <= cache.max_bytes
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['evictions']) == (1, 1)
+    assert cache.get('b') is None and cache.stats()['misses'] == 1
+    print("✓ LRU eviction")
+
+    # replacing a list by a larger one still respects the byte bound
+    cache.put('c', postings(90))
+    assert 'a' not in cache and 'c' in cache and cache.bytes <= cache.max_bytes
+    print("✓ replace within the bound")
+
+
+def test_lfu_eviction():
+    """Test that LFU keeps the frequently read lists."""
+    cache = PostingCache(max_bytes=1200, policy=LFU)
+    cache.put('a', postings(40))
+    cache.put('b', postings(40))
+    for _ in range(3):
+        cache.get('b')
+    cache.get('a')
+    cache.put('c', postings(40))
+    assert 'b' in cache and 'c' in cache and 'a' not in cache
+
+    # lists larger than the whole cache are not stored
+    cache.put('huge', postings(1000))
+    assert 'huge' not in cache
+    print("✓ LFU eviction")
+
+
+if __name__ == "__main__":
+    test_lru_eviction()
+    test_lfu_eviction()
+    print("✅ ALL POSTING CACHE TESTS PASSED!")
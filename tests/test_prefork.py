@@ -0,0 +1,72 @@
+"""
+Test the pre-fork server: shared preloaded data, worker recycling and graceful stop.
+Run: python tests/test_prefork.py
+"""
+
+import sys
+import os
+import re
+import signal
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+SERVER = """
+import os, sys
+sys.path.append({root!r})
+from Backend.prefork import PreforkServer
+
+data = {{}}
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [f"{{os.getpid()}} {{data['loaded_by']}}".encode()]
+
+PreforkServer(app, '127.0.0.1', 0, workers=2, threads=2, max_requests=3, max_requests_jitter=0,
+              preload=lambda: data.update(loaded_by=os.getpid())).serve()
+"""
+
+
+def get(port):
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=10) as response:
+        return response.read().decode().split()
+
+
+def test_prefork_server():
+    """Test that workers serve data loaded once by the parent and are recycled."""
+    root = str(Path(__file__).parent.parent)
+    server = subprocess.Popen([sys.executable, '-u', '-c', SERVER.format(root=root)],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        line = server.stdout.readline()
+        port = int(re.search(r':(\d+) with', line).group(1))
+        parent = int(re.search(r'parent pid (\d+)', line).group(1))
+
+        # Test 1: workers are forked after the preload, which ran once in the parent
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            responses = list(pool.map(lambda _: get(port), range(24)))
+        worker_pids = {int(pid) for pid, _ in responses}
+        assert {int(loaded_by) for _, loaded_by in responses} == {parent}
+        assert parent not in worker_pids
+        print("✓ preloaded once, served by workers")
+
+        # Test 2: workers exit after ~3 requests (plus the ones already accepted) and are replaced
+        assert len(worker_pids) > 2, worker_pids
+        print("✓ worker recycling")
+
+        # Test 3: SIGTERM stops the workers and the parent
+        os.kill(server.pid, signal.SIGTERM)
+        assert server.wait(timeout=10) == 0
+        print("✓ graceful stop")
+    finally:
+        if server.poll() is None:
+            server.kill()
+        server.stdout.close()
+
+
+if __name__ == "__main__":
+    test_prefork_server()
+    print("✅ ALL PREFORK TESTS PASSED!")
@@ -0,0 +1,200 @@
+"""
+Test the array based rankers against the reference implementations.
+Run: python tests/test_ranking.py
+"""
+
+import sys
+import math
+import pickle
+import random
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+from Backend.ranking import (BM25_score, BM25Engine, word_count_score, word_count_top_k,
+                             bm25_top_k_from_arrays, doc_tfidf_norms, cosine_top_k,
+                             MatchCountEngine)
+from inverted_index_gcp import InvertedIndex
+
+
+class FakeIndex:
+    """In-memory stand-in for InvertedIndex with random sorted posting lists."""
+
+    def __init__(self, n_docs=2000, seed=7):
+        rng = random.Random(seed)
+        self.postings = {}
+        for term, df in [('python', 900), ('java', 120), ('rare', 3), ('common', 1800)]:
+            doc_ids = sorted(rng.sample(range(1, n_docs), df))
+            self.postings[term] = [(doc_id, rng.randint(1, 40)) for doc_id in doc_ids]
+        self.df = {term: len(pl) for term, pl in self.postings.items()}
+        self.posting_locs = {term: [] for term in self.postings}
+        # a few documents have no length, both scorers must skip them
+        self.doc_lengths = {doc_id: rng.randint(5, 3000) for doc_id in range(1, n_docs)
+                            if doc_id % 97 != 0}
+
+    def read_a_posting_list(self, base_dir, w, bucket_name=None):
+        return self.postings.get(w, [])
+
+    def read_a_posting_array(self, base_dir, w, bucket_name=None):
+        pl = self.postings.get(w, [])
+        return (np.array([d for d, _ in pl], dtype=np.int64),
+                np.array([tf for _, tf in pl], dtype=np.int32))
+
+
+def test_bm25_engine():
+    """Test that BM25Engine reproduces BM25_score exactly."""
+    index = FakeIndex()
+    avg_len = sum(index.doc_lengths.values()) / len(index.doc_lengths)
+    engine = BM25Engine(index, index.doc_lengths, avg_len, 6348910)
+
+    for query in [['python'], ['python', 'java', 'missing'], ['rare', 'common', 'rare']]:
+        for k1, b in [(1.2, 0.75), (1.5, 0.4), (1.2, 0.6)]:
+            expected = BM25_score(query, index, 6348910, index.doc_lengths, avg_len, k1=k1, b=b)
+            doc_ids, scores = engine.score(query, k1=k1, b=b)
+            assert dict(zip(doc_ids.tolist(), scores.tolist())) == dict(expected)
+
+            top = engine.top_k(query, 50, k1=k1, b=b)
+            assert [s for _, s in top] == [s for _, s in expected.most_common(50)]
+    print("✓ BM25Engine matches BM25_score")
+
+    assert engine.top_k(['missing'], 10) == []
+    print("✓ empty query")
+
+
+def test_array_field_scorers():
+    """Test the picklable scorers used by the parallel search_prm fields."""
+    index = FakeIndex()
+    avg_len = sum(index.doc_lengths.values()) / len(index.doc_lengths)
+    engine = BM25Engine(index, index.doc_lengths, avg_len, 6348910)
+    query = ['python', 'java', 'rare', 'java']
+
+    term_arrays = [engine.term_arrays(token) for token in query]
+    assert bm25_top_k_from_arrays(term_arrays, avg_len, 50, k1=1.5, b=0.4) == engine.top_k(query, 50, k1=1.5, b=0.4)
+    print("✓ BM25 from read arrays")
+
+    counts = word_count_score(query, index)
+    top = word_count_top_k([index.read_a_posting_array('.', token)[0] for token in query], 100)
+    assert all(counts[doc_id] == count for doc_id, count in top)
+    assert [c for _, c in top] == [c for _, c in counts.most_common(100)]
+    print("✓ word count from read arrays")
+
+
+def write_index(fake, base_dir):
+    """Writes the posting lists of a FakeIndex to disk as a real InvertedIndex."""
+    index = InvertedIndex()
+    index.df.update(fake.df)
+    InvertedIndex.write_a_posting_list((0, list(fake.postings.items())), base_dir)
+    with open(Path(base_dir) / '0_posting_locs.pickle', 'rb') as f:
+        index.posting_locs.update(pickle.load(f))
+    return index
+
+
+def test_bm25_pruned_top_k():
+    """Test that MaxScore pruning returns the same top k as exhaustive scoring."""
+    fake = FakeIndex(n_docs=20000, seed=3)
+    avg_len = sum(fake.doc_lengths.values()) / len(fake.doc_lengths)
+    with tempfile.TemporaryDirectory() as base_dir:
+        index = write_index(fake, base_dir)
+        engine = BM25Engine(index, fake.doc_lengths, avg_len, 6348910, base_dir=base_dir)
+
+        # without stored bounds the pruned path falls back to exhaustive scoring
+        assert engine.top_k_pruned(['python', 'rare'], 10) == engine.top_k(['python', 'rare'], 10)
+
+        engine.build_max_impacts(k1=1.2, b=0.6)
+        for query in [['rare', 'common'], ['java', 'python', 'common'], ['rare', 'rare', 'python']]:
+            for k in [1, 5, 50]:
+                exhaustive = engine.top_k(query, k, k1=1.2, b=0.6)
+                pruned = engine.top_k_pruned(query, k, k1=1.2, b=0.6)
+                assert [d for d, _ in pruned] == [d for d, _ in exhaustive]
+                assert np.allclose([s for _, s in pruned], [s for _, s in exhaustive])
+        index.close()
+    print("✓ MaxScore top-k matches exhaustive top-k")
+
+
+def test_impact_ordered_top_k():
+    """Test the impact-ordered layout and its accuracy/latency knob."""
+    fake = FakeIndex(n_docs=20000, seed=3)
+    avg_len = sum(fake.doc_lengths.values()) / len(fake.doc_lengths)
+    with tempfile.TemporaryDirectory() as src_dir, tempfile.TemporaryDirectory() as dst_dir:
+        engine = BM25Engine(write_index(fake, src_dir), fake.doc_lengths, avg_len, 6348910, base_dir=src_dir)
+        engine.write_impact_ordered(dst_dir, 'index', k1=1.2, b=0.6)
+        index = InvertedIndex.read_index(dst_dir, 'index')
+        impact = BM25Engine(index, fake.doc_lengths, avg_len, 6348910, base_dir=dst_dir)
+
+        # Test 1: whole lists still read back in doc_id order, the prefix holds the best postings
+        assert index.read_a_posting_list(dst_dir, 'python') == fake.postings['python']
+        doc_ids, tfs = index.read_a_posting_prefix(dst_dir, 'python', int(index.tier_ends['python'][0]))
+        _, best = impact.term_scores('python', 1.2, 0.6, (doc_ids, tfs))
+        assert best.min() > 0.85 * index.max_impact[(1.2, 0.6)]['python']
+        print("✓ impact-ordered layout")
+
+        # Test 2: fraction=1 is exact, a small prefix keeps most of the top k
+        query = ['java', 'python', 'common']
+        exhaustive = engine.top_k(query, 50, k1=1.2, b=0.6)
+        assert impact.top_k_impact(query, 50, k1=1.2, b=0.6, fraction=1.0) == exhaustive
+        approximate = impact.top_k_impact(query, 50, k1=1.2, b=0.6, fraction=0.1)
+        overlap = len({d for d, _ in approximate} & {d for d, _ in exhaustive})
+        assert overlap >= 40
+        assert impact.top_k_impact(query, 50, k1=1.5, b=0.6) == impact.top_k(query, 50, k1=1.5, b=0.6)
+        index.close()
+    print(f"✓ impact top-k (overlap {overlap}/50 at fraction 0.1)")
+
+
+def test_cosine_top_k():
+    """Test the vectorized cosine against cosine computed from full tf-idf vectors."""
+    fake = FakeIndex(n_docs=3000, seed=9)
+    n = 6348910
+    with tempfile.TemporaryDirectory() as base_dir:
+        index = write_index(fake, base_dir)
+        doc_ids, norms = doc_tfidf_norms(index, n, base_dir=base_dir)
+        doc_norms = dict(zip(doc_ids.tolist(), norms.tolist()))
+
+        # reference: explicit document vectors
+        vectors = {}
+        for w, pl in fake.postings.items():
+            for doc_id, tf in pl:
+                vectors.setdefault(doc_id, {})[w] = tf * math.log10(n / fake.df[w])
+        assert set(doc_norms) == set(vectors)
+        for doc_id, vector in list(vectors.items())[:100]:
+            assert math.isclose(doc_norms[doc_id], math.sqrt(sum(v * v for v in vector.values())))
+        print("✓ document norms")
+
+        query = ['java', 'rare', 'java', 'missing']
+        q = {'java': 2 * math.log10(n / fake.df['java']), 'rare': math.log10(n / fake.df['rare'])}
+        q_norm = math.sqrt(sum(v * v for v in q.values()))
+        expected = {doc_id: sum(q[w] * vector.get(w, 0) for w in q) / (q_norm * doc_norms[doc_id])
+                    for doc_id, vector in vectors.items() if set(vector) & set(q)}
+        top = cosine_top_k(query, index, doc_norms, n, 20, base_dir=base_dir)
+        assert np.allclose([score for _, score in top], sorted(expected.values(), reverse=True)[:20])
+        assert all(math.isclose(score, expected[d]) for d, score in top)
+        assert cosine_top_k(['missing'], index, doc_norms, n, 20, base_dir=base_dir) == []
+        index.close()
+    print("✓ cosine top-k")
+
+
+def test_match_count_engine():
+    """Test that ALL matching documents are ranked by their number of distinct query words."""
+    fake = FakeIndex()
+    query = ['python', 'java', 'rare', 'java', 'missing']
+    counts = word_count_score(list(dict.fromkeys(query)), fake)
+    with tempfile.TemporaryDirectory() as base_dir:
+        engine = MatchCountEngine(write_index(fake, base_dir), base_dir)
+        ranked = engine.rank(query)
+        assert len(ranked) == len(counts) and dict(ranked) == dict(counts)
+        assert ranked == sorted(ranked, key=lambda pair: (-pair[1], pair[0]))
+        streamed = np.concatenate(list(engine.iter_doc_ids(query, chunk_size=100)))
+        assert streamed.tolist() == [doc_id for doc_id, _ in ranked]
+        assert engine.rank(['missing']) == []
+    print("✓ match count ranking")
+
+
+if __name__ == "__main__":
+    test_bm25_engine()
+    test_array_field_scorers()
+    test_bm25_pruned_top_k()
+    test_impact_ordered_top_k()
+    test_cosine_top_k()
+    test_match_count_engine()
+    print("✅ ALL RANKING TESTS PASSED!")
@@ -0,0 +1,71 @@
+"""
+Test the resident data layer: data is loaded once and shared.
+Run: python tests/test_resident_data.py
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+from Backend.posting_cache import PostingCache
+from Backend.resident_data import ResidentData
+
+
+class FakeIndex:
+    def __init__(self, terms=('python',), posting_cache=None):
+        self.df = {w: 2 for w in terms}
+        self.posting_locs = {w: [('0_000.bin', 0)] for w in terms}
+        self.posting_cache = posting_cache
+        self.reads = []
+
+    def read_a_posting_array(self, base_dir, w, bucket_name=None):
+        self.reads.append(w)
+        postings = (np.array([1, 2]), np.array([3, 1], dtype=np.int32))  # 24 bytes
+        if self.posting_cache is not None:
+            self.posting_cache.put(w, postings)
+        return postings
+
+
+def test_resident_data():
+    """Test that loading happens once and readiness follows warm-up."""
+    calls = {'index': 0, 'pagerank': 0}
+
+    def index_loader():
+        calls['index'] += 1
+        return FakeIndex()
+
+    def pagerank_loader():
+        calls['pagerank'] += 1
+        return {1: 0.5}
+
+    data = ResidentData(index_loader, pagerank_loader, postings_dir="unused",
+                        doc_store_loader=None)
+    assert not data.is_loaded() and not data.is_ready()
+
+    # Test 1: repeated loads hit the loaders once
+    data.load()
+    data.load()
+    assert calls == {'index': 1, 'pagerank': 1}
+    assert data.is_loaded() and not data.is_ready()
+    print("✓ loaded once")
+
+    # Test 2: warm-up reads only known terms and flips readiness
+    n_read = data.warm_up(['python', 'unknown'])
+    assert n_read == 1 and data.index.reads == ['python']
+    assert data.is_ready() and data.status()['ready']
+    print("✓ warm-up and readiness")
+
+    # Test 3: warm-up stops once the posting cache is full
+    terms = ['a', 'b', 'c', 'd', 'e']
+    data = ResidentData(lambda: FakeIndex(terms, PostingCache(max_bytes=60)), dict,
+                        postings_dir="unused", doc_store_loader=None)
+    assert data.warm_up(terms) == 3
+    assert data.index.reads == ['a', 'b', 'c'] and 'a' not in data.index.posting_cache
+    print("✓ warm-up stops at the first eviction")
+
+
+if __name__ == "__main__":
+    test_resident_data()
+    print("✅ ALL RESIDENT DATA TESTS PASSED!")
@@ -0,0 +1,68 @@
+"""
+Test the query-result cache.
+Run: python tests/test_result_cache.py
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from Backend.result_cache import ResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_result_cache():
+    """Test keys, TTL expiry, size bound and invalidation."""
+    clock = FakeClock()
+    cache = ResultCache(max_entries=2, ttl_seconds=10, clock=clock)
+    calls = []
+
+    def compute(result, seconds=0.5):
+        def run():
+            calls.append(result)
+            clock.now += seconds
+            return result
+        return run
+
+    # Test 1: token order does not matter, endpoint and parameters do
+    assert cache.get_or_compute('search', ['python', 'java'], {}, compute('a')) == 'a'
+    assert cache.get_or_compute('search', ['java', 'python'], {}, compute('x')) == 'a'
+    assert cache.get_or_compute('search_body', ['python', 'java'], {}, compute('b')) == 'b'
+    assert cache.get_or_compute('search', ['python', 'java'], {'k': 1.5}, compute('c')) == 'c'
+    assert calls == ['a', 'b', 'c']
+    assert cache.stats()['hits'] == 1 and cache.stats()['saved_seconds'] == 0.5
+    print("✓ keys and latency saved")
+
+    # Test 2: at most max_entries results are kept ('a' was the least recently used)
+    assert len(cache) == 2 and cache.stats()['evictions'] == 1
+    print("✓ size bound")
+
+    # Test 3: results expire after the TTL
+    clock.now += 11
+    assert cache.get_or_compute('search_body', ['python', 'java'], {}, compute('d')) == 'd'
+    assert cache.stats()['expirations'] == 1
+    print("✓ TTL")
+
+    # Test 4: reloading the index invalidates everything
+    cache.invalidate()
+    assert len(cache) == 0
+    assert cache.get_or_compute('search_body', ['python', 'java'], {}, compute('e')) == 'e'
+    print("✓ invalidation")
+
+    # Test 5: results computed against a spent deadline are not stored
+    assert cache.get_or_compute('search', ['snake'], {}, compute('f'), cacheable=lambda: False) == 'f'
+    assert cache.get_or_compute('search', ['snake'], {}, compute('g')) == 'g'
+    print("✓ partial results not cached")
+
+
+if __name__ == "__main__":
+    test_result_cache()
+    print("✅ ALL RESULT CACHE TESTS PASSED!")
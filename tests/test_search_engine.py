@@ -0,0 +1,189 @@
+"""
+Test SearchEngine end to end on small indexes built on the fly.
+Run: python tests/test_search_engine.py
+"""
+
+import sys
+import math
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import Backend.data_Loader as data_Loader
+from Backend.deadline import Deadline
+from Backend.doc_store import DocAttributeStore, PAGERANK, PAGEVIEW, TEXT_LEN, TITLE_LEN
+from Backend.index_builder import build_index
+from Backend.resident_data import ResidentData
+from Backend.result_cache import ResultCache
+from inverted_index_gcp import InvertedIndex
+from Backend.tokenizer import tokenize
+from search import SearchEngine, SEQUENTIAL, THREADS, PROCESSES
+
+TEXTS = {
+    1: 'python is a programming language with a large standard library',
+    2: 'the python is a large snake found in africa and asia',
+    3: 'java is a programming language that runs on the java virtual machine',
+    4: 'java is an island of indonesia known for its coffee',
+    5: 'coffee is a drink brewed from roasted coffee beans',
+    6: 'a snake is a legless reptile, some snakes are venomous',
+    7: 'programming a computer means writing code in a programming language',
+}
+TITLES = {1: 'Python (programming language)', 2: 'Python (snake)', 3: 'Java (programming language)',
+          4: 'Java', 5: 'Coffee', 6: 'Snake', 7: 'Computer programming'}
+ANCHORS = {1: 'python language', 2: 'python snake', 3: 'java language', 4: 'java island',
+           5: 'coffee', 6: 'snake', 7: 'programming'}
+
+
+def build_engine(base_dir, with_store=True):
+    """Builds the main, text, title and anchor indexes of the documents above in base_dir."""
+    base_dir = Path(base_dir)
+    dirs = {}
+    for field, texts in (('main', TEXTS), ('text', TEXTS), ('title', TITLES), ('anchor', ANCHORS)):
+        dirs[field] = str(base_dir / field)
+        build_index(texts.items(), dirs[field], 'index', workers=1)
+    doc_store_loader = None
+    if with_store:
+        columns = {PAGERANK: {doc_id: doc_id / 10 for doc_id in TEXTS},
+                   PAGEVIEW: {doc_id: 100 * doc_id for doc_id in TEXTS},
+                   TEXT_LEN: {doc_id: len(text.split()) for doc_id, text in TEXTS.items()},
+                   TITLE_LEN: {doc_id: len(title.split()) for doc_id, title in TITLES.items()}}
+        DocAttributeStore.build(base_dir / 'store', columns, TITLES)
+        doc_store_loader = lambda: DocAttributeStore(base_dir / 'store')
+    resident = ResidentData(lambda: InvertedIndex.read_index(dirs['main'], 'index'),
+                            lambda: {doc_id: doc_id / 10 for doc_id in TEXTS},
+                            postings_dir=dirs['main'], doc_store_loader=doc_store_loader,
+                            result_cache=ResultCache(100, 600))
+    engine = SearchEngine(resident)
+    for field in ('text', 'title', 'anchor'):
+        engine.indexes.register(field, dirs[field])
+    return engine, dirs
+
+
+def test_search_batch():
+    """Test that a batch answers like one search_basic call per query, in input order."""
+    with tempfile.TemporaryDirectory() as base_dir:
+        engine, _ = build_engine(base_dir)
+        try:
+            queries = ['python snake', 'java coffee', '', 'programming language', 'unknownword', 'the a']
+            results = engine.search_batch(queries)
+            assert len(results) == len(queries)
+            for query, res in zip(queries, results):
+                if query in ('', 'the a'):
+                    assert res == []  # no tokens left after stopword removal
+                else:
+                    assert res == engine.search_basic(query)
+            assert results[0] and results[4] == []
+            assert engine.search_batch([]) == []
+            print("✓ search_batch")
+
+            # a spent budget scores only the rarest term of every query
+            deadline = Deadline(0.0)
+            results = engine.search_batch(['java island', 'coffee'], deadline=deadline)
+            assert results == [engine.search_basic('island'), engine.search_basic('coffee')]
+            assert deadline.partial
+            print("✓ search_batch under a deadline")
+        finally:
+            engine.close()
+
+
+def test_cached_results():
+    """Test that engine methods serve repeated queries from the result cache."""
+    with tempfile.TemporaryDirectory() as base_dir:
+        engine, dirs = build_engine(base_dir)
+        result_cache = engine.resident.result_cache
+        try:
+            # Test 1: the same tokens hit the cache, whatever their order or case
+            first = engine.search('python language')
+            assert engine.search('Language python') == first
+            assert engine.search_basic('python snake') == engine.search_basic('snake python')
+            assert (result_cache.hits, result_cache.misses) == (2, 2)
+            print("✓ cached per endpoint and tokens")
+
+            # Test 2: other parameters are another entry
+            engine.search_prm('python language')
+            engine.search_prm('python language', in_pr_weight=0)
+            assert (result_cache.hits, result_cache.misses) == (2, 4)
+            print("✓ parameters in the key")
+
+            # Test 3: swapping an index drops the cached results
+            engine.swap_index('text', dirs['text'])
+            assert engine.search('python language') == first
+            assert (result_cache.hits, result_cache.misses) == (2, 5)
+            print("✓ invalidated by swap_index")
+        finally:
+            engine.close()
+
+
+def test_match_lists_not_cached():
+    """Test that the title matches are streamed and never stored in the result cache."""
+    with tempfile.TemporaryDirectory() as base_dir:
+        engine, dirs = build_engine(base_dir)
+        engine.indexes.register('og_title', dirs['title'])
+        try:
+            chunks = list(engine.stream_matches('python programming', 'og_title', chunk_size=2))
+            assert max(len(chunk) for chunk in chunks) <= 2
+            res = engine.search_title('python programming')
+            assert res == [pair for chunk in chunks for pair in chunk]
+            assert res[0] == ('1', 'Python (programming language)') and len(res) == 4
+            assert len(engine.resident.result_cache) == 0
+            print("✓ match lists streamed, not cached")
+        finally:
+            engine.close()
+
+
+def test_field_execution_modes():
+    """Test that SEQUENTIAL, THREADS and PROCESSES score the fields alike."""
+    with tempfile.TemporaryDirectory() as base_dir:
+        engine, _ = build_engine(base_dir)
+        try:
+            results = {}
+            for mode in (SEQUENTIAL, THREADS, PROCESSES):
+                engine.field_execution = mode
+                results[mode] = engine._score_fields(tokenize('python programming language'), 1.2, 0.5)
+            for mode in (THREADS, PROCESSES):
+                for expected, field in zip(results[SEQUENTIAL], results[mode]):
+                    assert [doc_id for doc_id, _ in field] == [doc_id for doc_id, _ in expected]
+                    assert all(math.isclose(score, expected_score)
+                               for (_, score), (_, expected_score) in zip(field, expected))
+            assert all(results[SEQUENTIAL])
+            print("✓ same top 500 in every mode")
+        finally:
+            engine.close()
+
+
+def test_search_without_doc_store():
+    """Test that the rankers fall back to the doc length pickles and PageRank CSVs."""
+    original_paths = data_Loader.DOC_LENGTH_PATHS
+    with tempfile.TemporaryDirectory() as base_dir:
+        engine, dirs = build_engine(base_dir, with_store=False)
+        try:
+            # Test 1: no doc lengths at all is reported clearly
+            data_Loader.DOC_LENGTH_PATHS = {'text': str(Path(base_dir) / 'missing.pickle'),
+                                            'title': str(Path(base_dir) / 'missing.pickle')}
+            try:
+                engine.search('python language')
+                assert False, "expected a RuntimeError"
+            except RuntimeError as e:
+                assert 'doc-attribute store' in str(e)
+            print("✓ missing doc lengths")
+
+            # Test 2: lengths from build_index's pickles, PageRank from the loader
+            data_Loader.DOC_LENGTH_PATHS = {field: str(Path(dirs[field]) / 'doc_lengths.pickle')
+                                            for field in ('text', 'title')}
+            res = engine.search('python language')
+            assert res and {doc_id for doc_id, _ in res} <= {str(doc_id) for doc_id in TEXTS}
+            assert engine.search_prm('python snake')
+            print("✓ search without a doc-attribute store")
+        finally:
+            data_Loader.DOC_LENGTH_PATHS = original_paths
+            engine.close()
+
+
+if __name__ == "__main__":
+    test_search_batch()
+    test_cached_results()
+    test_match_lists_not_cached()
+    test_field_execution_modes()
+    test_search_without_doc_store()
+    print("✅ ALL SEARCH ENGINE TESTS PASSED!")
@@ -0,0 +1,73 @@
+"""
+Test segment-based incremental indexing against a full rebuild.
+Run: python tests/test_segments.py
+"""
+
+import sys
+import random
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from Backend.segments import SegmentedIndex
+from Backend.tokenizer import tokenize
+from inverted_index_gcp import InvertedIndex
+
+WORDS = ['python', 'java', 'language', 'programming', 'snake', 'coffee', 'island', 'war']
+
+
+def random_doc(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 15)))
+
+
+def assert_same(segmented, live_docs):
+    """Compares the segmented index with an in-memory index of the live documents."""
+    expected = InvertedIndex({doc_id: tokenize(text) for doc_id, text in live_docs.items()})
+    assert segmented.n_docs == len(live_docs)
+    for w in WORDS:
+        assert segmented.df[w] == expected.df.get(w, 0)
+        assert segmented.read_a_posting_list('.', w) == sorted(expected._posting_list.get(w, []))
+
+
+def test_segmented_index():
+    """Test adds, updates, deletes and merges keep the global df and postings exact."""
+    rng = random.Random(11)
+    live_docs = {}
+    with tempfile.TemporaryDirectory() as base_dir:
+        index = SegmentedIndex(base_dir, max_segments=3, merge_factor=2)
+
+        # Test 1: every batch becomes a segment, queries fan out over all of them
+        for batch in range(3):
+            docs = {doc_id: random_doc(rng) for doc_id in range(batch * 20, batch * 20 + 25)}
+            index.add_documents(docs.items())
+            live_docs.update(docs)  # ids 20-24 and 40-44 are edited articles
+        assert len(index.segments) == 3
+        assert_same(index, live_docs)
+        print("✓ add and update")
+
+        # Test 2: tombstones hide deleted documents and fix df
+        index.delete_documents([0, 21, 44])
+        for doc_id in [0, 21, 44]:
+            del live_docs[doc_id]
+        assert_same(index, live_docs)
+        print("✓ delete")
+
+        # Test 3: the merge policy bounds the segment count and drops dead postings
+        docs = {doc_id: random_doc(rng) for doc_id in range(60, 70)}
+        index.add_documents(docs.items())
+        live_docs.update(docs)
+        index.wait_for_merges()
+        assert len(index.segments) <= 3
+        assert_same(index, live_docs)
+        print("✓ merge")
+
+        # Test 4: the manifest is persisted
+        index.close()
+        assert_same(SegmentedIndex(base_dir), live_docs)
+        print("✓ reopen")
+
+
+if __name__ == "__main__":
+    test_segmented_index()
+    print("✅ ALL SEGMENT TESTS PASSED!")
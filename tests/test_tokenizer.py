@@ -9,7 +9,8 @@ import os
 # Add Backend directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Backend'))
 
-from Backend.tokenizer import tokenize
+from nltk import PorterStemmer
+from Backend.tokenizer import tokenize, tokenize_stemmed, all_stopwords, TokenizerEngine
 
 def test_tokenize():
     """Test tokenization with various inputs."""
@@ -107,9 +108,29 @@ def test_tokenize():
     print("✅ ALL TOKENIZER TESTS PASSED!")
     print("=" * 60)
 
+def test_tokenizer_engine():
+    """Test the cached stemming and batch API against the plain per-call stemmer."""
+    texts = ["Running runners ran to the running track", "Python's snakes are running", ""] * 50
+    stemmer = PorterStemmer()
+    expected = [[stemmer.stem(t) for t in tokenize(text)] for text in texts]
+
+    # Test 1: the cached stemmer gives the same stems
+    assert [tokenize_stemmed(text) for text in texts] == expected
+    engine = TokenizerEngine(stem=True, stem_cache_size=4)
+    assert [engine.tokenize(text) for text in texts] == expected
+    assert engine.cache_info().currsize <= 4
+    print("✓ stem cache")
+
+    # Test 2: batch tokenization keeps the input order, also in a process pool
+    assert list(engine.tokenize_many(iter(texts), chunk_size=7)) == expected
+    assert list(engine.tokenize_many(texts, workers=2, chunk_size=7)) == expected
+    assert list(TokenizerEngine(stop_words=all_stopwords).tokenize_many(texts)) == [tokenize(t) for t in texts]
+    print("✓ tokenize_many")
+
 if __name__ == "__main__":
     try:
         test_tokenize()
+        test_tokenizer_engine()
     except AssertionError as e:
         print(f"\n❌ TEST FAILED: {e}")
         sys.exit(1)